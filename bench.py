@@ -0,0 +1,346 @@
+"""
+Deterministic benchmark suite: procedural scenes, fixed cameras and seeds, rendered headless.
+
+    python bench.py run -o benchmarks/main.json
+    python bench.py run --spheres 64 4096 --bounces 8 --rays-per-pixel 4 -o benchmarks/branch.json
+    python bench.py compare benchmarks/main.json benchmarks/branch.json --tolerance 0.1
+    python bench.py run --samplers random sobol bluenoise -o benchmarks/samplers.json
+    python bench.py samplers
+    python bench.py run --path-stats --no-roulette -o benchmarks/no_roulette.json
+
+Every case reports ms/frame, Msamples/s, Mrays/s and the relative RMSE of its accumulation
+against a long accumulation of the same case, cached in benchmarks/references so the error
+stays comparable across commits. The convergence rate is the slope of log RMSE over log frames,
+-0.5 for plain Monte Carlo and steeper for samplers that stratify better. The samplers command times
+drawing bounce directions alone, against the Box-Muller directions the samplers replaced.
+With --path-stats the shader also counts the rays it actually traces, giving the mean path length and
+the traced Mrays/s of every case, Mrays/s otherwise assumes every path runs to the bounce limit.
+"""
+import argparse
+import itertools
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+
+from datetime import datetime
+from pathlib import Path
+
+from spheres import SPHERE_DTYPE
+from render import create_context, create_camera, HeadlessTracer
+from sampling import SAMPLERS, SAMPLER_RANDOM, sampler_index
+from variants import specialize
+from frame_state import FrameState
+
+
+BENCHMARKS_DIR = Path(__file__).parent / "benchmarks"
+# Bump when generate_scene changes, so cached references of the old scenes aren't reused
+SCENE_VERSION = 1
+
+
+def generate_scene(count: int, seed: int = 0, emissive: float = 0.05, smooth: float = 0.3) -> np.ndarray:
+    """
+    Ground sphere plus count spheres scattered on it, area growing with count so density stays constant.
+    emissive and smooth are the fractions of lights and mirror-like spheres.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.zeros(count + 1, dtype=SPHERE_DTYPE)
+    rows[0] = ((0, -1000, 0), 1000, (0.6, 0.6, 0.6), 0, (0, 0, 0), 0)
+
+    extent = scene_extent(count)
+    spheres = rows[1:]
+    spheres["radius"] = rng.uniform(0.2, 1.0, count)
+    spheres["center"][:, 0] = rng.uniform(-extent, extent, count)
+    spheres["center"][:, 1] = spheres["radius"]
+    spheres["center"][:, 2] = rng.uniform(-extent, extent, count)
+    spheres["color"] = rng.uniform(0.1, 1.0, (count, 3))
+
+    kind = rng.random(count)
+    lights = kind < emissive
+    spheres["emissionColor"][lights] = rng.uniform(0.5, 1.0, (int(lights.sum()), 3))
+    spheres["emissionStrength"][lights] = rng.uniform(2.0, 8.0, int(lights.sum()))
+    mirrors = (kind >= emissive) & (kind < emissive + smooth)
+    spheres["smoothness"][mirrors] = rng.uniform(0.7, 1.0, int(mirrors.sum()))
+    return rows
+
+
+def scene_extent(count: int) -> float:
+    return max(4.0, np.sqrt(count) * 1.5)
+
+
+def scene_camera(count: int) -> dict:
+    """Fixed camera looking at the center of the scene from above one corner."""
+    extent = scene_extent(count)
+    return {"position": (extent, extent * 0.6, extent), "fov": 60, "yaw": 225, "pitch": -30}
+
+
+def reference_name(case: dict) -> str:
+    return f"s{case['spheres']}-b{case['bounces']}-r{case['rays_per_pixel']}-d{case['density']:g}"
+
+
+def case_name(case: dict) -> str:
+    return f"{reference_name(case)}-{case['sampler']}"
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup_case(tracer: HeadlessTracer, case: dict, seed: int):
+    tracer.load_scene(generate_scene(case["spheres"], seed), 1.0)
+    tracer.camera = create_camera(tracer, scene_camera(case["spheres"]))
+    tracer.max_bounce_limit = case["bounces"]
+    tracer.rays_per_pixel = case["rays_per_pixel"]
+    tracer.density = case["density"]
+    tracer.sampler = sampler_index(case["sampler"])
+
+
+def reference_image(tracer: HeadlessTracer, case: dict, args) -> np.ndarray:
+    """
+    Long accumulation of the case, rendered once and cached on disk.
+    Always with the random sampler and without the biased throughput cutoff, so every sampler and cutoff is
+    compared against the same image.
+    """
+    width, height = args.size
+    path = BENCHMARKS_DIR / "references" / (
+        f"{reference_name(case)}-{width}x{height}-f{args.reference_frames}-seed{args.seed}-v{SCENE_VERSION}.npy"
+    )
+    if path.exists():
+        return np.load(path)
+
+    sampler, tracer.sampler = tracer.sampler, SAMPLER_RANDOM
+    threshold, tracer.throughput_threshold = tracer.throughput_threshold, 0.0
+    tracer.render(args.reference_frames)
+    tracer.sampler = sampler
+    tracer.throughput_threshold = threshold
+    image = tracer.read_image()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, image)
+    return image
+
+
+def relative_rmse(image: np.ndarray, reference: np.ndarray) -> float:
+    return float(np.sqrt(np.mean((image - reference) ** 2)) / max(float(reference.mean()), 1e-12))
+
+
+def run_case(tracer: HeadlessTracer, case: dict, args) -> dict:
+    setup_case(tracer, case, args.seed)
+    reference = reference_image(tracer, case, args)
+
+    # Warm up so the BVH build and shader state changes aren't measured
+    tracer.render(1)
+    records = len(tracer.telemetry.records)
+    start = time.perf_counter()
+    frames = tracer.render(args.frames)
+    elapsed = time.perf_counter() - start
+    measured = tracer.telemetry.records[records:]
+    path_stats = tracer.path_stats
+    path_stats.flush()
+    traced = {}
+    if tracer.path_statistics:
+        traced = {
+            "mean_path_length": path_stats.mean_path_length,
+            "traced_mrays_per_second": path_stats.rays / elapsed / 1e6,
+            "path_ends": path_stats.reason_fractions(),
+        }
+
+    error = relative_rmse(tracer.read_image(), reference)
+
+    # Error after every power of 4 frames up to the timed run, untimed
+    curve = []
+    for checkpoint in itertools.takewhile(lambda n: n < frames, (4 ** i for i in itertools.count())):
+        tracer.render(checkpoint)
+        curve.append((checkpoint, relative_rmse(tracer.read_image(), reference)))
+    curve.append((frames, error))
+    rate = float(np.polyfit(*np.log(np.array(curve)).T, 1)[0]) if len(curve) > 1 else None
+
+    samples = sum(record["samples"] for record in measured)
+    rays = sum(record["rays"] for record in measured)
+    return {
+        **case,
+        "name": case_name(case),
+        "frames": frames,
+        "ms_per_frame": elapsed / frames * 1000,
+        "msamples_per_second": samples / elapsed / 1e6,
+        "mrays_per_second": rays / elapsed / 1e6,
+        "relative_rmse": error,
+        "rmse_curve": curve,
+        "convergence_rate": rate,
+        **traced,
+    }
+
+
+def run(args):
+    ctx = create_context(args.backend)
+    tracer = HeadlessTracer(ctx, tuple(args.size), "Default World", scene_camera(0))
+    tracer.use_bvh = not args.no_bvh
+    tracer.use_wavefront = args.wavefront
+    tracer.next_event_estimation = not args.no_nee
+    tracer.specialize_shaders = not args.generic_shaders
+    tracer.russian_roulette = not args.no_roulette
+    tracer.roulette_min_depth = args.roulette_depth
+    tracer.throughput_threshold = args.throughput_threshold
+    tracer.path_statistics = args.path_stats
+
+    cases = [
+        {"spheres": spheres, "bounces": bounces, "rays_per_pixel": rays, "density": density, "sampler": sampler}
+        for spheres, bounces, rays, density, sampler in itertools.product(
+            args.spheres, args.bounces, args.rays_per_pixel, args.density, args.samplers
+        )
+    ]
+    results = []
+    for case in cases:
+        result = run_case(tracer, case, args)
+        results.append(result)
+        rate = result["convergence_rate"]
+        print(
+            f"{result['name']:<32} {result['ms_per_frame']:9.2f} ms/frame "
+            f"{result['msamples_per_second']:9.2f} Msamples/s {result['mrays_per_second']:9.2f} Mrays/s "
+            f"{result['relative_rmse']:8.4f} rel. RMSE" + ("" if rate is None else f" {rate:6.3f} rate")
+            + ("" if not args.path_stats else
+               f" {result['mean_path_length']:5.2f} rays/path {result['traced_mrays_per_second']:9.2f} traced Mrays/s")
+        )
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "renderer": ctx.info["GL_RENDERER"],
+        "settings": {
+            "size": list(args.size), "frames": args.frames, "reference_frames": args.reference_frames,
+            "seed": args.seed, "bvh": not args.no_bvh, "wavefront": args.wavefront, "nee": not args.no_nee,
+            "specialized": not args.generic_shaders, "roulette": not args.no_roulette,
+            "roulette_depth": args.roulette_depth, "throughput_threshold": args.throughput_threshold,
+            "scene_version": SCENE_VERSION,
+        },
+        "results": results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results saved to {output}")
+
+
+def sampler_cost(args):
+    """Prints the nanoseconds per bounce direction of every sampler, timed in a compute shader doing nothing else."""
+    ctx = create_context(args.backend)
+    tracer = HeadlessTracer(ctx, (64, 64), "Default World", scene_camera(0))
+    source = tracer.load_shader_source("shaders/sampler_cost.glsl")
+    results = ctx.buffer(reserve=args.threads * 16)
+    results.bind_to_storage_buffer(0)
+    tracer.blue_noise_texture().use(location=4)
+    # SampleSeed reads the resolution and sample counts from the FrameState block
+    frame_state = FrameState()
+    frame_state.update(resolution=(1024, args.threads // 1024), accumulationFrame=1, raysPerPixel=args.draws)
+    frame_state.upload(ctx, binding=0)
+
+    modes = [("Box-Muller (legacy)", SAMPLER_RANDOM, True)] + [(name, i, False) for i, name in enumerate(SAMPLERS)]
+    baseline = None
+    for name, sampler, legacy in modes:
+        # The sampler fixed at compile time, a runtime branch on it would be timed too
+        program = ctx.compute_shader(specialize(source, {"SAMPLER_TYPE": sampler}))
+        tracer.write_uniforms(program, {"draws": args.draws, "blueNoise": 4, "legacy": legacy})
+        best = float("inf")
+        for _ in range(args.repeat):
+            ctx.finish()
+            start = time.perf_counter()
+            program.run(args.threads // 256)
+            ctx.finish()
+            best = min(best, time.perf_counter() - start)
+        ns = best / (args.threads * args.draws) * 1e9
+        baseline = baseline or ns
+        print(f"{name:<20} {ns:8.3f} ns/direction ({ns / baseline:5.2f}x)")
+        program.release()
+    results.release()
+
+
+def compare(args) -> int:
+    """Prints the change of every case in both reports, returns 1 if any case regressed beyond the tolerance."""
+    old, new = (json.loads(Path(path).read_text()) for path in (args.old, args.new))
+    if old["settings"] != new["settings"]:
+        print(f"Warning: settings differ, {old['settings']} vs {new['settings']}")
+    old_results = {result["name"]: result for result in old["results"]}
+
+    print(f"{old['commit']} -> {new['commit']}")
+    regressions = 0
+    for result in new["results"]:
+        base = old_results.get(result["name"])
+        if base is None:
+            continue
+        time_change = result["ms_per_frame"] / base["ms_per_frame"] - 1
+        error_change = result["relative_rmse"] / max(base["relative_rmse"], 1e-12) - 1
+        flags = []
+        if time_change > args.tolerance:
+            flags.append("SLOWER")
+        if error_change > args.tolerance:
+            flags.append("NOISIER")
+        regressions += bool(flags)
+        print(
+            f"{result['name']:<32} {base['ms_per_frame']:9.2f} -> {result['ms_per_frame']:9.2f} ms "
+            f"({time_change:+7.1%})  rmse {base['relative_rmse']:.4f} -> {result['relative_rmse']:.4f} "
+            f"({error_change:+7.1%})  {' '.join(flags)}"
+        )
+    print(f"{regressions} regression(s) beyond {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the tracer on procedural scenes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Render every case and write a JSON report")
+    run_parser.add_argument("-o", "--output", default=str(BENCHMARKS_DIR / "results.json"))
+    run_parser.add_argument("--spheres", type=int, nargs="+", default=[16, 256, 4096])
+    run_parser.add_argument("--bounces", type=int, nargs="+", default=[4, 8])
+    run_parser.add_argument("--rays-per-pixel", type=int, nargs="+", default=[1, 4])
+    run_parser.add_argument("--density", type=float, nargs="+", default=[0.0, 0.05])
+    run_parser.add_argument("--size", type=int, nargs=2, default=(320, 180), metavar=("WIDTH", "HEIGHT"))
+    run_parser.add_argument("--frames", type=int, default=16, help="Frames timed and compared per case")
+    run_parser.add_argument("--reference-frames", type=int, default=256, help="Frames of the cached reference")
+    run_parser.add_argument("--seed", type=int, default=0, help="Scene generator seed")
+    run_parser.add_argument("--no-bvh", action="store_true", help="Use the linear sphere loop")
+    run_parser.add_argument("--no-nee", action="store_true", help="Only find lights by bouncing into them")
+    run_parser.add_argument("--wavefront", action="store_true", help="Trace with the compute shader wavefront passes")
+    run_parser.add_argument("--no-roulette", action="store_true", help="Trace every path up to the bounce limit")
+    run_parser.add_argument("--roulette-depth", type=int, default=3, help="Bounces before Russian roulette starts")
+    run_parser.add_argument("--throughput-threshold", type=float, default=0.0,
+                            help="End paths whose throughput drops to this, biased above 0")
+    run_parser.add_argument("--path-stats", action="store_true",
+                            help="Count the traced rays, reports the mean path length and traced Mrays/s")
+    run_parser.add_argument(
+        "--generic-shaders", action="store_true", help="Read every setting from uniforms instead of shader variants"
+    )
+    run_parser.add_argument("--samplers", nargs="+", default=["sobol"], choices=("random", "sobol", "bluenoise"))
+    run_parser.add_argument("--backend", default=None, help="moderngl standalone backend, e.g. egl")
+
+    samplers_parser = commands.add_parser("samplers", help="Time drawing bounce directions with every sampler")
+    samplers_parser.add_argument("--threads", type=int, default=1 << 18, help="Multiple of 1024")
+    samplers_parser.add_argument("--draws", type=int, default=64, help="Directions per thread")
+    samplers_parser.add_argument("--repeat", type=int, default=5, help="Runs per sampler, the fastest counts")
+    samplers_parser.add_argument("--backend", default=None, help="moderngl standalone backend, e.g. egl")
+
+    compare_parser = commands.add_parser("compare", help="Flag regressions between two reports")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative slowdown or error increase")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.command == "run":
+        run(args)
+    elif args.command == "samplers":
+        sampler_cost(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
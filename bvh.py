@@ -0,0 +1,343 @@
+import numpy as np
+
+
+# Mirrors the std430 layout of the BVHNode struct in raytrace.glsl.
+# Interior nodes have count == 0 and store the index of their left child in leftFirst,
+# the right child always follows it. Leaves store the first entry of the index buffer.
+NODE_DTYPE = np.dtype([
+    ("boundsMin", np.float32, 3),
+    ("leftFirst", np.int32),
+    ("boundsMax", np.float32, 3),
+    ("count", np.int32),
+])
+assert NODE_DTYPE.itemsize == 32
+
+MAX_LEAF_SIZE = 4
+SAH_BINS = 16
+# Keeps the traversal stack in the shader (BVH_STACK_SIZE) from overflowing
+MAX_DEPTH = 48
+TRAVERSAL_COST = 1.0
+
+
+def surface_area(bounds_min: np.ndarray, bounds_max: np.ndarray) -> np.ndarray:
+    """Surface area of (arrays of) axis aligned boxes."""
+    extent = np.maximum(bounds_max - bounds_min, 0.0)
+    return 2.0 * (extent[..., 0] * extent[..., 1] + extent[..., 1] * extent[..., 2] + extent[..., 2] * extent[..., 0])
+
+
+class BVH:
+    """
+    Bounding volume hierarchy over the spheres, built with the surface area heuristic.
+    Flattened into a node buffer and a sphere index buffer for traversal in the shader.
+    """
+    def __init__(self):
+        self.nodes = np.zeros(1, dtype=NODE_DTYPE)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.parents = np.full(1, -1, dtype=np.int32)
+        self.depths = np.zeros(1, dtype=np.int32)
+        self.sphere_leaf = np.zeros(0, dtype=np.int32)
+
+        self.node_buffer = None
+        self.index_buffer = None
+        self.needs_upload = True
+
+        # SphereTable.structure_version this hierarchy was built for, -1 when stale
+        self.structure_version = -1
+        # SphereTable.version the bounds were last fitted to
+        self.sphere_version = -1
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @staticmethod
+    def sphere_bounds(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        centers = rows["center"].astype(np.float64)
+        radii = np.abs(rows["radius"]).astype(np.float64)[:, None]
+        return centers - radii, centers + radii
+
+    # --- Building ---
+    def build(self, rows: np.ndarray):
+        """
+        Builds the hierarchy from scratch for the given SPHERE_DTYPE rows.
+        Every node of a tree level is split at once, so the Python overhead is per level, not per node.
+        """
+        sphere_count = len(rows)
+        bounds_min, bounds_max = self.sphere_bounds(rows)
+        centroids = (bounds_min + bounds_max) * 0.5
+
+        # Worst case node count of a binary tree with one sphere per leaf
+        nodes = np.zeros(max(2 * sphere_count - 1, 1), dtype=NODE_DTYPE)
+        parents = np.full(len(nodes), -1, dtype=np.int32)
+        depths = np.zeros(len(nodes), dtype=np.int32)
+        node_count = 1
+
+        if sphere_count == 0:
+            # Empty scene, an inverted box that no ray can hit
+            nodes["boundsMin"] = np.inf
+            nodes["boundsMax"] = -np.inf
+
+        # Every node owns a contiguous range of the index buffer, splits reorder spheres within it
+        indices = np.arange(sphere_count, dtype=np.int32)
+        sphere_node = np.zeros(sphere_count, dtype=np.int32)
+        # Index buffer positions that belong to nodes of the current level
+        active = np.arange(sphere_count)
+        depth = 0
+
+        while len(active):
+            spheres = indices[active]
+            level_nodes = sphere_node[spheres]
+            starts = np.flatnonzero(np.diff(level_nodes, prepend=-1))
+            counts = np.diff(np.append(starts, len(active)))
+            level_nodes = level_nodes[starts]
+            local = np.repeat(np.arange(len(starts)), counts)
+
+            node_min = np.minimum.reduceat(bounds_min[spheres], starts, axis=0)
+            node_max = np.maximum.reduceat(bounds_max[spheres], starts, axis=0)
+            nodes["boundsMin"][level_nodes] = node_min
+            nodes["boundsMax"][level_nodes] = node_max
+
+            side, split = self._split_level(
+                spheres, local, starts, counts, node_min, node_max,
+                bounds_min, bounds_max, centroids, allow_split=depth < MAX_DEPTH,
+            )
+
+            # Leaves point at their range of the index buffer
+            leaves = ~split
+            nodes["leftFirst"][level_nodes[leaves]] = active[starts[leaves]]
+            nodes["count"][level_nodes[leaves]] = counts[leaves]
+
+            # Interior nodes get two adjacent children
+            split_nodes = level_nodes[split]
+            left_children = node_count + 2 * np.arange(len(split_nodes), dtype=np.int32)
+            node_count += 2 * len(split_nodes)
+            nodes["leftFirst"][split_nodes] = left_children
+            nodes["count"][split_nodes] = 0
+            parents[left_children] = parents[left_children + 1] = split_nodes
+            depths[left_children] = depths[left_children + 1] = depth + 1
+
+            # Partition each split range into left and right, keeping ranges in place
+            in_split = split[local]
+            positions = active[in_split]
+            spheres = spheres[in_split]
+            order = np.lexsort((side[in_split], local[in_split]))
+            indices[positions] = spheres[order]
+
+            child_of_local = np.full(len(starts), -1, dtype=np.int32)
+            child_of_local[split] = left_children
+            sphere_node[spheres] = child_of_local[local[in_split]] + side[in_split]
+
+            active = positions
+            depth += 1
+
+        self.nodes = nodes[:node_count].copy()
+        self.parents = parents[:node_count].copy()
+        self.depths = depths[:node_count].copy()
+        self.indices = indices
+        self._index_leaves()
+        self.needs_upload = True
+
+    def load(self, nodes: np.ndarray, indices: np.ndarray, sphere_count: int) -> bool:
+        """
+        Adopts a hierarchy stored alongside sphere_count spheres, e.g. in a world file, instead of building one.
+        The arrays are checked so a corrupt file can't send the shader out of bounds.
+        Returns False and keeps the current hierarchy if they don't form a valid tree over exactly those spheres.
+        """
+        nodes = np.asarray(nodes, dtype=NODE_DTYPE)
+        indices = np.asarray(indices, dtype=np.int32)
+        node_count = len(nodes)
+        # Every sphere is in exactly one leaf, so a hierarchy over another sphere count indexes the wrong rows
+        if node_count == 0 or len(indices) != sphere_count:
+            return False
+
+        interior = nodes["count"] == 0
+        left = nodes["leftFirst"]
+        leaves = ~interior
+        # Children come after their parent, so following them always terminates
+        if np.any(interior & ((left <= np.arange(node_count)) | (left + 1 >= node_count))):
+            return False
+        if np.any(leaves & ((nodes["count"] < 0) | (left < 0) | (left + nodes["count"] > sphere_count))):
+            return False
+        if sphere_count and (indices.min() < 0 or indices.max() >= sphere_count):
+            return False
+        if sphere_count and not np.array_equal(np.bincount(indices, minlength=sphere_count), np.ones(sphere_count)):
+            return False
+
+        parents = np.full(node_count, -1, dtype=np.int32)
+        children = left[interior]
+        if len(children) and np.bincount(children, minlength=node_count).max() > 1:
+            return False
+        parents[children] = parents[children + 1] = np.flatnonzero(interior)
+
+        # Depths level by level from the root, a node reached twice or never isn't a tree
+        depths = np.full(node_count, -1, dtype=np.int32)
+        frontier = np.zeros(1, dtype=np.int64)
+        depth = 0
+        while len(frontier):
+            if depth > MAX_DEPTH or np.any(depths[frontier] >= 0):
+                return False
+            depths[frontier] = depth
+            split = frontier[interior[frontier]]
+            frontier = np.concatenate((left[split], left[split] + 1))
+            depth += 1
+        if np.any(depths < 0):
+            return False
+
+        self.nodes = nodes.copy()
+        self.indices = indices.copy()
+        self.parents = parents
+        self.depths = depths
+        self._index_leaves()
+        self.needs_upload = True
+        return True
+
+    def _index_leaves(self):
+        """Records the leaf holding every sphere, for refits."""
+        self.sphere_leaf = np.zeros(len(self.indices), dtype=np.int32)
+        leaves = np.flatnonzero(self.nodes["count"] > 0)
+        counts = self.nodes["count"][leaves]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        entries = np.repeat(self.nodes["leftFirst"][leaves] - starts, counts) + np.arange(counts.sum())
+        self.sphere_leaf[self.indices[entries]] = np.repeat(leaves, counts)
+
+    @staticmethod
+    def _split_level(spheres, local, starts, counts, node_min, node_max,
+                     bounds_min, bounds_max, centroids, allow_split: bool):
+        """
+        Finds the cheapest binned SAH split for every node of a level.
+        Returns the side (0 left, 1 right) of every sphere and which nodes should be split.
+        """
+        node_total = len(starts)
+        side = np.zeros(len(spheres), dtype=np.int32)
+        if not allow_split or counts.max() <= 1:
+            return side, np.zeros(node_total, dtype=bool)
+
+        sphere_min = bounds_min[spheres]
+        sphere_max = bounds_max[spheres]
+        sphere_centroids = centroids[spheres]
+        centroid_min = np.minimum.reduceat(sphere_centroids, starts, axis=0)
+        centroid_extent = np.maximum.reduceat(sphere_centroids, starts, axis=0) - centroid_min
+        node_area = np.maximum(surface_area(node_min, node_max), 1e-12)
+        # Deep levels only hold small nodes, more bins than spheres can't find better splits
+        bin_total = int(min(SAH_BINS, counts.max()))
+
+        best_cost = np.full(node_total, np.inf)
+        best_axis = np.zeros(node_total, dtype=np.int64)
+        best_bin = np.zeros(node_total, dtype=np.int64)
+        sphere_bins = np.zeros((3, len(spheres)), dtype=np.int64)
+        for axis in range(3):
+            extent = centroid_extent[:, axis]
+            scale = np.divide(bin_total, extent, out=np.zeros_like(extent), where=extent > 0)
+            bins = ((sphere_centroids[:, axis] - centroid_min[local, axis]) * scale[local]).astype(np.int64)
+            bins = np.clip(bins, 0, bin_total - 1)
+            sphere_bins[axis] = bins
+
+            keys = local * bin_total + bins
+            bin_counts = np.bincount(keys, minlength=node_total * bin_total).reshape(node_total, bin_total)
+            # Per-bin bounds, reduced over the spheres sorted by bin
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            bin_starts = np.flatnonzero(np.diff(sorted_keys, prepend=-1))
+            bin_min = np.full((node_total * bin_total, 3), np.inf)
+            bin_max = np.full((node_total * bin_total, 3), -np.inf)
+            bin_min[sorted_keys[bin_starts]] = np.minimum.reduceat(sphere_min[order], bin_starts, axis=0)
+            bin_max[sorted_keys[bin_starts]] = np.maximum.reduceat(sphere_max[order], bin_starts, axis=0)
+            bin_min = bin_min.reshape(node_total, bin_total, 3)
+            bin_max = bin_max.reshape(node_total, bin_total, 3)
+
+            # Splitting after bin k puts bins [0, k] left and (k, bin_total) right
+            left_count = np.cumsum(bin_counts, axis=1)[:, :-1]
+            right_count = counts[:, None] - left_count
+            left_area = surface_area(
+                np.minimum.accumulate(bin_min, axis=1)[:, :-1],
+                np.maximum.accumulate(bin_max, axis=1)[:, :-1],
+            )
+            right_area = surface_area(
+                np.minimum.accumulate(bin_min[:, ::-1], axis=1)[:, ::-1][:, 1:],
+                np.maximum.accumulate(bin_max[:, ::-1], axis=1)[:, ::-1][:, 1:],
+            )
+            costs = TRAVERSAL_COST + (left_area * left_count + right_area * right_count) / node_area[:, None]
+            costs[(left_count == 0) | (right_count == 0)] = np.inf
+
+            axis_bin = np.argmin(costs, axis=1)
+            axis_cost = costs[np.arange(node_total), axis_bin]
+            better = axis_cost < best_cost
+            best_cost[better] = axis_cost[better]
+            best_axis[better] = axis
+            best_bin[better] = axis_bin[better]
+
+        # Split when it beats a leaf (cost of intersecting every sphere) or when the leaf would be too big
+        split = (counts > 1) & ((best_cost < counts) | (counts > MAX_LEAF_SIZE))
+        side[:] = sphere_bins[best_axis[local], np.arange(len(spheres))] > best_bin[local]
+
+        # All centroids in one bin, there is no SAH split, halve the range instead
+        median = split & np.isinf(best_cost)
+        rank = np.arange(len(spheres)) - starts[local]
+        side = np.where(median[local], rank >= counts[local] // 2, side).astype(np.int32)
+        return side, split
+
+    # --- Refitting ---
+    def refit(self, rows: np.ndarray, sphere_indices: np.ndarray):
+        """
+        Updates the bounds of the leaves holding the given spheres and of all their ancestors.
+        The topology is kept, so quality degrades if spheres move far, rebuild in that case.
+        """
+        sphere_indices = np.asarray(sphere_indices, dtype=np.int64)
+        if len(sphere_indices) == 0 or len(self.sphere_leaf) == 0:
+            return
+        bounds_min, bounds_max = self.sphere_bounds(rows)
+
+        # Leaves, recomputed from all their spheres
+        leaves = np.unique(self.sphere_leaf[sphere_indices])
+        firsts = self.nodes["leftFirst"][leaves]
+        counts = self.nodes["count"][leaves]
+        # Every leaf range is contiguous in the index buffer, reduce all ranges in one call
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        entries = self.indices[np.repeat(firsts - starts, counts) + np.arange(counts.sum())]
+        self.nodes["boundsMin"][leaves] = np.minimum.reduceat(bounds_min[entries], starts, axis=0)
+        self.nodes["boundsMax"][leaves] = np.maximum.reduceat(bounds_max[entries], starts, axis=0)
+
+        # Ancestors, deepest first so children are final before their parents
+        ancestors = []
+        frontier = np.unique(self.parents[leaves])
+        frontier = frontier[frontier >= 0]
+        while len(frontier):
+            ancestors.append(frontier)
+            frontier = np.unique(self.parents[frontier])
+            frontier = frontier[frontier >= 0]
+        if not ancestors:
+            self.needs_upload = True
+            return
+
+        ancestors = np.unique(np.concatenate(ancestors))
+        ancestors = ancestors[np.argsort(-self.depths[ancestors], kind="stable")]
+        depths = self.depths[ancestors]
+        level_starts = np.flatnonzero(np.diff(depths, prepend=depths[0] + 1))
+        for level in np.split(ancestors, level_starts[1:]):
+            left = self.nodes["leftFirst"][level]
+            self.nodes["boundsMin"][level] = np.minimum(self.nodes["boundsMin"][left], self.nodes["boundsMin"][left + 1])
+            self.nodes["boundsMax"][level] = np.maximum(self.nodes["boundsMax"][left], self.nodes["boundsMax"][left + 1])
+
+        self.needs_upload = True
+
+    # --- GPU ---
+    def upload(self, ctx, node_binding: int = 1, index_binding: int = 2):
+        """Writes the node and index buffers if they changed and binds them."""
+        if self.needs_upload:
+            self.node_buffer = self._write(ctx, self.node_buffer, self.nodes)
+            self.index_buffer = self._write(ctx, self.index_buffer, self.indices)
+            self.needs_upload = False
+
+        self.node_buffer.bind_to_storage_buffer(node_binding)
+        self.index_buffer.bind_to_storage_buffer(index_binding)
+
+    @staticmethod
+    def _write(ctx, buffer, data: np.ndarray):
+        # Buffers can't be empty, keep at least one element around
+        size = max(data.nbytes, 32)
+        if buffer is None or buffer.size != size:
+            if buffer is not None:
+                buffer.release()
+            buffer = ctx.buffer(reserve=size)
+        if data.nbytes:
+            buffer.write(data)
+        return buffer
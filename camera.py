@@ -25,6 +25,8 @@ class Camera:
         self.sprint_speed_multiplier = 5
 
         self.moved = False
+        # Bumped whenever the position or orientation changes
+        self.version = 0
 
         self.update()
 
@@ -42,9 +44,12 @@ class Camera:
         self.m_rotation = mat3(self.right, self.up, self.forward)
 
     def rotate(self, yaw: float, pitch: float):
+        if yaw or pitch:
+            self.version += 1
         self.yaw += radians(yaw)
         self.pitch += radians(pitch)
 
     def move_forward(self, direction: vec3 = vec3(0)):
         d_pos = self.m_rotation * direction
-        self.position += d_pos * self.movement_speed * self.app.delta_time
\ No newline at end of file
+        self.position += d_pos * self.movement_speed * self.app.delta_time
+        self.version += 1
\ No newline at end of file
@@ -0,0 +1,84 @@
+class Denoiser:
+    """
+    Edge-avoiding a-trous wavelet filter over the latest accumulation, guided by the first hit normal,
+    depth and color the trace pass writes to the G-buffer attachments of the accumulation framebuffers.
+    Each pass widens the spacing of its 5x5 taps, so a few passes cover a large footprint.
+    Strength starts at 1 after a reset and falls off as frames accumulate, until the filter is skipped.
+    The shader derives it per pixel from the sample count, reprojected history keeps its strength lower.
+    """
+    def __init__(self, tracer, iterations: int = 4):
+        self.tracer = tracer
+        self.ctx = tracer.ctx
+        self.program = tracer.load_shader_program(
+            vertex_shader="shaders/quad.glsl",
+            fragment_shader="shaders/denoise.glsl"
+        )
+        self.vao = self.ctx.vertex_array(self.program, [])
+
+        self.enabled = True
+        self.iterations = iterations
+        # Accumulated frames after which the filtered image only counts half
+        self.falloff = 8.0
+        self.color_sigma = 4.0
+        self.normal_sigma = 64.0
+        self.depth_sigma = 0.05
+
+        # Ping-pong targets of the passes, half floats are plenty for a displayed image
+        self.framebuffers = []
+
+    def create_framebuffers(self, size: tuple[int, int]):
+        for framebuffer in self.framebuffers:
+            framebuffer.color_attachments[0].release()
+            framebuffer.release()
+        self.framebuffers = [
+            self.ctx.framebuffer(color_attachments=self.ctx.texture(size, 4, dtype="f2"))
+            for _ in range(2)
+        ]
+
+    def strength(self, accumulation_frame: int) -> float:
+        """Blend factor of the filtered image, 1 for the first frame after a reset."""
+        return self.falloff / (self.falloff + max(accumulation_frame - 1, 0))
+
+    @property
+    def active(self) -> bool:
+        """Whether display() shows the filtered image, skipped once the filter would barely change it."""
+        return self.enabled and self.iterations > 0 and self.strength(self.tracer.fresh_frames) > 0.02
+
+    def apply(self, source_size: tuple[int, int]):
+        """
+        Filters the accumulation in the tracer's fbo_prev, whose traced part is source_size.
+        Returns the texture holding the result, radiance in rgb and a sample count of 1 in alpha.
+        """
+        tracer = self.tracer
+        accumulation, _, normal_depth, albedo = tracer.fbo_prev.color_attachments
+        accumulation.use(location=0)
+        normal_depth.use(location=2)
+        albedo.use(location=3)
+
+        program = self.program
+        tracer.write_uniforms(program, {
+            "accumulation": 0,
+            "normalDepth": 2,
+            "albedo": 3,
+            "sourceSize": source_size,
+            "falloff": self.falloff,
+            "raysPerPixel": tracer.rays_per_pixel,
+            "colorSigma": self.color_sigma,
+            "normalSigma": self.normal_sigma,
+            "depthSigma": self.depth_sigma,
+        })
+
+        source = accumulation
+        for iteration in range(self.iterations):
+            target = self.framebuffers[iteration % 2]
+            source.use(location=1)
+            tracer.write_uniforms(program, {
+                "source": 1,
+                "stepSize": 1 << iteration,
+                "firstPass": iteration == 0,
+                "lastPass": iteration == self.iterations - 1,
+            })
+            target.use()
+            self.vao.render(vertices=6)
+            source = target.color_attachments[0]
+        return source
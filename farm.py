@@ -0,0 +1,158 @@
+"""
+Render farm on one machine: the frames of one render are split into work units of consecutive frames and
+traced by worker processes, each with its own headless OpenGL context (or the CPU reference tracer).
+
+A unit of frames [first, first + count) draws the same samples as those frames of a single long render, and
+comes back as an unnormalized radiance sum with the sample count in alpha. Units therefore merge by adding
+them up, in any order, into the accumulation a single process would have produced.
+"""
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+import numpy as np
+
+import reference
+from render import RenderJob, create_camera, create_context
+from world import world_path, read_world
+
+
+def render_farm(job: RenderJob, cpu: bool = False, processes: int | None = None, frames: int | None = None,
+                time_budget: float | None = None, unit_frames: int = 4,
+                straggler_grace: float = 10.0) -> tuple[np.ndarray, int]:
+    """
+    Renders job with processes workers, handing out units of unit_frames frames to whichever is idle.
+    Stops after frames frames or at the time_budget deadline, units in progress then stop after their current
+    frame. Workers that haven't reported straggler_grace seconds past the deadline are terminated and their
+    units dropped. Without a deadline, idle workers instead duplicate the units still in progress and the
+    first copy to finish counts, so one slow process doesn't hold up the end of the render.
+    Returns the merged float32 (height, width, 4) accumulation and the number of frames in it.
+    """
+    if frames is None and time_budget is None:
+        raise ValueError("render_farm needs a frame count or a time budget")
+    processes = processes or os.cpu_count() or 1
+    spawn = multiprocessing.get_context("spawn")
+    results = spawn.Queue()
+    tasks = [spawn.Queue() for _ in range(processes)]
+    workers = [
+        spawn.Process(target=worker_main, args=(job, cpu, processes, tasks[worker], results, worker), daemon=True)
+        for worker in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # Wall clock, the workers check it in their own processes
+    deadline = None if time_budget is None else time.time() + time_budget
+    next_frame = 1
+    # Units by first frame, the frame count and the workers tracing them
+    pending = {}
+    assigned = {}
+    merged = set()
+    accumulation = None
+    merged_frames = 0
+
+    def assign(worker: int) -> bool:
+        nonlocal next_frame
+        if deadline is not None and time.time() >= deadline:
+            return False
+        if frames is None or next_frame <= frames:
+            count = unit_frames if frames is None else min(unit_frames, frames - next_frame + 1)
+            unit = next_frame
+            pending[unit] = (count, set())
+            next_frame += count
+        else:
+            # Nothing left to hand out, back up the unit with the fewest workers on it
+            candidates = [unit for unit in pending if worker not in pending[unit][1]]
+            if deadline is not None or not candidates:
+                return False
+            unit = min(candidates, key=lambda unit: len(pending[unit][1]))
+        pending[unit][1].add(worker)
+        assigned[worker] = unit
+        tasks[worker].put((unit, pending[unit][0], deadline))
+        return True
+
+    try:
+        for worker in range(processes):
+            assign(worker)
+        while pending:
+            try:
+                # Wakes up regularly to notice crashed workers
+                kind, worker, *payload = results.get(timeout=1.0)
+            except queue.Empty:
+                crashed = [worker for worker in assigned if not workers[worker].is_alive()]
+                if crashed:
+                    raise RuntimeError(f"Render farm workers {crashed} exited without finishing their units")
+                if deadline is not None and time.time() >= deadline + straggler_grace:
+                    print(f"Dropping {len(pending)} unfinished work units of workers {sorted(assigned)}")
+                    break
+                continue
+            if kind == "error":
+                raise RuntimeError(f"Render farm worker {worker} failed:\n{payload[0]}")
+
+            unit, count, partial = payload
+            del assigned[worker]
+            if unit not in merged:
+                merged.add(unit)
+                del pending[unit]
+                merged_frames += count
+                # float64 so adding many units doesn't lose the precision of the last ones
+                accumulation = partial.astype(np.float64) if accumulation is None else accumulation + partial
+            assign(worker)
+    finally:
+        for worker, process in enumerate(workers):
+            # Busy workers are only duplicates or stragglers by now
+            if worker in assigned:
+                process.terminate()
+            else:
+                tasks[worker].put(None)
+        for process in workers:
+            process.join()
+
+    if accumulation is None:
+        raise RuntimeError("No work unit finished before the deadline")
+    return accumulation.astype(np.float32), merged_frames
+
+
+def worker_main(job: RenderJob, cpu: bool, processes: int, tasks, results, worker: int):
+    """Worker process, traces (first_frame, frames, deadline) units from tasks until it gets None."""
+    try:
+        # llvmpipe spreads every draw across all cores already, share them instead of oversubscribing
+        os.environ.setdefault("LP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // processes)))
+        render_unit = create_cpu_renderer(job) if cpu else create_gl_renderer(job)
+        while (task := tasks.get()) is not None:
+            first_frame, frames, deadline = task
+            time_budget = None if deadline is None else deadline - time.time()
+            accumulation, rendered = render_unit(first_frame, frames, time_budget)
+            results.put(("unit", worker, first_frame, rendered, accumulation))
+    except Exception:
+        results.put(("error", worker, traceback.format_exc()))
+
+
+def create_gl_renderer(job: RenderJob):
+    """Returns render_unit(first_frame, frames, time_budget) -> (accumulation, frames rendered) on OpenGL."""
+    tracer = job.create_tracer(create_context(job.backend))
+
+    def render_unit(first_frame: int, frames: int, time_budget: float | None):
+        rendered = tracer.render(frames, time_budget, first_frame)
+        return tracer.read_accumulation(), rendered
+    return render_unit
+
+
+def create_cpu_renderer(job: RenderJob):
+    """render_unit of create_gl_renderer with the NumPy reference tracer, in the worker process only."""
+    spheres, skybox_light_strength, _ = read_world(world_path(job.world))
+    params = reference.TraceParams.from_camera(
+        create_camera(None, job.camera), job.size, spheres,
+        skyboxLightStrength=skybox_light_strength, **job.uniforms()
+    )
+
+    def render_unit(first_frame: int, frames: int, time_budget: float | None):
+        start = time.perf_counter()
+        accumulation = None
+        for frame in range(first_frame, first_frame + frames):
+            accumulation = reference.render(params, first_frame=frame, prev=accumulation, workers=1)
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+        return accumulation, frame - first_frame + 1
+    return render_unit
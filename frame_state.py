@@ -0,0 +1,103 @@
+import struct
+import numpy as np
+
+
+# Mirrors the std140 layout of the FrameState uniform block in common.glsl.
+# vec3 members are 16-byte aligned, so each vec3 is followed by the scalar that fills its padding. bools are 4 bytes.
+FRAME_STATE_DTYPE = np.dtype([
+    ("position", np.float32, 3),
+    ("fov", np.float32),
+    ("forward", np.float32, 3),
+    ("density", np.float32),
+    ("right", np.float32, 3),
+    ("skyboxLightStrength", np.float32),
+    ("up", np.float32, 3),
+    ("sphereAmount", np.int32),
+    ("previousPosition", np.float32, 3),
+    ("previousFov", np.float32),
+    ("previousForward", np.float32, 3),
+    ("historyLimit", np.float32),
+    ("previousRight", np.float32, 3),
+    ("lightPower", np.float32),
+    ("previousUp", np.float32, 3),
+    ("lightAmount", np.int32),
+    ("resolution", np.float32, 2),
+    ("previousResolution", np.float32, 2),
+    ("accumulationFrame", np.int32),
+    ("raysPerPixel", np.int32),
+    ("sampleBase", np.int32),
+    ("nextEventEstimation", np.int32),
+    ("reproject", np.int32),
+    ("adaptiveSampling", np.int32),
+    ("adaptiveThreshold", np.float32),
+    ("adaptiveMinSamples", np.int32),
+    ("russianRoulette", np.int32),
+    ("rouletteMinDepth", np.int32),
+    ("throughputThreshold", np.float32),
+    ("pathStatistics", np.int32),
+])
+assert FRAME_STATE_DTYPE.itemsize == 192
+
+# Fields whose change makes the accumulated samples wrong, the Tracer then discards the history.
+# maxBounceLimit and sphereVersion (SphereTable.version) are tracked without being part of the block
+IMAGE_FIELDS = frozenset({
+    "density", "skyboxLightStrength", "sphereAmount", "maxBounceLimit", "sphereVersion", "throughputThreshold"
+})
+# Fields that change which point a pixel sees, the Tracer then reprojects the history instead
+VIEW_FIELDS = frozenset({"position", "forward", "right", "up", "fov", "resolution"})
+
+# (packer, byte offset) of every block field
+FIELD_LAYOUTS = {
+    name: (struct.Struct(f"<{field.shape[0] if field.shape else 1}{field.base.char}"), offset)
+    for name, (field, offset) in FRAME_STATE_DTYPE.fields.items()
+}
+
+
+class FrameState:
+    """
+    CPU-side copy of the FrameState uniform block, the per frame camera and scene settings of the trace passes.
+    update() only writes fields whose value changed and counts the changes, so the block is uploaded when
+    something differs and the Tracer can tell from image_version and view_version what needs invalidating.
+    Fields outside the block are tracked the same way, they just aren't uploaded.
+    """
+    def __init__(self):
+        self.data = bytearray(FRAME_STATE_DTYPE.itemsize)
+        # Latest value of every field, packed for block fields. Comparing the packed bytes ignores differences
+        # lost in the float32 conversion, e.g. a slider handing back the value rounded
+        self.values = {}
+        self.buffer = None
+
+        # Bumped on every change of a block field, of an IMAGE_FIELDS field and of a VIEW_FIELDS field
+        self.version = 0
+        self.image_version = 0
+        self.view_version = 0
+        self.uploaded_version = -1
+
+    def update(self, **fields):
+        """Sets fields by name, vectors as any sequence (vec3, tuple) of their components."""
+        values = self.values
+        for name, value in fields.items():
+            layout = FIELD_LAYOUTS.get(name)
+            if layout is not None:
+                packer, offset = layout
+                value = packer.pack(*value) if packer.size > 4 else packer.pack(value)
+            if name in values and values[name] == value:
+                continue
+            values[name] = value
+            if layout is not None:
+                self.data[offset:offset + packer.size] = value
+                self.version += 1
+            if name in IMAGE_FIELDS:
+                self.image_version += 1
+            elif name in VIEW_FIELDS:
+                self.view_version += 1
+
+    # --- GPU ---
+    def upload(self, ctx, binding: int = 0):
+        """Writes the block to its uniform buffer if it changed since the last upload, and binds it."""
+        if self.buffer is None:
+            self.buffer = ctx.buffer(reserve=FRAME_STATE_DTYPE.itemsize)
+        if self.uploaded_version != self.version:
+            self.buffer.write(self.data)
+            self.uploaded_version = self.version
+        self.buffer.bind_to_uniform_block(binding)
@@ -0,0 +1,77 @@
+import struct
+import numpy as np
+
+from pathlib import Path
+
+
+def resolve_accumulation(accumulation: np.ndarray) -> np.ndarray:
+    """Divides an accumulation buffer (radiance sum in rgb, sample count in alpha) into mean radiance."""
+    return accumulation[..., :3] / np.maximum(accumulation[..., 3:4], 1.0)
+
+
+def tonemap(radiance: np.ndarray) -> np.ndarray:
+    """ACES filmic curve, the same one shaders/tonemap.glsl applies for display."""
+    a, b, c, d, e = 2.51, 0.03, 2.43, 0.59, 0.14
+    x = radiance.astype(np.float32)
+    return np.clip((x * (a * x + b)) / (x * (c * x + d) + e), 0.0, 1.0)
+
+
+def save_image(path: Path, image: np.ndarray):
+    """
+    Writes a linear radiance (height, width, 3) image, top row first.
+    The format is picked from the suffix: .png (tonemapped, 8 bit), .exr (32 bit float) or .npy.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    suffix = path.suffix.lower()
+
+    if suffix == ".npy":
+        np.save(path, image.astype(np.float32))
+    elif suffix == ".exr":
+        write_exr(path, image)
+    elif suffix == ".png":
+        from PIL import Image
+        pixels = (tonemap(image) * 255.0 + 0.5).astype(np.uint8)
+        Image.fromarray(pixels, "RGB").save(path)
+    else:
+        raise ValueError(f"Unsupported image format {suffix!r}, use .png, .exr or .npy")
+
+
+def write_exr(path: Path, image: np.ndarray):
+    """Writes an uncompressed, single part, scanline OpenEXR file with float R, G and B channels."""
+    height, width = image.shape[:2]
+    # Channels are stored in alphabetical order
+    channels = (b"B", b"G", b"R")
+    planes = np.ascontiguousarray(image[..., ::-1].astype("<f4").transpose(0, 2, 1))
+
+    def attribute(name: bytes, kind: bytes, value: bytes) -> bytes:
+        return name + b"\0" + kind + b"\0" + struct.pack("<i", len(value)) + value
+
+    # name, pixel type 2 (FLOAT), pLinear + 3 reserved bytes, x and y sampling
+    channel_list = b"".join(name + b"\0" + struct.pack("<iB3xii", 2, 0, 1, 1) for name in channels) + b"\0"
+    window = struct.pack("<iiii", 0, 0, width - 1, height - 1)
+    header = b"".join((
+        struct.pack("<ii", 20000630, 2),
+        attribute(b"channels", b"chlist", channel_list),
+        attribute(b"compression", b"compression", b"\0"),
+        attribute(b"dataWindow", b"box2i", window),
+        attribute(b"displayWindow", b"box2i", window),
+        attribute(b"lineOrder", b"lineOrder", b"\0"),
+        attribute(b"pixelAspectRatio", b"float", struct.pack("<f", 1.0)),
+        attribute(b"screenWindowCenter", b"v2f", struct.pack("<ff", 0.0, 0.0)),
+        attribute(b"screenWindowWidth", b"float", struct.pack("<f", 1.0)),
+        b"\0",
+    ))
+
+    # One chunk per scanline: y, byte count, then each channel's row
+    line_size = planes[0].nbytes
+    chunk_size = 8 + line_size
+    table_size = 8 * height
+    offsets = len(header) + table_size + chunk_size * np.arange(height, dtype="<u8")
+
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(offsets.astype("<u8").tobytes())
+        for y in range(height):
+            f.write(struct.pack("<ii", y, line_size))
+            f.write(planes[y].tobytes())
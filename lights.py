@@ -0,0 +1,74 @@
+import numpy as np
+
+
+# Mirrors the std430 layout of the Light struct in common.glsl
+LIGHT_DTYPE = np.dtype([
+    ("sphere", np.int32),
+    ("cdf", np.float32),
+])
+LUMINANCE = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def light_power(spheres: np.ndarray) -> np.ndarray:
+    """Relative power of SPHERE_DTYPE rows, the LightPower function of common.glsl. 0 for spheres that don't emit."""
+    color = spheres["emissionColor"].astype(np.float32)
+    # Same operation order as the shader's dot()
+    luminance = color[:, 0] * LUMINANCE[0] + color[:, 1] * LUMINANCE[1] + color[:, 2] * LUMINANCE[2]
+    radius = spheres["radius"].astype(np.float32)
+    return spheres["emissionStrength"].astype(np.float32) * luminance * radius * radius
+
+
+class LightList:
+    """
+    The emissive spheres, sampled by next event estimation proportionally to their power.
+    Stores the sphere index and the normalized running power sum of every light, the shader
+    picks one by searching the first cdf above a random number.
+    """
+    def __init__(self):
+        self.lights = np.zeros(0, dtype=LIGHT_DTYPE)
+        self.total_power = 0.0
+        # Power of every sphere at the last build, lets edits that don't change any power skip the rebuild
+        self.power = np.zeros(0, dtype=np.float32)
+        self.sphere_version = -1
+
+        self.buffer = None
+        self.needs_upload = True
+
+    def __len__(self) -> int:
+        return len(self.lights)
+
+    def build(self, spheres: np.ndarray):
+        self.power = light_power(spheres)
+        indices = np.flatnonzero(self.power > 0)
+        cdf = np.cumsum(self.power[indices], dtype=np.float64)
+
+        self.lights = np.zeros(len(indices), dtype=LIGHT_DTYPE)
+        self.lights["sphere"] = indices
+        self.total_power = float(cdf[-1]) if len(cdf) else 0.0
+        if len(cdf):
+            self.lights["cdf"] = cdf / cdf[-1]
+            # Rounding must not leave random numbers just below 1 without a light
+            self.lights["cdf"][-1] = 1.0
+        self.needs_upload = True
+
+    def update(self, spheres: np.ndarray, changed: range | None = None):
+        """Rebuilds after the rows in changed (all if None) were edited, unless no sphere's power changed."""
+        if changed is not None and len(self.power) == len(spheres):
+            rows = slice(changed.start, changed.stop)
+            if np.array_equal(light_power(spheres[rows]), self.power[rows]):
+                return
+        self.build(spheres)
+
+    def upload(self, ctx, binding: int = 9):
+        """Writes the light buffer if it changed and binds it."""
+        if self.needs_upload:
+            # Buffers can't be empty, keep at least one element around
+            size = max(self.lights.nbytes, LIGHT_DTYPE.itemsize)
+            if self.buffer is None or self.buffer.size != size:
+                if self.buffer is not None:
+                    self.buffer.release()
+                self.buffer = ctx.buffer(reserve=size)
+            if len(self.lights):
+                self.buffer.write(self.lights)
+            self.needs_upload = False
+        self.buffer.bind_to_storage_buffer(binding)
@@ -2,21 +2,19 @@ import moderngl_window as mglw
 from moderngl_window.integrations.imgui import ModernglWindowRenderer
 import imgui
 
-from glm import sqrt
-from glm import normalize, length, dot
-from glm import vec2, vec3
+from glm import normalize, length
+from glm import vec3
 
 from pathlib import Path
-from pickle import load, dump  
-from dataclasses import is_dataclass
 
 from camera import Camera
 from ui import UI
-from dclasses import Sphere
+from tracer import Tracer
+from scheduler import TileScheduler, ResolutionScaler
 
 
-class App(mglw.WindowConfig):
-    gl_version = (4, 6)
+class App(Tracer, mglw.WindowConfig):
+    gl_version = (4, 5)
     window_size = (1600, 900)
     title = "Raytracer"
     aspect_ratio = None
@@ -25,18 +23,12 @@ class App(mglw.WindowConfig):
 
     def __init__(self, **kwargs):
         # Initialize ModernGL Window and ImGui
-        super().__init__(**kwargs)
+        mglw.WindowConfig.__init__(self, **kwargs)
         imgui.create_context()
         self.wnd.ctx.error 
 
-        # Compile shaders
-        self.program =  self.load_program(
-            vertex_shader="shaders/quad.glsl", 
-            fragment_shader="shaders/raytrace.glsl"
-        )
-        # Vertex Array Object for the fullscreen quad displaying the raytraced render
-        self.vao = self.ctx.vertex_array(self.program, [])
-
+        # Shaders, world and accumulation framebuffers
+        Tracer.__init__(self, self.ctx, self.window_size)
 
         # Constants
         self.SIDEBAR_WIDTH = 270
@@ -46,119 +38,48 @@ class App(mglw.WindowConfig):
         self.ui_renderer = ModernglWindowRenderer(self.wnd)
         self.camera = Camera(self, vec3(7, 7, 7), 60, 225, -40)
 
-        # CPU-side variables
-        self.render_resolution = vec2(self.window_size)
-        self.rays_per_pixel = 4
-        self.max_bounce_limit = 8
-
-        self.allow_accumulation = True
-        self.accumulation_frame = 1
-        self.accumulation_time = 0.0
+        # Picking result, valid while the camera and sphere versions match the key
+        self.target_key = None
+        self.target_index = -1
 
-        # Load default world
-        self.density = 0.0
-        self.load_world("Default World")
+        # Spreads slow trace passes over several frames so the UI stays responsive
+        self.scheduler = TileScheduler(self)
+        # Lowers the resolution while navigating, full resolution accumulation resumes once input stops
+        self.resolution_scaler = ResolutionScaler(self)
 
-        # Framebuffers for temporal accumulation
-        self.fbo = self.ctx.framebuffer(
-            color_attachments=self.ctx.texture(self.window_size, 4)
-        )
-        self.fbo_prev = self.ctx.framebuffer(    
-            color_attachments=self.ctx.texture(self.window_size, 4)
-        )
-
-        self.ui_renderer.register_texture(self.fbo.color_attachments[0])
-        self.ui_renderer.register_texture(self.fbo_prev.color_attachments[0])
+        self.ui_renderer.register_texture(self.display_texture)
 
         # Initialize uniforms
         self.update_uniforms()
 
-
-    def update_uniforms(self):
-        """Updates all uniforms except for spheres."""
-
-        # World
-        self.program["density"].value = self.density
-        self.program["skyboxLightStrength"].value = self.skyBoxLightStrength
-        self.program["sphereAmount"].value = len(self.spheres)
-
-        # Simulation
-        self.program["resolution"].write(self.render_resolution)
-        self.program["fov"] = self.camera.fov
-
-        self.program["forward"].write(self.camera.forward)
-        self.program["right"].write(self.camera.right)
-        self.program["up"].write(self.camera.up)
-        self.program["position"].write(self.camera.position)
-
-        self.program["raysPerPixel"].value = self.rays_per_pixel
-        self.program["maxBounceLimit"].value = self.max_bounce_limit
-
-        self.fbo_prev.color_attachments[0].use(location=0)
-        self.program["prev"].value = 0
-        self.program["accumulationFrame"].value = self.accumulation_frame
-
-    def load_world(self, filename: str):
-        """Loads a world from a file."""
-        path = self.resource_dir / "worlds" / f"{filename}.world"   
-        if not path.exists():
-            print(f"World file {path} does not exist.")
-            return
-        with open(path, "rb") as f:
-            self.spheres, self.skyBoxLightStrength = load(f)
-
-        self.reset_accumulation()
-        
-        self.program["sphereAmount"].value = len(self.spheres)
-        for i, sphere in enumerate(self.spheres):
-            self.load_dataclass_to_uniform(sphere, f"spheres[{i}]")
-
-    def save_world(self, filename: str):
-        """Saves the current world to a file."""
-        path = self.resource_dir / "worlds" / f"{filename}.world"
-        if not path.exists():
-            path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, "wb") as f:
-            dump((self.spheres, self.skyBoxLightStrength), f)
-        print(f"World saved to {path}")
-
     def on_render(self, time: float, frametime: float):
         self.delta_time = frametime
 
-        # Prepare the framebuffer for rendering
-        self.fbo.use()
-        self.fbo.clear()
-
         # Update the CPU side
         self.update_camera_movement()
         self.camera.update()
-        self.update_accumulation()
-
-        # Update the GPU side
-        self.update_uniforms()
-
-        # Render the scene
-        # 6 vertices for a fullscreen quad
-        self.vao.render(vertices=6)
-
-        # Swap FBOs for next frame
-        self.fbo, self.fbo_prev = self.fbo_prev, self.fbo
+        # Resets or reprojects the accumulation if the camera or scene changed, before the scaler looks at it
+        self.sync_frame_state()
+
+        # Trace into the accumulation framebuffers and tonemap for display
+        self.update_trace_cost()
+        self.resolution_scaler.update()
+        with self.telemetry.gpu("trace"):
+            if self.scheduler.enabled and not self.resolution_scaler.active:
+                self.scheduler.step()
+            else:
+                self.update_accumulation()
+                self.render_frame()
+        with self.telemetry.gpu("display"):
+            self.display()
 
         # Render the UI to the default framebuffer
         self.wnd.use()
-        self.ui.generate_frame()
-        self.ui_renderer.render(imgui.get_draw_data())
-
-    def update_accumulation(self):
-        if not self.allow_accumulation:
-            self.reset_accumulation()
-            return
-        self.accumulation_frame += 1
-        self.accumulation_time += self.delta_time
-        
-    def reset_accumulation(self):
-        self.accumulation_frame = 0
-        self.accumulation_time = 0.0
+        with self.telemetry.cpu("ui"):
+            self.ui.generate_frame()
+        with self.telemetry.gpu("ui"):
+            self.ui_renderer.render(imgui.get_draw_data())
+        self.telemetry.end_frame(frametime * 1000)
 
     def update_camera_movement(self):
         move = vec3(0)
@@ -172,71 +93,27 @@ class App(mglw.WindowConfig):
             move += vec3(1, 0, 0)
         if length(move) < 1e-6:
             return 
-        self.reset_accumulation()
         move = normalize(move)
         if self.wnd.is_key_pressed(self.wnd.keys.LEFT_SHIFT):
             move *= self.camera.sprint_speed_multiplier if self.camera.allow_sprint else 1
         self.camera.move_forward(move)
 
-    def ray_sphere_intersection(self, ray_origin: vec3, ray_direction: vec3, sphere: Sphere) -> float:
-        """Returns the distance to the intersection point if the ray intersects the sphere, otherwise -1."""
-
-        offset_ray_origin = ray_origin - sphere.center
-
-        a = dot(ray_direction, ray_direction)
-        b = 2.0 * dot(offset_ray_origin, ray_direction)
-        c = dot(offset_ray_origin, offset_ray_origin) - sphere.radius * sphere.radius
-
-        discriminant = b * b - 4.0 * a * c
-
-        if discriminant >= 0.0:
-            dst = (-b - sqrt(discriminant)) / (2.0 * a)
-            if dst >= 0.0:
-                return dst
-        return -1.0
-
     def target_sphere_index(self) -> int:
-        """Returns the index of the closest sphere to the camera ray."""
-        ray_origin = self.camera.position
-        ray_direction = self.camera.forward
-
-        closest_distance = float('inf')
-        closest_index = -1
-        for i, sphere in enumerate(self.spheres):
-            distance = self.ray_sphere_intersection(ray_origin, ray_direction, sphere)
-            if distance < 0:
-                continue
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_index = i
-
-        return closest_index
-
-    def load_dataclass_to_uniform(self, dclass, uniform_name: str):
-        for key, value in dclass.__dict__.items():
-            addr = ".".join((uniform_name, key))
-            if is_dataclass(value):
-                self.load_dataclass_to_uniform(value, addr) 
-            else:
-                # print(f"Setting uniform {addr} to {value}")
-                self.program[addr].value = value
+        """Returns the index of the closest sphere to the camera ray, recomputed only when something moved."""
+        key = (self.camera.version, self.spheres.version)
+        if key != self.target_key:
+            self.target_key = key
+            with self.telemetry.cpu("picking"):
+                self.target_index, _ = self.spheres.closest_hit(self.camera.position, self.camera.forward)
+        return self.target_index
 
     def on_resize(self, width: int, height: int):
         self.window_size = width, height
-        self.render_resolution = vec2(self.window_size)
 
-        self.fbo = self.ctx.framebuffer(
-            color_attachments=self.ctx.texture(self.window_size, 4)
-        )
-        self.fbo_prev = self.ctx.framebuffer(
-            color_attachments=self.ctx.texture(self.window_size, 4)
-        )
-        self.ui_renderer.register_texture(self.fbo.color_attachments[0])
-        self.ui_renderer.register_texture(self.fbo_prev.color_attachments[0])
+        self.create_framebuffers(self.window_size)
+        self.ui_renderer.register_texture(self.display_texture)
         self.ui_renderer.resize(width, height)
 
-        self.reset_accumulation()
-
     def on_key_event(self, key, action, modifiers):
         self.ui_renderer.key_event(key, action, modifiers)
 
@@ -245,7 +122,6 @@ class App(mglw.WindowConfig):
 
     def on_mouse_drag_event(self, x, y, dx, dy):
         if not imgui.get_io().want_capture_mouse:
-            if dx or dy: self.reset_accumulation()
             self.camera.rotate(dx * self.camera.sensitivity, -dy * self.camera.sensitivity)
         self.ui_renderer.mouse_drag_event(x, y, dx, dy)
 
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+# Why a path ended, indexed by the PATH_END_* constants of common.glsl
+PATH_END_REASONS = ("escaped", "roulette", "throughput", "bounce limit")
+# Bounces the shader counters tell apart, paths ending later are counted at the last one
+PATH_STATISTICS_DEPTHS = 64
+
+
+class PathStatistics:
+    """
+    Counts of the paths the trace passes finished, by the bounce they ended at and why, summed since the last reset.
+    The shader adds to the PathStatistics buffer with atomics when the pathStatistics field of the FrameState block
+    is set. Double buffered like the convergence counters, end_frame reads the previous frame's counts so reading
+    never waits on the frame in flight, flush() then collects the last frame.
+    """
+    def __init__(self, ctx):
+        self.ctx = ctx
+        size = PATH_STATISTICS_DEPTHS * len(PATH_END_REASONS) * 4
+        self.buffers = [ctx.buffer(reserve=size) for _ in range(2)]
+        # Whether buffers[1] holds counts end_frame hasn't read yet
+        self.pending = False
+        # Paths by (bounce, reason)
+        self.counts = np.zeros((PATH_STATISTICS_DEPTHS, len(PATH_END_REASONS)), dtype=np.int64)
+
+    def begin_frame(self):
+        self.buffers[0].clear()
+
+    def bind(self, binding: int = 10):
+        self.buffers[0].bind_to_storage_buffer(binding)
+
+    def end_frame(self):
+        """Reads the counts of the frame before the one just traced."""
+        if self.pending:
+            self.read(self.buffers[1])
+        self.buffers.reverse()
+        self.pending = True
+
+    def flush(self):
+        """Reads the counts of the frame just traced, waiting for it to finish."""
+        if self.pending:
+            self.read(self.buffers[1])
+            self.pending = False
+
+    def read(self, buffer):
+        self.counts += np.frombuffer(buffer.read(), dtype=np.uint32).reshape(self.counts.shape)
+
+    def reset(self):
+        """Forgets the counts, those of a frame still in flight are dropped too."""
+        self.counts[:] = 0
+        self.pending = False
+
+    # --- Summaries ---
+    @property
+    def paths(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def rays(self) -> int:
+        """Rays traced by the counted paths, a path ending at bounce i traced i + 1."""
+        return int(self.counts.sum(axis=1) @ np.arange(1, PATH_STATISTICS_DEPTHS + 1))
+
+    @property
+    def mean_path_length(self) -> float:
+        """Rays per path, 0 before any path was counted."""
+        return self.rays / max(self.paths, 1)
+
+    def reason_fractions(self) -> dict:
+        """Fraction of the paths that ended for each of PATH_END_REASONS."""
+        totals = self.counts.sum(axis=0)
+        return {reason: int(total) / max(self.paths, 1) for reason, total in zip(PATH_END_REASONS, totals)}
+
+    def depth_histogram(self) -> np.ndarray:
+        """Paths ending at each bounce, up to the deepest one counted."""
+        ends = self.counts.sum(axis=1)
+        deepest = np.flatnonzero(ends)
+        return ends[:deepest[-1] + 1 if len(deepest) else 0]
+
+    def release(self):
+        for buffer in self.buffers:
+            buffer.release()
@@ -0,0 +1,532 @@
+"""
+CPU reference path tracer, a line by line NumPy port of shaders/raytrace.glsl.
+
+Every function mirrors the GLSL function of the same name, including its random number stream,
+so a render here is a ground truth to diff shader output against. Rays are processed as
+structure-of-arrays batches, terminated paths are compacted away after every bounce, and image
+tiles are split across a process pool.
+"""
+import os
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from lights import LightList, light_power
+from sampling import SAMPLER_RANDOM, SAMPLER_SOBOL, SAMPLER_BLUE_NOISE, BLUE_NOISE_SIZE, blue_noise
+
+
+@dataclass
+class TraceParams:
+    """
+    The uniforms of raytrace.glsl.
+    """
+    resolution: tuple[int, int]
+    fov: float
+    forward: np.ndarray
+    right: np.ndarray
+    up: np.ndarray
+    position: np.ndarray
+    raysPerPixel: int = 4
+    maxBounceLimit: int = 8
+    density: float = 0.0
+    skyboxLightStrength: float = 1.0
+    nextEventEstimation: bool = True
+    samplerType: int = SAMPLER_SOBOL
+    russianRoulette: bool = True
+    rouletteMinDepth: int = 3
+    throughputThreshold: float = 0.0
+    spheres: np.ndarray = field(default=None, repr=False)
+    # The light buffer, built from spheres
+    lights: np.ndarray = field(default=None, init=False, repr=False)
+    lightPower: float = field(default=0.0, init=False)
+
+    def __post_init__(self):
+        light_list = LightList()
+        light_list.build(self.spheres)
+        self.lights, self.lightPower = light_list.lights, light_list.total_power
+        self.nextEventEstimation = self.nextEventEstimation and len(self.lights) > 0
+
+    @classmethod
+    def from_camera(cls, camera, resolution: tuple[int, int], spheres: np.ndarray, **uniforms) -> "TraceParams":
+        return cls(
+            resolution=tuple(int(x) for x in resolution),
+            fov=camera.fov,
+            forward=np.array(camera.forward, dtype=np.float32),
+            right=np.array(camera.right, dtype=np.float32),
+            up=np.array(camera.up, dtype=np.float32),
+            position=np.array(camera.position, dtype=np.float32),
+            spheres=spheres,
+            **uniforms,
+        )
+
+
+F32 = np.float32
+PI = F32(np.pi)
+MAX_VOLUME_BOUNCES = 2
+RAY_JITTER_STRENGTH = F32(0.001)
+# Rays times spheres per intersection batch, bounds the memory of the distance matrix
+INTERSECTION_BATCH = 1 << 22
+
+
+# --- Samplers ---
+class SampleState(np.ndarray):
+    """
+    uint32 sampler states of a batch of paths, carrying the samplerType and sampleNumber the shader reads
+    from uniforms and globals. Slices and copies keep them, so subsets of paths can be passed around.
+    """
+    def __new__(cls, states: np.ndarray, sampler: int, sample_number: int):
+        state = np.asarray(states, dtype=np.uint32).view(cls)
+        state.sampler, state.sample_number = sampler, sample_number
+        return state
+
+    def __array_finalize__(self, obj):
+        self.sampler = getattr(obj, "sampler", SAMPLER_RANDOM)
+        self.sample_number = getattr(obj, "sample_number", 0)
+
+
+def Triple32(state: np.ndarray):
+    """Advances uint32 states in place."""
+    state ^= state >> np.uint32(17)
+    state *= np.uint32(0xed5ad4bb)
+    state ^= state >> np.uint32(11)
+    state *= np.uint32(0xac4c1b51)
+    state ^= state >> np.uint32(15)
+    state *= np.uint32(0x31848bab)
+    state ^= state >> np.uint32(14)
+
+
+def UnitFloat(x: np.ndarray) -> np.ndarray:
+    return np.asarray(x >> np.uint32(8)).astype(F32) * F32(1.0 / 16777216.0)
+
+
+def bitfieldReverse(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.uint32)
+    for shift, mask in ((1, 0x55555555), (2, 0x33333333), (4, 0x0f0f0f0f), (8, 0x00ff00ff), (16, 0x0000ffff)):
+        shift, mask = np.uint32(shift), np.uint32(mask)
+        x = ((x >> shift) & mask) | ((x & mask) << shift)
+    return x
+
+
+def LaineKarras(x: np.ndarray, seed: np.ndarray) -> np.ndarray:
+    x = x + seed
+    for constant in (0x6c50b47c, 0xb82f1e52, 0xc7afe638, 0x8d22f6e6):
+        x ^= x * np.uint32(constant)
+    return x
+
+
+def NestedUniformScramble(x: np.ndarray, seed: np.ndarray) -> np.ndarray:
+    return bitfieldReverse(LaineKarras(bitfieldReverse(x), seed))
+
+
+def HashCombine(seed: np.ndarray, value: int) -> np.ndarray:
+    return seed ^ (np.uint32(value) + np.uint32(0x9e3779b9) + (seed << np.uint32(6)) + (seed >> np.uint32(2)))
+
+
+def SobolDimension1Reversed(index: np.ndarray) -> np.ndarray:
+    for shift, mask in ((1, 0x55555555), (2, 0x33333333), (4, 0x0f0f0f0f), (8, 0x00ff00ff), (16, 0x0000ffff)):
+        index = index ^ ((index >> np.uint32(shift)) & np.uint32(mask))
+    return index
+
+
+def SobolPoint(seed: np.ndarray, sample_number: int) -> tuple[np.ndarray, np.ndarray]:
+    seed = np.asarray(seed)
+    index = NestedUniformScramble(np.full_like(seed, sample_number), seed)
+    return (
+        bitfieldReverse(LaineKarras(index, HashCombine(seed, 1))),
+        bitfieldReverse(LaineKarras(SobolDimension1Reversed(index), HashCombine(seed, 2))),
+    )
+
+
+def BlueNoise(state: SampleState) -> np.ndarray:
+    offset = np.asarray(state >> np.uint32(12))
+    Triple32(offset)
+    mask = np.uint32(BLUE_NOISE_SIZE - 1)
+    x = (np.asarray(state) + offset) & mask
+    y = ((np.asarray(state) >> np.uint32(6)) + (offset >> np.uint32(6))) & mask
+    state += np.uint32(1 << 12)
+    return (blue_noise()[y, x] * F32(4294967296.0)).astype(np.uint32)
+
+
+def fixed_point_step(sample_number: int, increment: int) -> np.uint32:
+    """sampleNumber * increment in uint32 arithmetic."""
+    return np.uint32(sample_number * increment % (1 << 32))
+
+
+def Rand(state: SampleState) -> np.ndarray:
+    if state.sampler == SAMPLER_BLUE_NOISE:
+        return UnitFloat(BlueNoise(state) + fixed_point_step(state.sample_number, 0x9e3779b9))
+    Triple32(state)
+    if state.sampler == SAMPLER_SOBOL:
+        return UnitFloat(SobolPoint(state, state.sample_number)[0])
+    return UnitFloat(state)
+
+
+def Rand2(state: SampleState) -> tuple[np.ndarray, np.ndarray]:
+    if state.sampler == SAMPLER_BLUE_NOISE:
+        x = BlueNoise(state) + fixed_point_step(state.sample_number, 0xc13fa9a9)
+        y = BlueNoise(state) + fixed_point_step(state.sample_number, 0x91e10da6)
+        return UnitFloat(x), UnitFloat(y)
+    if state.sampler == SAMPLER_SOBOL:
+        Triple32(state)
+        x, y = SobolPoint(state, state.sample_number)
+        return UnitFloat(x), UnitFloat(y)
+    x = Rand(state)
+    y = Rand(state)
+    return x, y
+
+
+def normalize(v: np.ndarray) -> np.ndarray:
+    return v / np.sqrt(np.sum(v * v, axis=-1, keepdims=True))
+
+
+def SphereDirection(u: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    z = F32(1.0) - F32(2.0) * u[0]
+    r = np.sqrt(np.maximum(F32(0.0), F32(1.0) - z * z))
+    phi = F32(6.28318530718) * u[1]
+    return np.stack((r * np.cos(phi), r * np.sin(phi), z), axis=-1)
+
+
+def OrthonormalBasis(n: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Columns of the rotation taking z to the unit vectors n."""
+    x, y, z = n[:, 0], n[:, 1], n[:, 2]
+    s = np.where(z >= F32(0.0), F32(1.0), F32(-1.0))
+    a = F32(-1.0) / (s + z)
+    b = x * y * a
+    return (
+        np.stack((F32(1.0) + s * x * x * a, s * b, -s * x), axis=-1),
+        np.stack((b, s + y * y * a, -y), axis=-1),
+        n,
+    )
+
+
+def rotate(basis: tuple[np.ndarray, np.ndarray, np.ndarray], x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """mat3 times vec3 in GLSL."""
+    return basis[0] * x[:, None] + basis[1] * y[:, None] + basis[2] * z[:, None]
+
+
+def CosineDirection(normals: np.ndarray, u: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    r = np.sqrt(u[0])
+    phi = F32(6.28318530718) * u[1]
+    return rotate(
+        OrthonormalBasis(normals), r * np.cos(phi), r * np.sin(phi), np.sqrt(np.maximum(F32(0.0), F32(1.0) - u[0]))
+    )
+
+
+def SampleNumber(accumulation_frame: int, frame_sample: int, params: "TraceParams") -> int:
+    # sampleBase of the shader, every frame of a reference render has raysPerPixel samples
+    return (max(accumulation_frame - 1, 0) * params.raysPerPixel + frame_sample) % (1 << 32)
+
+
+def SampleSeed(frag_x: np.ndarray, frag_y: np.ndarray, sample_number: int, params: "TraceParams") -> SampleState:
+    if params.samplerType == SAMPLER_BLUE_NOISE:
+        mask = np.uint32(BLUE_NOISE_SIZE - 1)
+        seed = (frag_x.astype(np.uint32) & mask) | ((frag_y.astype(np.uint32) & mask) << np.uint32(6))
+        return SampleState(seed, params.samplerType, sample_number)
+    seed = (frag_y * F32(params.resolution[0]) + frag_x).astype(np.uint32)
+    Triple32(seed)
+    if params.samplerType != SAMPLER_SOBOL:
+        seed += np.uint32(sample_number)
+    return SampleState(seed, params.samplerType, sample_number)
+
+
+# --- Intersection ---
+def CalculateRayCollision(origins: np.ndarray, directions: np.ndarray, spheres: np.ndarray):
+    """
+    Returns (happened, distance, position, normal, sphere index) for every ray.
+    Misses have distance 1e20 like the shader's closestHit.
+    """
+    ray_count = len(origins)
+    distance = np.full(ray_count, F32(1e20))
+    closest = np.full(ray_count, -1, dtype=np.int64)
+    if len(spheres) == 0 or ray_count == 0:
+        return closest >= 0, distance, origins.copy(), np.zeros_like(origins), closest
+
+    centers = spheres["center"].astype(F32)
+    radii = spheres["radius"].astype(F32)
+    batch = max(1, INTERSECTION_BATCH // len(spheres))
+    for start in range(0, ray_count, batch):
+        o = origins[start:start + batch, None, :]
+        d = directions[start:start + batch, None, :]
+        offset = o - centers[None]
+        a = np.sum(d * d, axis=-1)
+        b = F32(2.0) * np.sum(offset * d, axis=-1)
+        c = np.sum(offset * offset, axis=-1) - radii * radii
+        discriminant = b * b - F32(4.0) * a * c
+        with np.errstate(invalid="ignore"):
+            dst = (-b - np.sqrt(discriminant)) / (F32(2.0) * a)
+        dst = np.where((discriminant >= 0) & (dst >= 0), dst, np.inf)
+
+        # argmin keeps the lowest index on ties, like the strict < in the shader loop
+        nearest = np.argmin(dst, axis=1)
+        nearest_dst = dst[np.arange(len(dst)), nearest]
+        hit = nearest_dst < F32(1e20)
+        distance[start:start + batch][hit] = nearest_dst[hit]
+        closest[start:start + batch][hit] = nearest[hit]
+
+    happened = closest >= 0
+    position = origins + directions * distance[:, None]
+    normal = np.zeros_like(origins)
+    normal[happened] = normalize(position[happened] - centers[closest[happened]])
+    return happened, distance, position, normal, closest
+
+
+def GetEnvironmentLight(directions: np.ndarray, skyboxLightStrength: float) -> np.ndarray:
+    y = directions[:, 1:2]
+    with np.errstate(invalid="ignore"):
+        bias = np.minimum(F32(1), np.power(y, F32(0.5)) * F32(2))
+    sky = F32(0.8) * (F32(1) - bias) + np.array([0.5, 0.55, 0.65], dtype=F32) * bias
+    color = np.where(y < 0, F32(0.35), sky)
+    return color * F32(skyboxLightStrength)
+
+
+# --- Bouncing ---
+def TraverseVolume(distance: np.ndarray, density: float, state: np.ndarray) -> np.ndarray:
+    if density <= 0:
+        return np.full_like(distance, F32(-1.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scatter_pos = -np.log(F32(1) - Rand(state)) / F32(density)
+    return np.where(scatter_pos < distance, scatter_pos, F32(-1.0))
+
+
+def BounceRaySurface(directions: np.ndarray, normals: np.ndarray, smoothness: np.ndarray, state: np.ndarray) -> np.ndarray:
+    diffuse = CosineDirection(normals, Rand2(state))
+    specular = directions - F32(2.0) * np.sum(normals * directions, axis=-1, keepdims=True) * normals
+    s = smoothness[:, None]
+    return diffuse * (F32(1) - s) + specular * s
+
+
+# --- Next event estimation ---
+def SphereConeSize(positions: np.ndarray, spheres: np.ndarray) -> np.ndarray:
+    to_center = spheres["center"].astype(F32) - positions
+    radii = spheres["radius"].astype(F32)
+    sin_squared = radii * radii / np.sum(to_center * to_center, axis=-1)
+    with np.errstate(invalid="ignore"):
+        cone_size = sin_squared / (F32(1.0) + np.sqrt(F32(1.0) - sin_squared))
+    return np.where(sin_squared >= F32(1.0), F32(0.0), cone_size)
+
+
+def LightPdf(positions: np.ndarray, spheres: np.ndarray, lightPower: float) -> np.ndarray:
+    cone_size = SphereConeSize(positions, spheres)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pdf = light_power(spheres) / F32(lightPower) / (F32(2.0) * PI * cone_size)
+    return np.where(cone_size <= F32(0.0), F32(0.0), pdf)
+
+
+def PowerHeuristic(pdf: np.ndarray, other_pdf: np.ndarray) -> np.ndarray:
+    return pdf * pdf / (pdf * pdf + other_pdf * other_pdf)
+
+
+def SampleDirectLight(positions: np.ndarray, normals: np.ndarray, hit_spheres: np.ndarray,
+                      volume_bounces: np.ndarray, state: np.ndarray, params: TraceParams) -> np.ndarray:
+    """Light reaching the diffuse surfaces at positions from one light each, without the surface color."""
+    lights = params.lights
+    picked = np.minimum(np.searchsorted(lights["cdf"], Rand(state), side="right"), len(lights) - 1)
+    light_spheres = lights["sphere"][picked].astype(np.int64)
+    u1, u2 = Rand2(state)
+
+    light = params.spheres[light_spheres]
+    cone_size = SphereConeSize(positions, light)
+    cos_theta = F32(1.0) - u1 * cone_size
+    sin_theta = np.sqrt(np.maximum(F32(0.0), F32(1.0) - cos_theta * cos_theta))
+    phi = F32(2.0) * PI * u2
+    basis = OrthonormalBasis(normalize(light["center"].astype(F32) - positions))
+    direction = normalize(rotate(basis, np.cos(phi) * sin_theta, np.sin(phi) * sin_theta, cos_theta))
+    cos_surface = np.sum(normals * direction, axis=-1)
+
+    light_out = np.zeros_like(positions)
+    valid = np.flatnonzero((light_spheres != hit_spheres) & (cone_size > F32(0.0)) & (cos_surface > F32(0.0)))
+    happened, distance, _, _, index = CalculateRayCollision(positions[valid], direction[valid], params.spheres)
+    visible = happened & (index == light_spheres[valid])
+    valid, distance = valid[visible], distance[visible]
+
+    transmittance = np.where(
+        volume_bounces[valid] < MAX_VOLUME_BOUNCES, np.exp(F32(-params.density) * distance), F32(1.0)
+    )
+    light_pdf = LightPdf(positions[valid], light[valid], params.lightPower)
+    bounce_pdf = cos_surface[valid] / PI
+    weight = cos_surface[valid] / PI / light_pdf * transmittance * PowerHeuristic(light_pdf, bounce_pdf)
+    emitted = light["emissionColor"][valid].astype(F32) * light["emissionStrength"][valid].astype(F32)[:, None]
+    light_out[valid] = emitted * weight[:, None]
+    return light_out
+
+
+def EmissionWeight(origins: np.ndarray, happened: np.ndarray, index: np.ndarray, bounce_pdf: np.ndarray,
+                   params: TraceParams) -> np.ndarray:
+    weight = np.ones(len(origins), dtype=F32)
+    weighted = happened & (bounce_pdf > F32(0.0))
+    light_pdf = LightPdf(origins[weighted], params.spheres[index[weighted]], params.lightPower)
+    weight[weighted] = PowerHeuristic(bounce_pdf[weighted], light_pdf)
+    return weight
+
+
+def ContinuePath(bounce: int, throughput: np.ndarray, state: SampleState,
+                 params: TraceParams) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Mask of the paths that trace another ray after bounce, and their throughput weighted by the inverse of the
+    roulette survival probability. state is advanced for the paths that play the roulette.
+    """
+    survival = np.max(throughput, axis=-1)
+    keep = survival > F32(params.throughputThreshold)
+    if params.russianRoulette and bounce + 1 >= params.rouletteMinDepth:
+        survival = np.minimum(survival, F32(1.0))
+        playing = keep.copy()
+        sub_state = state[playing]
+        keep[playing] = Rand(sub_state) < survival[playing]
+        state[playing] = sub_state
+        throughput = throughput / np.where(keep, survival, F32(1.0))[:, None]
+    return keep, throughput
+
+
+def Trace(origins: np.ndarray, directions: np.ndarray, state: np.ndarray, params: TraceParams) -> np.ndarray:
+    """
+    Traces one ray per entry and returns the incoming light. state is advanced in place.
+    Paths are kept as compacted arrays, alive holds their positions in the full batch.
+    """
+    spheres = params.spheres
+    incoming = np.zeros_like(origins)
+    alive = np.arange(len(origins))
+    o, d, st = origins.copy(), directions.copy(), state.copy()
+    ray_color = np.ones_like(origins)
+    volume_bounces = np.zeros(len(origins), dtype=np.int32)
+
+    # Density of the last bounce direction when that surface also sampled a light, 0 otherwise
+    bounce_pdf = np.zeros(len(origins), dtype=F32)
+
+    for bounce in range(params.maxBounceLimit + 1):
+        if len(alive) == 0:
+            break
+        happened, distance, position, normal, index = CalculateRayCollision(o, d, spheres)
+        emission_weight = EmissionWeight(o, happened, index, bounce_pdf, params)
+        volume_distance = TraverseVolume(distance, params.density, st)
+
+        scatter = (volume_distance != F32(-1.0)) & (volume_bounces < MAX_VOLUME_BOUNCES)
+        if scatter.any():
+            sub_state = st[scatter]
+            o[scatter] = o[scatter] + d[scatter] * volume_distance[scatter, None]
+            d[scatter] = SphereDirection(Rand2(sub_state))
+            st[scatter] = sub_state
+            volume_bounces[scatter] += 1
+            emission_weight[scatter] = F32(1.0)
+
+        # Misses collect the sky and terminate
+        missed = ~happened
+        incoming[alive[missed]] += GetEnvironmentLight(d[missed], params.skyboxLightStrength) * ray_color[missed]
+        state[alive[missed]] = st[missed]
+
+        # Hits emit, sample a light and bounce, compacting the arrays down to the surviving paths
+        alive, o, d, st = alive[happened], o[happened], d[happened], st[happened]
+        ray_color, volume_bounces = ray_color[happened], volume_bounces[happened]
+        position, normal, index = position[happened], normal[happened], index[happened]
+        material = spheres[index]
+        emitted = material["emissionColor"].astype(F32) * material["emissionStrength"].astype(F32)[:, None]
+        smoothness = material["smoothness"].astype(F32)
+
+        incoming[alive] += emitted * ray_color * emission_weight[happened, None]
+        ray_color = ray_color * material["color"].astype(F32)
+
+        sample_lights = np.zeros(len(alive), dtype=bool)
+        if params.nextEventEstimation and bounce < params.maxBounceLimit:
+            sample_lights = smoothness == F32(0.0)
+            sub_state = st[sample_lights]
+            direct = SampleDirectLight(
+                position[sample_lights], normal[sample_lights], index[sample_lights],
+                volume_bounces[sample_lights], sub_state, params,
+            )
+            st[sample_lights] = sub_state
+            incoming[alive[sample_lights]] += direct * ray_color[sample_lights]
+
+        d = BounceRaySurface(d, normal, smoothness, st)
+        o = position
+        bounce_pdf = np.where(sample_lights, np.sum(normal * d, axis=-1) / PI, F32(0.0))
+
+        if bounce < params.maxBounceLimit:
+            keep, ray_color = ContinuePath(bounce, ray_color, st, params)
+            state[alive[~keep]] = st[~keep]
+            alive, o, d, st = alive[keep], o[keep], d[keep], st[keep]
+            ray_color, volume_bounces, bounce_pdf = ray_color[keep], volume_bounces[keep], bounce_pdf[keep]
+
+    state[alive] = st
+    return incoming
+
+
+# --- Image ---
+def render_rows(params: TraceParams, accumulation_frame: int, row_start: int, row_end: int,
+                prev: np.ndarray = None) -> np.ndarray:
+    """
+    Runs main() of the shader for rows [row_start, row_end) and returns the accumulation,
+    radiance sum in rgb and sample count in alpha like the RGBA32F buffers on the GPU.
+    Rows are in gl_FragCoord.y order, which is also the order Tracer.read_accumulation returns.
+    """
+    width, height = params.resolution
+    resolution = np.array([width, height], dtype=F32)
+    frag_x, frag_y = np.meshgrid(
+        np.arange(width, dtype=F32) + F32(0.5),
+        np.arange(row_start, row_end, dtype=F32) + F32(0.5),
+    )
+    frag_x, frag_y = frag_x.ravel(), frag_y.ravel()
+
+    aspect = resolution[0] / resolution[1]
+    ndc_x = (frag_x / resolution[0] * F32(2.0) - F32(1.0)) * aspect
+    ndc_y = -(frag_y / resolution[1] * F32(2.0) - F32(1.0))
+    focal_length = F32(1) / np.tan(np.radians(F32(params.fov)) * F32(0.5))
+    base_direction = np.stack((ndc_x, ndc_y, np.full_like(ndc_x, focal_length)), axis=-1)
+
+    screen_to_world = np.stack((params.right, params.up, params.forward), axis=-1).astype(F32)
+
+    light = np.zeros((len(frag_x), 3), dtype=F32)
+    origins = np.broadcast_to(params.position.astype(F32), base_direction.shape)
+    for frame_sample in range(params.raysPerPixel):
+        state = SampleSeed(frag_x, frag_y, SampleNumber(accumulation_frame, frame_sample, params), params)
+        jitter = SphereDirection(Rand2(state)) * RAY_JITTER_STRENGTH
+        direction = normalize(jitter + base_direction)
+        light += Trace(origins, direction @ screen_to_world.T, state, params)
+
+    sample = np.concatenate((light, np.full((len(light), 1), F32(params.raysPerPixel))), axis=-1)
+    sample = sample.reshape(row_end - row_start, width, 4)
+    if prev is None or accumulation_frame <= 1:
+        return sample
+    return prev + sample
+
+
+def render_tile(params: TraceParams, row_start: int, row_end: int, frames: int,
+                first_frame: int = 1, prev: np.ndarray = None) -> np.ndarray:
+    """Accumulates frames [first_frame, first_frame + frames) for a band of rows on top of prev."""
+    accumulation = prev
+    with np.errstate(over="ignore"):
+        for frame in range(first_frame, first_frame + frames):
+            accumulation = render_rows(params, frame, row_start, row_end, accumulation)
+    return accumulation
+
+
+def render(params: TraceParams, frames: int = 1, first_frame: int = 1, prev: np.ndarray = None,
+           workers: int = None, tile_rows: int = 16, pool: ProcessPoolExecutor = None) -> np.ndarray:
+    """
+    Renders and accumulates the full image, split into bands of tile_rows rows across a process pool.
+    Returns a float32 (height, width, 4) accumulation in the same layout as Tracer.read_accumulation.
+    Pass a pool to reuse its workers across calls.
+    """
+    width, height = params.resolution
+    workers = workers or os.cpu_count() or 1
+    bands = [(start, min(start + tile_rows, height)) for start in range(0, height, tile_rows)]
+    band_prev = [None if prev is None else prev[start:end] for start, end in bands]
+
+    if pool is None and workers == 1:
+        tiles = [
+            render_tile(params, start, end, frames, first_frame, tile_prev)
+            for (start, end), tile_prev in zip(bands, band_prev)
+        ]
+        return np.concatenate(tiles, axis=0)
+
+    own_pool = pool is None
+    pool = pool or ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [
+            pool.submit(render_tile, params, start, end, frames, first_frame, tile_prev)
+            for (start, end), tile_prev in zip(bands, band_prev)
+        ]
+        tiles = [future.result() for future in futures]
+    finally:
+        if own_pool:
+            pool.shutdown()
+    return np.concatenate(tiles, axis=0)
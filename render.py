@@ -0,0 +1,237 @@
+"""
+Headless offline renderer, no window, ImGui or input.
+
+    python render.py "Default World" -o render.png --size 1920 1080 --frames 256
+    python render.py worlds/scene.world -o render.exr --time-budget 30 --position 7 7 7 --yaw 225 --pitch -40
+    python render.py "Default World" -o reference.npy --cpu --workers 8
+    python render.py "Default World" -o render.exr --frames 1024 --processes 4
+"""
+import argparse
+import os
+import time
+
+import moderngl
+from glm import vec3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import reference
+from camera import Camera
+from images import save_image, resolve_accumulation
+from sampling import SAMPLER_SOBOL, sampler_index
+from tracer import Tracer
+from world import world_path, read_world
+
+
+def create_context(backend: str | None = None):
+    """Creates a windowless OpenGL context, using EGL when no display is available."""
+    if backend is None and not os.environ.get("DISPLAY"):
+        backend = "egl"
+    kwargs = {"backend": backend} if backend else {}
+    return moderngl.create_standalone_context(require=450, **kwargs)
+
+
+def create_camera(app, camera: dict) -> Camera:
+    return Camera(app, vec3(camera["position"]), camera["fov"], camera["yaw"], camera["pitch"])
+
+
+def render_cpu(world: str, size: tuple[int, int], camera: dict, frames: int | None = None,
+               time_budget: float | None = None, workers: int | None = None, **uniforms):
+    """
+    Renders with the NumPy reference tracer instead of OpenGL.
+    Returns the linear radiance image and the number of frames accumulated.
+    """
+    spheres, skybox_light_strength, _ = read_world(world_path(world))
+    params = reference.TraceParams.from_camera(
+        create_camera(None, camera), size, spheres, skyboxLightStrength=skybox_light_strength, **uniforms
+    )
+
+    accumulation = None
+    start = time.perf_counter()
+    frame = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        while frames is None or frame < frames:
+            frame += 1
+            accumulation = reference.render(params, frames=1, first_frame=frame, prev=accumulation, pool=pool)
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+    return resolve_accumulation(accumulation), frame
+
+
+@dataclass
+class RenderJob:
+    """A world, camera and trace settings, picklable so farm.py can hand it to worker processes."""
+    world: str
+    size: tuple[int, int]
+    camera: dict
+    rays_per_pixel: int = 4
+    max_bounces: int = 8
+    density: float = 0.0
+    use_bvh: bool = True
+    wavefront: bool = False
+    next_event_estimation: bool = True
+    sampler: int = SAMPLER_SOBOL
+    russian_roulette: bool = True
+    roulette_min_depth: int = 3
+    throughput_threshold: float = 0.0
+    backend: str | None = None
+
+    @classmethod
+    def from_args(cls, args) -> "RenderJob":
+        return cls(
+            args.world, tuple(args.size),
+            {"position": args.position, "fov": args.fov, "yaw": args.yaw, "pitch": args.pitch},
+            args.rays_per_pixel, args.max_bounces, args.density, not args.no_bvh, args.wavefront,
+            not args.no_nee, sampler_index(args.sampler), not args.no_roulette, args.roulette_depth,
+            args.throughput_threshold, args.backend,
+        )
+
+    def create_tracer(self, ctx) -> "HeadlessTracer":
+        tracer = HeadlessTracer(ctx, self.size, self.world, self.camera)
+        tracer.rays_per_pixel = self.rays_per_pixel
+        tracer.max_bounce_limit = self.max_bounces
+        tracer.density = self.density
+        tracer.use_bvh = self.use_bvh
+        tracer.use_wavefront = self.wavefront
+        tracer.next_event_estimation = self.next_event_estimation
+        tracer.sampler = self.sampler
+        tracer.russian_roulette = self.russian_roulette
+        tracer.roulette_min_depth = self.roulette_min_depth
+        tracer.throughput_threshold = self.throughput_threshold
+        return tracer
+
+    def uniforms(self) -> dict:
+        """The settings as reference.TraceParams fields, for render_cpu."""
+        return {
+            "raysPerPixel": self.rays_per_pixel, "maxBounceLimit": self.max_bounces, "density": self.density,
+            "nextEventEstimation": self.next_event_estimation, "samplerType": self.sampler,
+            "russianRoulette": self.russian_roulette, "rouletteMinDepth": self.roulette_min_depth,
+            "throughputThreshold": self.throughput_threshold,
+        }
+
+
+class HeadlessTracer(Tracer):
+    """Tracer with its own camera, driven by a frame count or a time budget instead of a window."""
+    def __init__(self, ctx, size: tuple[int, int], world: str, camera: dict):
+        super().__init__(ctx, size, world)
+        self.camera = create_camera(self, camera)
+
+    def render(self, frames: int | None = None, time_budget: float | None = None, first_frame: int = 1) -> int:
+        """
+        Accumulates until either limit is reached and returns the number of frames rendered.
+        The samples start at those of first_frame, so renders of consecutive frame ranges add up to one long render.
+        """
+        # The reset covers any settings changed since the last render, so the first frame doesn't reset again
+        self.sync_frame_state()
+        self.reset_accumulation()
+        if first_frame > 1:
+            # Frames after the first add to the history, which has to start out empty
+            self.fbo_prev.clear()
+            self.accumulation_frame = first_frame - 1
+            self.sample_base = (first_frame - 1) * self.rays_per_pixel
+        start = time.perf_counter()
+        frame = 0
+        while frames is None or frame < frames:
+            frame_start = time.perf_counter()
+            self.update_accumulation()
+            with self.telemetry.gpu("trace"):
+                self.render_frame()
+            # Block so the timing (and the budget) measures GPU work, not queued commands
+            self.ctx.finish()
+            self.delta_time = time.perf_counter() - frame_start
+            self.telemetry.end_frame(self.delta_time * 1000)
+            frame += 1
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+        return frame
+
+
+def job_arguments() -> argparse.ArgumentParser:
+    """Arguments RenderJob.from_args reads, a parent parser shared with sequence.py."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("world", help="World name in the worlds folder or a path to a .world file")
+    parser.add_argument("--size", type=int, nargs=2, default=(1600, 900), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--position", type=float, nargs=3, default=(7, 7, 7), metavar=("X", "Y", "Z"))
+    parser.add_argument("--yaw", type=float, default=225)
+    parser.add_argument("--pitch", type=float, default=-40)
+    parser.add_argument("--fov", type=float, default=60)
+    parser.add_argument("--rays-per-pixel", type=int, default=4)
+    parser.add_argument("--max-bounces", type=int, default=8)
+    parser.add_argument("--density", type=float, default=0.0)
+    parser.add_argument("--no-roulette", action="store_true", help="Trace every path up to --max-bounces")
+    parser.add_argument("--roulette-depth", type=int, default=3, help="Bounces before Russian roulette starts")
+    parser.add_argument("--throughput-threshold", type=float, default=0.0,
+                        help="End paths whose throughput drops to this, biased above 0")
+    parser.add_argument("--no-bvh", action="store_true", help="Use the linear sphere loop")
+    parser.add_argument("--no-nee", action="store_true", help="Only find lights by bouncing into them")
+    parser.add_argument("--wavefront", action="store_true", help="Trace with the compute shader wavefront passes")
+    parser.add_argument("--sampler", default="sobol", choices=("random", "sobol", "bluenoise"),
+                        help="Random number sequence of the paths")
+    parser.add_argument("--backend", default=None, help="moderngl standalone backend, e.g. egl")
+    return parser
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Render a .world file without a window.", parents=[job_arguments()])
+    parser.add_argument("-o", "--output", default="render.png", help="Output file, .png, .exr or .npy")
+    parser.add_argument("--frames", type=int, default=None, help="Accumulated frames to render")
+    parser.add_argument("--time-budget", type=float, default=None, help="Seconds to keep accumulating")
+    parser.add_argument("--adaptive", type=float, default=None, metavar="THRESHOLD",
+                        help="Stop sampling pixels once their relative error is below THRESHOLD (GPU only)")
+    parser.add_argument("--telemetry", default=None, metavar="PATH",
+                        help="Write per frame timings to a .csv or .json file (GPU only)")
+    parser.add_argument("--cpu", action="store_true", help="Render with the NumPy reference tracer, no OpenGL")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for --cpu, defaults to all cores")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Split the frames across this many render processes (see farm.py)")
+    parser.add_argument("--unit-frames", type=int, default=4, help="Frames per work unit of --processes")
+    parser.add_argument("--straggler-grace", type=float, default=10.0,
+                        help="Seconds past --time-budget before --processes drops unfinished work units")
+    args = parser.parse_args(args)
+    if args.frames is None and args.time_budget is None:
+        args.frames = 64
+    return args
+
+
+def main(args=None):
+    args = parse_args(args)
+    job = RenderJob.from_args(args)
+
+    start = time.perf_counter()
+    if args.processes:
+        # Imported here, farm.py builds on this module
+        from farm import render_farm
+        accumulation, frames = render_farm(
+            job, args.cpu, args.processes, args.frames, args.time_budget, args.unit_frames, args.straggler_grace
+        )
+        image = resolve_accumulation(accumulation)
+        device = f"{'CPU reference' if args.cpu else 'OpenGL'} render farm ({args.processes} processes)"
+    elif args.cpu:
+        image, frames = render_cpu(
+            job.world, job.size, job.camera, args.frames, args.time_budget, args.workers, **job.uniforms()
+        )
+        device = f"CPU reference ({args.workers or os.cpu_count()} workers)"
+    else:
+        ctx = create_context(job.backend)
+        tracer = job.create_tracer(ctx)
+        if args.adaptive is not None:
+            tracer.adaptive_sampling = True
+            tracer.adaptive_threshold = args.adaptive
+
+        frames = tracer.render(args.frames, args.time_budget)
+        image = tracer.read_image()
+        if args.telemetry:
+            tracer.telemetry.flush_gpu()
+            tracer.telemetry.export(args.telemetry)
+        device = ctx.info["GL_RENDERER"]
+    elapsed = time.perf_counter() - start
+
+    save_image(args.output, image)
+    print(
+        f"Rendered {frames} frames at {args.size[0]}x{args.size[1]} in {elapsed:.2f}s "
+        f"({elapsed / max(frames, 1) * 1000:.1f} ms/frame) on {device}, saved to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import numpy as np
+
+from functools import lru_cache
+
+
+# samplerType values of common.glsl, in the order the UI lists them
+SAMPLERS = ("Random", "Sobol", "Blue Noise")
+SAMPLER_RANDOM, SAMPLER_SOBOL, SAMPLER_BLUE_NOISE = range(len(SAMPLERS))
+
+# Side of the tiled blue noise texture, the shader packs texel coordinates into 6 bits each
+BLUE_NOISE_SIZE = 64
+
+
+def sampler_index(name: str) -> int:
+    """samplerType of a sampler name, case and spaces ignored so "bluenoise" works on the command line."""
+    names = [sampler.replace(" ", "").lower() for sampler in SAMPLERS]
+    return names.index(name.replace(" ", "").replace("-", "").lower())
+
+
+@lru_cache
+def blue_noise(size: int = BLUE_NOISE_SIZE, sigma: float = 1.9, seed: int = 0) -> np.ndarray:
+    """
+    Tileable blue noise by void and cluster (Ulichney 1993), a float32 (size, size) array of ranks.
+    Every texel holds (rank + 0.5) / size**2, so thresholding it at any level gives evenly spread points.
+    """
+    count = size * size
+    # Gaussian energy of a point at the origin on the torus
+    offsets = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(offsets[:, None] ** 2 + offsets[None, :] ** 2) / (2 * sigma * sigma))
+
+    def splat(energy, index, sign):
+        y, x = divmod(int(index), size)
+        energy += sign * np.roll(kernel, (y, x), axis=(0, 1)).ravel()
+
+    # Initial pattern, a tenth of the texels moved from the tightest cluster to the largest void until stable
+    rng = np.random.default_rng(seed)
+    initial = np.zeros(count, dtype=bool)
+    initial[rng.choice(count, count // 10, replace=False)] = True
+    energy = np.zeros(count)
+    for index in np.flatnonzero(initial):
+        splat(energy, index, 1)
+    while True:
+        cluster = np.flatnonzero(initial)[np.argmax(energy[initial])]
+        initial[cluster] = False
+        splat(energy, cluster, -1)
+        void = np.flatnonzero(~initial)[np.argmin(energy[~initial])]
+        initial[void] = True
+        splat(energy, void, 1)
+        if void == cluster:
+            break
+
+    ranks = np.zeros(count, dtype=np.int64)
+    # Ranks below the initial points, removing the tightest cluster first
+    pattern, pattern_energy = initial.copy(), energy.copy()
+    for rank in range(int(initial.sum()) - 1, -1, -1):
+        cluster = np.flatnonzero(pattern)[np.argmax(pattern_energy[pattern])]
+        pattern[cluster] = False
+        splat(pattern_energy, cluster, -1)
+        ranks[cluster] = rank
+    # Ranks above, filling the largest void first
+    pattern = initial
+    for rank in range(int(initial.sum()), count):
+        void = np.flatnonzero(~pattern)[np.argmin(energy[~pattern])]
+        pattern[void] = True
+        splat(energy, void, 1)
+        ranks[void] = rank
+    return ((ranks + 0.5) / count).astype(np.float32).reshape(size, size)
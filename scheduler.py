@@ -0,0 +1,122 @@
+class TileScheduler:
+    """
+    Splits the trace pass into scissor tiles and renders only as many per frame as fit a target MSPF.
+    The tile budget adapts to the tracer's measured GPU cost per pixel, so the UI stays responsive
+    while a slow accumulation frame is spread over several displayed frames.
+    """
+    def __init__(self, tracer, target_ms: float = 12.0, tile_size: int = 128):
+        self.tracer = tracer
+        self.enabled = True
+        self.target_ms = target_ms
+        self.tile_size = tile_size
+
+        # Tiles of the accumulation frame in progress, next_tile is the first one not traced yet
+        self.tiles = []
+        self.next_tile = 0
+        self.tiles_per_frame = 1.0
+        self.frame_resets = None
+
+    @property
+    def progress(self) -> float:
+        """Fraction of the current accumulation frame that has been traced."""
+        return self.next_tile / len(self.tiles) if self.tiles else 0.0
+
+    def layout(self) -> list[tuple[int, int, int, int]]:
+        """Splits the render resolution into (x, y, width, height) tiles of at most tile_size pixels."""
+        width, height = int(self.tracer.render_resolution.x), int(self.tracer.render_resolution.y)
+        size = max(1, self.tile_size)
+        return [
+            (x, y, min(size, width - x), min(size, height - y))
+            for y in range(0, height, size)
+            for x in range(0, width, size)
+        ]
+
+    def step(self):
+        """Traces the next batch of tiles, starting a new accumulation frame when the last one finished."""
+        tracer = self.tracer
+        if self.next_tile == 0 or tracer.accumulation_resets != self.frame_resets:
+            # Also restart when the history was discarded halfway, the traced tiles are stale
+            tracer.update_accumulation()
+            tracer.begin_frame()
+            self.tiles = self.layout()
+            self.next_tile = 0
+            self.frame_resets = tracer.accumulation_resets
+        else:
+            # Time spent on a partial frame still counts towards the accumulation
+            tracer.accumulation_time += tracer.delta_time
+
+        self.adapt()
+        count = min(len(self.tiles) - self.next_tile, max(1, int(self.tiles_per_frame)))
+        if count == len(self.tiles):
+            # The whole frame fits the budget, skip the per tile draw calls
+            tracer.trace()
+        else:
+            for tile in self.tiles[self.next_tile:self.next_tile + count]:
+                tracer.trace(tile)
+
+        self.next_tile += count
+        if self.next_tile == len(self.tiles):
+            tracer.end_frame()
+            self.next_tile = 0
+
+    def adapt(self):
+        """Updates tiles_per_frame from the tracer's GPU cost per pixel."""
+        if self.tracer.trace_cost is None:
+            return
+        ms_per_tile = self.tracer.trace_cost * self.tile_size * self.tile_size
+        self.tiles_per_frame = max(1.0, self.target_ms / max(ms_per_tile, 1e-6))
+
+    def reset(self):
+        """Drops the frame in progress, e.g. after the tile size changed."""
+        self.next_tile = 0
+        self.tiles_per_frame = 1.0
+
+
+class ResolutionScaler:
+    """
+    Traces at a fraction of the resolution while the camera or scene is changing, the display pass upscales.
+    The scale is picked so a whole frame fits the target MSPF, estimated from the tracer's GPU cost per pixel.
+    Once nothing has changed for settle_time seconds it snaps back to full resolution and accumulates.
+    """
+    def __init__(self, tracer, target_ms: float = 16.0, min_scale: float = 0.25, settle_time: float = 0.15):
+        self.tracer = tracer
+        self.enabled = True
+        self.target_ms = target_ms
+        self.min_scale = min_scale
+        self.settle_time = settle_time
+
+        self.idle_time = settle_time
+        self.last_resets = tracer.accumulation_resets
+
+    @property
+    def active(self) -> bool:
+        """Whether frames are traced whole at the scaled resolution instead of through the tile scheduler."""
+        return self.tracer.resolution_scale < 1 or (self.enabled and self.idle_time < self.settle_time)
+
+    def update(self):
+        """Picks this frame's resolution scale, call once per frame before tracing."""
+        tracer = self.tracer
+        changed = tracer.accumulation_resets != self.last_resets
+        self.idle_time = 0.0 if changed else self.idle_time + tracer.delta_time
+
+        scale = 1.0
+        if self.enabled and self.idle_time < self.settle_time:
+            scale = self.scale_for_budget() if changed else tracer.resolution_scale
+
+        if scale != tracer.resolution_scale:
+            # The history was traced at another resolution, the sync reprojects and rescales it
+            tracer.resolution_scale = scale
+            tracer.sync_frame_state()
+        self.last_resets = tracer.accumulation_resets
+
+    def scale_for_budget(self) -> float:
+        if self.tracer.trace_cost is None:
+            return 0.5
+        resolution = self.tracer.render_resolution
+        full_ms = self.tracer.trace_cost * resolution.x * resolution.y
+        # Trace time is proportional to the pixel count, the square of the scale
+        scale = (self.target_ms / max(full_ms, 1e-6)) ** 0.5
+        if scale >= 1:
+            return 1.0
+        # Coarse steps, so small timing noise doesn't change the scale every frame
+        return max(self.min_scale, int(scale * 16) / 16)
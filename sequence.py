@@ -0,0 +1,240 @@
+"""
+Image sequences along a camera path, rendered without a window.
+
+    python sequence.py "Default World" -o frames/turntable_####.png --turntable 120 --frames-per-image 64
+    python sequence.py "Default World" -o frames/shot_####.exr --keyframes shot.json --images 240
+
+Keyframe files are a JSON list of {"image": index, "position": [x, y, z], "yaw": deg, "pitch": deg, "fov": deg},
+poses between two keyframes are interpolated linearly.
+The accumulation of every image is read back through two pixel buffer objects, so the GPU keeps tracing the
+next image while the previous one is copied out, and encoded and written on a thread pool meanwhile.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import time
+import numpy as np
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from glm import vec3, radians
+from pathlib import Path
+
+from images import save_image, resolve_accumulation
+from render import RenderJob, create_context, job_arguments
+
+
+def turntable(camera: dict, images: int, center: tuple[float, float, float] = (0, 0, 0)) -> list[dict]:
+    """Poses orbiting camera's position once around the vertical axis through center, looking at center."""
+    offset = np.subtract(camera["position"], center)
+    radius = math.hypot(offset[0], offset[2])
+    start = math.atan2(offset[2], offset[0])
+    poses = []
+    for image in range(images):
+        angle = start + 2 * math.pi * image / images
+        position = np.add(center, (radius * math.cos(angle), offset[1], radius * math.sin(angle)))
+        poses.append({**camera, "position": tuple(map(float, position)), **look_at(position, center)})
+    return poses
+
+
+def look_at(position, target) -> dict:
+    """yaw and pitch in degrees of a Camera at position facing target."""
+    direction = np.subtract(target, position)
+    direction = direction / np.linalg.norm(direction)
+    return {
+        "yaw": math.degrees(math.atan2(direction[2], direction[0])),
+        "pitch": math.degrees(math.asin(np.clip(direction[1], -1.0, 1.0))),
+    }
+
+
+def keyframe_path(keyframes: list[dict], camera: dict, images: int | None = None) -> list[dict]:
+    """
+    Poses of images 0 to images - 1 (by default up to the last keyframe), interpolated linearly between keyframes
+    sorted by their "image". Images outside the keyframes hold the first or last pose, values a keyframe leaves
+    out are taken from camera.
+    """
+    keyframes = sorted(keyframes, key=lambda key: key["image"])
+    images = keyframes[-1]["image"] + 1 if images is None else images
+    times = [key["image"] for key in keyframes]
+    poses = []
+    for image in range(images):
+        pose = {}
+        for name in ("position", "yaw", "pitch", "fov"):
+            values = np.array([key.get(name, camera[name]) for key in keyframes], dtype=np.float64)
+            values = values.reshape(len(keyframes), -1)
+            value = [np.interp(image, times, values[:, axis]) for axis in range(values.shape[1])]
+            pose[name] = tuple(value) if name == "position" else value[0]
+        poses.append(pose)
+    return poses
+
+
+def image_path(pattern: str, image: int) -> Path:
+    """Output path of an image, the first run of # in pattern replaced by its zero padded index."""
+    match = re.search("#+", pattern)
+    if match is None:
+        path = Path(pattern)
+        return path.with_name(f"{path.stem}_{image:04d}{path.suffix}")
+    return Path(pattern[:match.start()] + f"{image:0{len(match.group())}d}" + pattern[match.end():])
+
+
+@dataclass
+class SequenceStats:
+    """Where the wall clock of a sequence went, in seconds. Only the *_wait times stall the render loop."""
+    images: int = 0
+    wall: float = 0.0
+    # Trace passes by GPU timer queries
+    gpu_busy: float = 0.0
+    # Summed over the encoder threads
+    encode_busy: float = 0.0
+    # Blocked mapping a pixel buffer whose copy hadn't finished, or on a full encoder queue
+    readback_wait: float = 0.0
+    encode_wait: float = 0.0
+    encode_times: list[float] = field(default_factory=list)
+
+    def report(self, encoders: int) -> str:
+        wall = max(self.wall, 1e-9)
+        return (
+            f"{self.images} images in {self.wall:.2f}s ({self.wall / max(self.images, 1) * 1000:.1f} ms/image): "
+            f"GPU busy {self.gpu_busy:.2f}s ({self.gpu_busy / wall:.0%}), "
+            f"encode busy {self.encode_busy:.2f}s "
+            f"({self.encode_busy / (wall * encoders):.0%} of {encoders} threads), "
+            f"waited {self.readback_wait:.2f}s on readback and {self.encode_wait:.2f}s on encoders"
+        )
+
+
+class SequenceRenderer:
+    """
+    Renders a list of camera poses to numbered image files with a HeadlessTracer.
+    Image i is copied into pixel buffer i % 2 with the trace of image i + 1 queued behind it, so mapping it
+    only waits for that copy. Encoding runs on encoders threads, at most two per thread queued.
+    """
+    def __init__(self, tracer, encoders: int | None = None):
+        self.tracer = tracer
+        self.ctx = tracer.ctx
+        self.encoders = encoders or min(4, os.cpu_count() or 1)
+        width, height = map(int, tracer.render_resolution)
+        self.pixel_buffers = [self.ctx.buffer(reserve=width * height * 16) for _ in range(2)]
+        self.shape = (height, width, 4)
+        self.stats = SequenceStats()
+
+    def render(self, poses: list[dict], pattern: str, frames_per_image: int) -> SequenceStats:
+        """Accumulates frames_per_image frames per pose and writes image i to image_path(pattern, i)."""
+        tracer = self.tracer
+        stats = self.stats = SequenceStats()
+        if poses:
+            # Compiles the trace shaders outside the breakdown. llvmpipe also reports garbage for a timer query
+            # around the first draw of a program
+            self.set_camera(poses[0])
+            tracer.reset_accumulation()
+            tracer.update_accumulation()
+            tracer.render_frame()
+            self.ctx.finish()
+        first_record = len(tracer.telemetry.records)
+        start = time.perf_counter()
+        in_flight = deque()
+        with ThreadPoolExecutor(self.encoders) as pool:
+            previous = None
+            for image, pose in enumerate(poses):
+                self.trace_image(pose, frames_per_image)
+                tracer.fbo_prev.color_attachments[0].read_into(self.pixel_buffers[image % 2])
+                if previous is not None:
+                    self.encode(pool, in_flight, previous, pattern)
+                previous = image
+            if previous is not None:
+                self.encode(pool, in_flight, previous, pattern)
+            for future in in_flight:
+                future.result()
+
+        tracer.telemetry.flush_gpu()
+        records = tracer.telemetry.records[first_record:]
+        stats.gpu_busy = sum(record.get("trace_gpu_ms", 0.0) for record in records) / 1000
+        stats.encode_busy = sum(stats.encode_times)
+        stats.images = len(poses)
+        stats.wall = time.perf_counter() - start
+        return stats
+
+    def set_camera(self, pose: dict):
+        camera = self.tracer.camera
+        camera.position = vec3(pose["position"])
+        camera.yaw = radians(pose["yaw"])
+        camera.pitch = radians(pose["pitch"])
+        camera.fov = pose["fov"]
+        camera.update()
+        camera.version += 1
+
+    def trace_image(self, pose: dict, frames: int):
+        """Queues the trace passes of one image, without waiting for the GPU."""
+        tracer = self.tracer
+        self.set_camera(pose)
+        tracer.reset_accumulation()
+        for _ in range(frames):
+            tracer.update_accumulation()
+            with tracer.telemetry.gpu("trace"):
+                tracer.render_frame()
+            tracer.telemetry.end_frame(0.0)
+
+    def encode(self, pool: ThreadPoolExecutor, in_flight: deque, image: int, pattern: str):
+        """Maps the pixel buffer of image and hands it to an encoder thread."""
+        stats = self.stats
+        while len(in_flight) >= 2 * self.encoders:
+            wait_start = time.perf_counter()
+            in_flight.popleft().result()
+            stats.encode_wait += time.perf_counter() - wait_start
+
+        wait_start = time.perf_counter()
+        data = self.pixel_buffers[image % 2].read()
+        stats.readback_wait += time.perf_counter() - wait_start
+        accumulation = np.frombuffer(data, dtype=np.float32).reshape(self.shape)
+        in_flight.append(pool.submit(self.write_image, accumulation, image_path(pattern, image)))
+
+    def write_image(self, accumulation: np.ndarray, path: Path):
+        start = time.perf_counter()
+        save_image(path, resolve_accumulation(accumulation))
+        # list.append is atomic, the threads can share the list
+        self.stats.encode_times.append(time.perf_counter() - start)
+
+    def release(self):
+        for buffer in self.pixel_buffers:
+            buffer.release()
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Render an image sequence along a camera path.",
+                                     parents=[job_arguments()])
+    parser.add_argument("-o", "--output", default="frames/frame_####.png",
+                        help="Output pattern, the first run of # is replaced by the image index (.png, .exr or .npy)")
+    path = parser.add_mutually_exclusive_group(required=True)
+    path.add_argument("--turntable", type=int, metavar="IMAGES",
+                      help="Orbit the --position camera around --center in IMAGES images")
+    path.add_argument("--keyframes", metavar="PATH", help="JSON list of keyframed camera poses")
+    parser.add_argument("--center", type=float, nargs=3, default=(0, 0, 0), metavar=("X", "Y", "Z"))
+    parser.add_argument("--images", type=int, default=None, help="Images of a --keyframes path")
+    parser.add_argument("--frames-per-image", type=int, default=16, help="Accumulated frames per image")
+    parser.add_argument("--encoders", type=int, default=None, help="Encoder threads, defaults to up to 4")
+    parser.add_argument("--report", default=None, metavar="PATH", help="Write the timing breakdown as JSON")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    job = RenderJob.from_args(args)
+    if args.turntable:
+        poses = turntable(job.camera, args.turntable, tuple(args.center))
+    else:
+        poses = keyframe_path(json.loads(Path(args.keyframes).read_text()), job.camera, args.images)
+
+    tracer = job.create_tracer(create_context(job.backend))
+    renderer = SequenceRenderer(tracer, args.encoders)
+    stats = renderer.render(poses, args.output, args.frames_per_image)
+    renderer.release()
+    print(stats.report(renderer.encoders))
+    if args.report:
+        report = {key: value for key, value in vars(stats).items() if key != "encode_times"}
+        Path(args.report).write_text(json.dumps({**report, "encoders": renderer.encoders}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
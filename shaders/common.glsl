@@ -0,0 +1,660 @@
+// Shared by the fragment (raytrace.glsl) and compute (wavefront/*.glsl) tracers, pulled in with #include
+
+// Samplers. The sampler state is one uint a path carries along, samplerType decides what Rand makes of it
+const int SAMPLER_RANDOM = 0;     // Triple32 hash chain
+const int SAMPLER_SOBOL = 1;      // Owen scrambled Sobol points, scrambled per pixel and dimension
+const int SAMPLER_BLUE_NOISE = 2; // Blue noise texture offset per sample along golden ratio sequences
+// The settings with an #ifdef are fixed at compile time by the shader variants of variants.py, which lets the
+// compiler drop the branches on them and unroll the loops they bound
+#ifdef SAMPLER_TYPE
+const int samplerType = SAMPLER_TYPE;
+#else
+uniform int samplerType;
+#endif
+// Tiled (r32f, BLUE_NOISE_SIZE in sampling.py) void and cluster ranks
+uniform sampler2D blueNoise;
+const uint BLUE_NOISE_MASK = 63u;
+
+// The sample of the pixel being traced counted across frames, the index into the sequences. Set by SampleSeed
+uint sampleNumber;
+
+uint Triple32(inout uint x)
+{
+    x ^= x >> 17;
+    x *= 0xed5ad4bbU;
+    x ^= x >> 11;
+    x *= 0xac4c1b51U;
+    x ^= x >> 15;
+    x *= 0x31848babU;
+    x ^= x >> 14;
+    return x;
+}
+
+// [0, 1) from the top 24 bits, never rounds up to 1
+float UnitFloat(uint x) {
+    return float(x >> 8) * (1.0 / 16777216.0);
+}
+
+// Burley 2020, Practical Hash-based Owen Scrambling
+uint LaineKarras(uint x, uint seed) {
+    x += seed;
+    x ^= x * 0x6c50b47cU;
+    x ^= x * 0xb82f1e52U;
+    x ^= x * 0xc7afe638U;
+    x ^= x * 0x8d22f6e6U;
+    return x;
+}
+
+uint NestedUniformScramble(uint x, uint seed) {
+    return bitfieldReverse(LaineKarras(bitfieldReverse(x), seed));
+}
+
+uint HashCombine(uint seed, uint value) {
+    return seed ^ (value + 0x9e3779b9U + (seed << 6) + (seed >> 2));
+}
+
+// Second Sobol dimension, bit reversed. Its generator matrix is the Pascal matrix mod 2, so output bit i
+// is the XOR of the index bits j whose positions contain i's (Lucas), a superset sum in five steps
+uint SobolDimension1Reversed(uint index) {
+    index ^= (index >> 1) & 0x55555555U;
+    index ^= (index >> 2) & 0x33333333U;
+    index ^= (index >> 4) & 0x0f0f0f0fU;
+    index ^= (index >> 8) & 0x00ff00ffU;
+    index ^= (index >> 16) & 0x0000ffffU;
+    return index;
+}
+
+// Sobol point sampleNumber in the first two dimensions, shuffled and scrambled by seed.
+// Both dimensions are made bit reversed, which NestedUniformScramble would otherwise reverse first
+uvec2 SobolPoint(uint seed) {
+    uint index = NestedUniformScramble(sampleNumber, seed);
+    return uvec2(
+        bitfieldReverse(LaineKarras(index, HashCombine(seed, 1u))),
+        bitfieldReverse(LaineKarras(SobolDimension1Reversed(index), HashCombine(seed, 2u)))
+    );
+}
+
+// Blue noise rank for the pixel packed in the low 12 bits of state, at an offset hashed from the dimension above.
+// Advances the dimension
+uint BlueNoise(inout uint state) {
+    uint offset = state >> 12;
+    Triple32(offset);
+    ivec2 texel = ivec2(uvec2(state + offset, (state >> 6) + (offset >> 6)) & BLUE_NOISE_MASK);
+    state += 1u << 12;
+    return uint(texelFetch(blueNoise, texel, 0).r * 4294967296.0);
+}
+
+// One dimension, stratified across samples by the low discrepancy samplers
+float Rand(inout uint state) {
+    if (samplerType == SAMPLER_BLUE_NOISE) {
+        // Golden ratio in 0.32 fixed point, the addition wraps around like fract()
+        return UnitFloat(BlueNoise(state) + sampleNumber * 0x9e3779b9U);
+    }
+    Triple32(state);
+    return UnitFloat((samplerType == SAMPLER_SOBOL) ? SobolPoint(state).x : state);
+}
+
+// Two dimensions stratified together, for the directions
+vec2 Rand2(inout uint state) {
+    if (samplerType == SAMPLER_BLUE_NOISE) {
+        // R2 sequence (Roberts 2018) in 0.32 fixed point
+        uint x = BlueNoise(state) + sampleNumber * 0xc13fa9a9U;
+        uint y = BlueNoise(state) + sampleNumber * 0x91e10da6U;
+        return vec2(UnitFloat(x), UnitFloat(y));
+    }
+    if (samplerType == SAMPLER_SOBOL) {
+        Triple32(state);
+        uvec2 point = SobolPoint(state);
+        return vec2(UnitFloat(point.x), UnitFloat(point.y));
+    }
+    float x = Rand(state);
+    float y = Rand(state);
+    return vec2(x, y);
+}
+
+bool RandProbability(inout uint state, float probability) {
+    return Rand(state) < probability;
+}
+
+// Uniformly distributed unit vector
+vec3 SphereDirection(vec2 u) {
+    float z = 1.0 - 2.0 * u.x;
+    float r = sqrt(max(0.0, 1.0 - z * z));
+    float phi = 6.28318530718 * u.y;
+    return vec3(r * cos(phi), r * sin(phi), z);
+}
+
+// Rotation taking z to the unit vector n (Duff et al. 2017)
+mat3 OrthonormalBasis(vec3 n) {
+    float s = (n.z >= 0.0) ? 1.0 : -1.0;
+    float a = -1.0 / (s + n.z);
+    float b = n.x * n.y * a;
+    return mat3(
+        vec3(1.0 + s * n.x * n.x * a, s * b, -s * n.x),
+        vec3(b, s + n.y * n.y * a, -n.y),
+        n
+    );
+}
+
+// Direction around normal with density cos(theta) / PI
+vec3 CosineDirection(vec3 normal, vec2 u) {
+    float r = sqrt(u.x);
+    float phi = 6.28318530718 * u.y;
+    return OrthonormalBasis(normal) * vec3(r * cos(phi), r * sin(phi), sqrt(max(0.0, 1.0 - u.x)));
+}
+
+// Structs
+struct Ray {
+    vec3 direction;
+    vec3 origin;
+};
+
+struct Material {
+    vec3 color;
+    float smoothness;
+    vec3 emissionColor;
+    float emissionStrength;
+};
+
+struct Sphere {
+    vec3 center;
+    float radius;
+    Material material;
+};
+
+// Packed on the CPU by BVH in bvh.py
+struct BVHNode {
+    vec3 boundsMin;
+    int leftFirst; // Left child for interior nodes, first index for leaves
+    vec3 boundsMax;
+    int count;     // 0 for interior nodes
+};
+
+// Packed on the CPU by LightList in lights.py
+struct Light {
+    int sphere;
+    float cdf; // Power of the lights up to and including this one over the total
+};
+
+struct Hit {
+    bool happened;
+    vec3 position;
+    vec3 normal;
+    float distance_;
+    Material material;
+    int sphere; // Index into spheres, set by the CalculateRayCollision functions
+};
+
+
+
+// uniforms and constants
+const float PI = 3.141592653589793;
+
+// Camera and scene settings of the frame, uploaded by FrameState in frame_state.py only when they change.
+// The layouts must match
+layout(std140, binding = 0) uniform FrameState {
+    vec3 position;
+    float fov;
+    vec3 forward;
+    float density;
+    vec3 right;
+    float skyboxLightStrength;
+    vec3 up;
+    int sphereAmount;
+
+    // View the history in prev was traced from, read by history.glsl
+    vec3 previousPosition;
+    float previousFov;
+    vec3 previousForward;
+    float historyLimit; // Samples a reprojected history is scaled down to, older samples of a moving view lag
+    vec3 previousRight;
+    float lightPower; // LightPower summed over the lights
+    vec3 previousUp;
+    int lightAmount;
+
+    vec2 resolution;
+    vec2 previousResolution;
+    int accumulationFrame;
+    int raysPerPixel;
+    // Samples traced into the accumulation before this frame, the frames before may have had other raysPerPixel
+    int sampleBase;
+    // Next event estimation, diffuse surfaces sample a light directly and weight it against the bounce with MIS
+    bool nextEventEstimation;
+    // Set when the camera moved since prev was traced, the history is then looked up where the previous camera
+    // saw the current first hit instead of at the same texel
+    bool reproject;
+
+    // Adaptive sampling, pixels whose relative error is below the threshold stop tracing
+    bool adaptiveSampling;
+    float adaptiveThreshold;
+    int adaptiveMinSamples;
+
+    // Path termination, see ContinuePath
+    bool russianRoulette;
+    int rouletteMinDepth;
+    float throughputThreshold;
+    bool pathStatistics; // Count path ends in PathStatistics
+};
+
+// Cleared every frame and read back by the Tracer
+layout(std430, binding = 3) buffer ConvergenceStats {
+    uint convergedPixels;
+    uint remainingSamples; // Estimated samples the unconverged pixels still need
+};
+
+#ifdef USE_VOLUME
+const bool useVolume = USE_VOLUME;
+#else
+uniform bool useVolume; // density > 0, without it the paths never scatter in the volume
+#endif
+// Packed on the CPU by SphereTable in spheres.py, the layouts must match
+layout(std430, binding = 0) readonly buffer SphereBuffer {
+    Sphere spheres[];
+};
+
+#ifdef USE_BVH
+const bool useBVH = USE_BVH;
+#else
+uniform bool useBVH;
+#endif
+layout(std430, binding = 1) readonly buffer BVHNodeBuffer {
+    BVHNode bvhNodes[];
+};
+layout(std430, binding = 2) readonly buffer BVHIndexBuffer {
+    int bvhIndices[];
+};
+// Deeper than MAX_DEPTH in bvh.py
+const int BVH_STACK_SIZE = 64;
+
+// The emissive spheres next event estimation samples
+layout(std430, binding = 9) readonly buffer LightBuffer {
+    Light lights[];
+};
+
+#ifdef MAX_BOUNCES
+const int maxBounceLimit = MAX_BOUNCES;
+#else
+uniform int maxBounceLimit;
+#endif
+
+// Why a path ended, the PATH_END_REASONS of path_statistics.py
+const int PATH_END_ESCAPED = 0;     // Missed every sphere
+const int PATH_END_ROULETTE = 1;
+const int PATH_END_THROUGHPUT = 2;
+const int PATH_END_BOUNCE_LIMIT = 3;
+const int PATH_END_REASONS = 4;
+// Bounces the counters tell apart, later ends are counted at the last one
+const int PATH_STATISTICS_DEPTHS = 64;
+// Paths by the bounce they ended at and why, cleared every frame and read back by PathStatistics
+layout(std430, binding = 10) buffer PathStatistics {
+    uint pathEnds[PATH_STATISTICS_DEPTHS * PATH_END_REASONS];
+};
+const float rayJitterStrength = 0.001;
+const int maxVolumeBounces = 2;
+
+
+Hit RaySphereIntersection(Ray ray, Sphere sphere) {
+    Hit hit;
+    hit.happened = false;
+
+    vec3 offsetRayOrigin = ray.origin - sphere.center;
+    // From the equation: sqrLength(rayOrigin + rayDir * dst) = radius^2
+    // Solving for dst results in a quadratic equation with coefficients:
+
+    float a = dot(ray.direction, ray.direction);
+    float b = 2 * dot(offsetRayOrigin, ray.direction);
+    float c = dot(offsetRayOrigin, offsetRayOrigin) - sphere.radius * sphere.radius;
+    // Quadratic discriminant
+    float discriminant = b * b - 4 * a * c;
+
+    // No solution when d < 0 (ray misses sphere)
+    if (discriminant >= 0) {
+        // Distance to nearest intersection point (from quadratic formula)
+        float dst = (-b - sqrt(discriminant)) / (2 * a);
+
+        // Ignore intersections that occur behind the ray
+        if (dst >= 0) {
+            hit.happened = true;
+            hit.distance_ = dst;
+            hit.position = ray.origin + ray.direction * dst;
+            hit.normal = normalize(hit.position - sphere.center);
+            hit.material = sphere.material;
+        }
+    }
+    return hit;
+}
+
+Hit CalculateRayCollision(Ray ray) {
+    Hit closestHit;
+    closestHit.happened = false;
+    closestHit.distance_ = 1e20;
+
+#ifdef SPHERE_BUCKET
+    // sphereAmount rounded up, a constant trip count bound
+    for (int i = 0; i < SPHERE_BUCKET && i < sphereAmount; i++) {
+#else
+    for (int i = 0; i < sphereAmount; i++) {
+#endif
+        Sphere sphere = spheres[i];
+        Hit hit = RaySphereIntersection(ray, sphere);
+        if (!hit.happened) {
+            continue;
+        }
+        if (hit.distance_ < closestHit.distance_) {
+            closestHit = hit;
+            closestHit.sphere = i;
+        }
+    }
+    return closestHit;
+}
+
+// Distance to where the ray enters the box, or 1e30 if it misses
+float RayBoxDistance(Ray ray, vec3 invDirection, vec3 boundsMin, vec3 boundsMax) {
+    vec3 t0 = (boundsMin - ray.origin) * invDirection;
+    vec3 t1 = (boundsMax - ray.origin) * invDirection;
+    vec3 tMin = min(t0, t1);
+    vec3 tMax = max(t0, t1);
+    float tNear = max(max(tMin.x, tMin.y), max(tMin.z, 0.0));
+    float tFar = min(min(tMax.x, tMax.y), tMax.z);
+    return (tFar >= tNear) ? tNear : 1e30;
+}
+
+Hit CalculateRayCollisionBVH(Ray ray) {
+    Hit closestHit;
+    closestHit.happened = false;
+    closestHit.distance_ = 1e20;
+
+    vec3 invDirection = 1.0 / ray.direction;
+
+    int nodeStack[BVH_STACK_SIZE];
+    float distanceStack[BVH_STACK_SIZE];
+    int stackSize = 0;
+
+    float rootDistance = RayBoxDistance(ray, invDirection, bvhNodes[0].boundsMin, bvhNodes[0].boundsMax);
+    if (rootDistance < closestHit.distance_) {
+        nodeStack[0] = 0;
+        distanceStack[0] = rootDistance;
+        stackSize = 1;
+    }
+
+    while (stackSize > 0) {
+        stackSize--;
+        // A closer hit may have been found since this node was pushed
+        if (distanceStack[stackSize] >= closestHit.distance_) {
+            continue;
+        }
+        BVHNode node = bvhNodes[nodeStack[stackSize]];
+
+        if (node.count > 0) {
+            for (int i = node.leftFirst; i < node.leftFirst + node.count; i++) {
+                Hit hit = RaySphereIntersection(ray, spheres[bvhIndices[i]]);
+                if (hit.happened && hit.distance_ < closestHit.distance_) {
+                    closestHit = hit;
+                    closestHit.sphere = bvhIndices[i];
+                }
+            }
+            continue;
+        }
+
+        int nearChild = node.leftFirst;
+        int farChild = node.leftFirst + 1;
+        float nearDistance = RayBoxDistance(ray, invDirection, bvhNodes[nearChild].boundsMin, bvhNodes[nearChild].boundsMax);
+        float farDistance = RayBoxDistance(ray, invDirection, bvhNodes[farChild].boundsMin, bvhNodes[farChild].boundsMax);
+        if (nearDistance > farDistance) {
+            int swapChild = nearChild; nearChild = farChild; farChild = swapChild;
+            float swapDistance = nearDistance; nearDistance = farDistance; farDistance = swapDistance;
+        }
+
+        // Push the far child first so the near one is visited first
+        if (farDistance < closestHit.distance_) {
+            nodeStack[stackSize] = farChild;
+            distanceStack[stackSize] = farDistance;
+            stackSize++;
+        }
+        if (nearDistance < closestHit.distance_) {
+            nodeStack[stackSize] = nearChild;
+            distanceStack[stackSize] = nearDistance;
+            stackSize++;
+        }
+    }
+    return closestHit;
+}
+
+vec3 GetEnvironmentLight(Ray ray) {
+    float y = ray.direction.y;
+    vec3 color;
+    if (y<0) {
+        color = vec3(.35);
+    } else {
+
+        float bias = min(1, pow(y, 0.5) * 2);
+        color = mix(vec3(.8), vec3(.5, .55, .65), bias);
+    }
+    return color * skyboxLightStrength;
+}
+
+
+float TraverseVolume(Ray from, float distance_, inout uint rngState) {
+    if (!useVolume) {
+        return -1.0;
+    }
+    float rayLength = distance_;
+    float scatterPos = -log(1 - Rand(rngState)) / density;
+    return (scatterPos < rayLength) ? scatterPos : -1.0;
+}
+
+Ray BounceRayVolume(Ray ray, vec3 position, inout uint rngState) {
+    vec3 scatterDirection = SphereDirection(Rand2(rngState));
+    ray.origin = position;
+    ray.direction = scatterDirection;
+    // ray.direction = normalize(scatterDirection + ray.direction);
+    return ray;
+}
+
+Ray BounceRaySurface(Ray ray, Hit hit, inout uint rngState) {
+    vec3 diffuse = CosineDirection(hit.normal, Rand2(rngState));
+    vec3 specular = reflect(ray.direction, hit.normal);
+    ray.direction = mix(diffuse, specular, hit.material.smoothness);
+    ray.origin = hit.position;
+    return ray;
+}
+
+float Luminance(vec3 color) {
+    return dot(color, vec3(0.2126, 0.7152, 0.0722));
+}
+
+// Emitted radiance times surface area (without 4 PI), what lights are picked proportionally to
+float LightPower(Sphere sphere) {
+    return sphere.material.emissionStrength * Luminance(sphere.material.emissionColor) * sphere.radius * sphere.radius;
+}
+
+// Index of the first light whose cdf is above u
+int SampleLightIndex(float u) {
+    int low = 0;
+    int high = lightAmount - 1;
+    while (low < high) {
+        int middle = (low + high) / 2;
+        if (lights[middle].cdf > u) {
+            high = middle;
+        } else {
+            low = middle + 1;
+        }
+    }
+    return low;
+}
+
+// 1 - cos of the half angle of the cone a sphere covers seen from position, 0 from inside it
+float SphereConeSize(vec3 position, Sphere sphere) {
+    vec3 toCenter = sphere.center - position;
+    float sinSquared = sphere.radius * sphere.radius / dot(toCenter, toCenter);
+    if (sinSquared >= 1.0) {
+        return 0.0;
+    }
+    // 1 - sqrt(1 - x) without the cancellation for small, distant lights
+    return sinSquared / (1.0 + sqrt(1.0 - sinSquared));
+}
+
+// Solid angle density of SampleDirectLight choosing a direction from position towards sphere
+float LightPdf(vec3 position, Sphere sphere) {
+    float coneSize = SphereConeSize(position, sphere);
+    if (coneSize <= 0.0) {
+        return 0.0;
+    }
+    return LightPower(sphere) / lightPower / (2.0 * PI * coneSize);
+}
+
+float PowerHeuristic(float pdf, float otherPdf) {
+    return pdf * pdf / (pdf * pdf + otherPdf * otherPdf);
+}
+
+// Light reaching a diffuse surface straight from a light picked by power, through a uniformly sampled direction
+// in the cone the light covers. Weighted against the cosine weighted bounce finding the same light, the caller
+// multiplies in the surface color. volumeBounces decides whether the volume may still scatter the shadow ray
+vec3 SampleDirectLight(Hit hit, int volumeBounces, inout uint rngState) {
+    int lightSphere = lights[SampleLightIndex(Rand(rngState))].sphere;
+    vec2 u = Rand2(rngState);
+
+    Sphere light = spheres[lightSphere];
+    float coneSize = SphereConeSize(hit.position, light);
+    if (lightSphere == hit.sphere || coneSize <= 0.0) {
+        return vec3(0);
+    }
+
+    float cosTheta = 1.0 - u.x * coneSize;
+    float sinTheta = sqrt(max(0.0, 1.0 - cosTheta * cosTheta));
+    float phi = 2.0 * PI * u.y;
+    mat3 basis = OrthonormalBasis(normalize(light.center - hit.position));
+    vec3 direction = normalize(basis * vec3(cos(phi) * sinTheta, sin(phi) * sinTheta, cosTheta));
+
+    float cosSurface = dot(hit.normal, direction);
+    if (cosSurface <= 0.0) {
+        return vec3(0);
+    }
+    Ray shadowRay = Ray(direction, hit.position);
+    Hit shadowHit = useBVH ? CalculateRayCollisionBVH(shadowRay) : CalculateRayCollision(shadowRay);
+    if (!shadowHit.happened || shadowHit.sphere != lightSphere) {
+        return vec3(0);
+    }
+
+    // The unscattered bounce reaches the light with the probability of not scattering in the volume first
+    float transmittance = (volumeBounces < maxVolumeBounces) ? exp(-density * shadowHit.distance_) : 1.0;
+    float lightPdf = LightPdf(hit.position, light);
+    float bouncePdf = cosSurface / PI;
+    float weight = cosSurface / PI / lightPdf * transmittance * PowerHeuristic(lightPdf, bouncePdf);
+    return light.material.emissionColor * light.material.emissionStrength * weight;
+}
+
+// MIS weight of emission found by a bounce whose direction had density bouncePdf, 0 if no light was sampled there
+float EmissionWeight(vec3 origin, Hit hit, float bouncePdf) {
+    if (bouncePdf <= 0.0 || !hit.happened) {
+        return 1.0;
+    }
+    return PowerHeuristic(bouncePdf, LightPdf(origin, spheres[hit.sphere]));
+}
+
+// Decides after bounce whether the path traces another ray, false ends it with the reason in endReason.
+// Paths whose throughput is at most throughputThreshold end, which only biases the image for thresholds above 0.
+// After rouletteMinDepth bounces Russian roulette ends a path with one minus its largest throughput component as
+// the probability and weights the survivors up by the inverse, which leaves the expected image unchanged
+bool ContinuePath(int bounce, inout vec3 throughput, inout uint rngState, out int endReason) {
+    float survival = max(throughput.r, max(throughput.g, throughput.b));
+    if (survival <= throughputThreshold) {
+        endReason = PATH_END_THROUGHPUT;
+        return false;
+    }
+    if (russianRoulette && bounce + 1 >= rouletteMinDepth) {
+        survival = min(survival, 1.0);
+        if (Rand(rngState) >= survival) {
+            endReason = PATH_END_ROULETTE;
+            return false;
+        }
+        throughput /= survival;
+    }
+    return true;
+}
+
+void CountPathEnd(int bounce, int endReason) {
+    if (pathStatistics) {
+        atomicAdd(pathEnds[min(bounce, PATH_STATISTICS_DEPTHS - 1) * PATH_END_REASONS + endReason], 1u);
+    }
+}
+
+// Whether SampleDirectLight handles the surface, the mixed diffuse and mirror bounce of smooth surfaces has no density
+bool SamplesLights(Hit hit) {
+    return nextEventEstimation && hit.material.smoothness == 0.0;
+}
+
+// Denoiser guides from the first hit of a camera ray, misses face the camera from very far away
+vec4 GeometryGuide(Ray ray, Hit hit) {
+    return hit.happened ? vec4(hit.normal, hit.distance_) : vec4(-ray.direction, 1e20);
+}
+
+vec4 AlbedoGuide(Hit hit) {
+    return vec4(hit.happened ? hit.material.color : vec3(1), 1);
+}
+
+// Standard error of the mean luminance relative to the mean
+float RelativeError(vec4 sum, float squaredSum) {
+    float n = sum.a;
+    float mean = Luminance(sum.rgb) / n;
+    float variance = max(squaredSum / n - mean * mean, 0.0) * n / max(n - 1.0, 1.0);
+    return sqrt(variance / n) / (mean + 0.01);
+}
+
+// Decides whether a pixel still needs samples and counts it in ConvergenceStats
+bool PixelConverged(vec4 history, float historyMoment) {
+    if (!adaptiveSampling) {
+        return false;
+    }
+    if (history.a < adaptiveMinSamples) {
+        atomicAdd(remainingSamples, uint(adaptiveMinSamples - history.a));
+        return false;
+    }
+    float relativeError = RelativeError(history, historyMoment);
+    if (relativeError < adaptiveThreshold) {
+        atomicAdd(convergedPixels, 1u);
+        return true;
+    }
+    // The error falls with 1 / sqrt(samples)
+    float ratio = relativeError / adaptiveThreshold;
+    atomicAdd(remainingSamples, uint(min(history.a * (ratio * ratio - 1.0), 65536.0)));
+    return false;
+}
+
+uint SampleNumber(int frameSample) {
+    return uint(sampleBase + frameSample);
+}
+
+// Sets sampleNumber to sample frameSample of the current frame and returns the sampler state its path starts with
+uint SampleSeed(vec2 fragCoord, int frameSample) {
+    sampleNumber = SampleNumber(frameSample);
+    if (samplerType == SAMPLER_BLUE_NOISE) {
+        // Tile texel, BlueNoise counts dimensions above it
+        uvec2 texel = uvec2(fragCoord) & BLUE_NOISE_MASK;
+        return texel.x | (texel.y << 6);
+    }
+    uint seed = uint(fragCoord.y * resolution.x + fragCoord.x);
+    Triple32(seed);
+    // Sobol scrambles a pixel the same way every sample, the hash chain needs a new start instead
+    return (samplerType == SAMPLER_SOBOL) ? seed : seed + sampleNumber;
+}
+
+// Jittered camera ray through a pixel center
+Ray CameraRay(vec2 fragCoord, inout uint rngState) {
+    float aspect = resolution.x / resolution.y;
+    vec2 uv = fragCoord / resolution;
+    vec2 ndc = uv * 2.0 - 1.0;
+    ndc.x *= aspect;
+    ndc.y *= -1.0;
+
+    float focalLength = 1 / tan(radians(fov) * 0.5);
+    vec3 baseRayDirection = vec3(ndc, focalLength);
+
+    mat3 rayScreenToWorld = mat3(right, up, forward);
+
+    vec3 rayJitter = SphereDirection(Rand2(rngState)) * rayJitterStrength;
+    vec3 rayDirection = normalize(rayJitter + baseRayDirection);
+    vec3 rayDirectionWorld = rayScreenToWorld * rayDirection;
+
+    return Ray(rayDirectionWorld, position);
+}
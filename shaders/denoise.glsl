@@ -0,0 +1,100 @@
+#version 450
+out vec4 fragment;
+
+// One pass of the edge-avoiding a-trous wavelet filter, run by Denoiser in denoise.py.
+// Filters irradiance (radiance over the first hit color) so texture detail stays sharp,
+// with 5x5 taps spaced stepSize apart that are weighted down across normal, depth and color edges.
+
+// Accumulation (radiance sum and sample count) in the first pass, the previous pass's irradiance after
+uniform sampler2D source;
+// Accumulation again, the last pass blends the filtered image with it
+uniform sampler2D accumulation;
+// G-buffer written by the trace pass
+uniform sampler2D normalDepth;
+uniform sampler2D albedo;
+
+uniform ivec2 sourceSize; // Traced part of the textures
+uniform int stepSize;
+uniform bool firstPass;
+uniform bool lastPass;
+
+// Frames after which the filtered image only counts half, strength falls off with a pixel's sample count
+// so reprojected history that kept its samples is filtered less than disoccluded pixels
+uniform float falloff;
+uniform int raysPerPixel;
+uniform float colorSigma;
+uniform float normalSigma;
+uniform float depthSigma;
+
+// B3 spline, 1/16 1/4 3/8 1/4 1/16
+const float kernel[3] = float[3](3.0 / 8.0, 1.0 / 4.0, 1.0 / 16.0);
+
+float Luminance(vec3 color) {
+    return dot(color, vec3(0.2126, 0.7152, 0.0722));
+}
+
+vec3 Albedo(ivec2 texel) {
+    return max(texelFetch(albedo, texel, 0).rgb, vec3(1e-3));
+}
+
+// 1 for a single frame of samples, falling towards 0 as samples accumulate
+float Strength(ivec2 texel) {
+    float frames = texelFetch(accumulation, texel, 0).a / float(raysPerPixel);
+    return falloff / (falloff + max(frames - 1.0, 0.0));
+}
+
+vec3 Irradiance(ivec2 texel) {
+    vec4 value = texelFetch(source, texel, 0);
+    if (firstPass) {
+        return value.rgb / max(value.a, 1.0) / Albedo(texel);
+    }
+    return value.rgb;
+}
+
+void main() {
+    ivec2 texel = ivec2(gl_FragCoord.xy);
+    if (any(greaterThanEqual(texel, sourceSize))) {
+        fragment = vec4(0);
+        return;
+    }
+
+    vec3 center = Irradiance(texel);
+    vec4 centerGeometry = texelFetch(normalDepth, texel, 0);
+    float centerLuminance = Luminance(center);
+    float strength = Strength(texel);
+
+    vec3 sum = vec3(0);
+    float weightSum = 0.0;
+    for (int y = -2; y <= 2; y++) {
+        for (int x = -2; x <= 2; x++) {
+            ivec2 tap = texel + ivec2(x, y) * stepSize;
+            if (any(lessThan(tap, ivec2(0))) || any(greaterThanEqual(tap, sourceSize))) {
+                continue;
+            }
+            vec3 color = Irradiance(tap);
+            vec4 geometry = texelFetch(normalDepth, tap, 0);
+
+            float normalWeight = pow(max(dot(centerGeometry.xyz, geometry.xyz), 0.0), normalSigma);
+            // Relative depth, so the edge stop doesn't depend on the scene's scale
+            float depthWeight = exp(-abs(centerGeometry.w - geometry.w) / (depthSigma * centerGeometry.w + 1e-4));
+            // Noise is larger at low sample counts, so the color stop widens with strength
+            float colorWeight = exp(
+                -abs(centerLuminance - Luminance(color)) / (colorSigma * strength * (centerLuminance + 0.05))
+            );
+
+            float weight = kernel[abs(x)] * kernel[abs(y)] * normalWeight * depthWeight * colorWeight;
+            sum += color * weight;
+            weightSum += weight;
+        }
+    }
+    // The center tap always has weight, weightSum > 0
+    vec3 filtered = sum / weightSum;
+
+    if (lastPass) {
+        vec4 unfiltered = texelFetch(accumulation, texel, 0);
+        vec3 radiance = mix(unfiltered.rgb / max(unfiltered.a, 1.0), filtered * Albedo(texel), strength);
+        fragment = vec4(radiance, 1);
+    } else {
+        fragment = vec4(filtered, 1);
+    }
+}
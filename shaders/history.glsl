@@ -0,0 +1,97 @@
+// The previous accumulation frame (fbo_prev) the trace passes add to, included after common.glsl
+
+uniform sampler2D prev; // RGBA32F radiance sum and sample count
+uniform sampler2D prevMoments;
+uniform sampler2D prevNormalDepth;
+uniform sampler2D prevAlbedo;
+
+// reproject, historyLimit and the previous* view are part of the FrameState block of common.glsl
+
+// Reprojected history taps whose first hit distance differs more than this fraction are disocclusions
+const float reprojectionDepthTolerance = 0.02;
+const float reprojectionNormalTolerance = 0.9;
+
+void ReadHistory(ivec2 texel, out vec4 history, out float historyMoment) {
+    history = (accumulationFrame > 1) ? texelFetch(prev, texel, 0) : vec4(0);
+    historyMoment = (accumulationFrame > 1) ? texelFetch(prevMoments, texel, 0).r : 0.0;
+}
+
+// Direction through a pixel center without the jitter of CameraRay
+vec3 CameraDirection(vec2 fragCoord) {
+    vec2 ndc = fragCoord / resolution * 2.0 - 1.0;
+    ndc.x *= resolution.x / resolution.y;
+    ndc.y *= -1.0;
+    float focalLength = 1 / tan(radians(fov) * 0.5);
+    return mat3(right, up, forward) * normalize(vec3(ndc, focalLength));
+}
+
+// Inverse of CameraDirection for the previous camera, pixel coordinates in xy and the depth along its forward in z
+vec3 PreviousPixel(vec3 direction) {
+    vec3 cameraSpace = vec3(dot(direction, previousRight), dot(direction, previousUp), dot(direction, previousForward));
+    float focalLength = 1 / tan(radians(previousFov) * 0.5);
+    vec2 ndc = cameraSpace.xy / cameraSpace.z * focalLength;
+    ndc.x /= previousResolution.x / previousResolution.y;
+    ndc.y *= -1.0;
+    return vec3((ndc * 0.5 + 0.5) * previousResolution, cameraSpace.z);
+}
+
+// Whether the previous first hit at tap is the surface (or sky) of the current first hit
+bool HistoryMatches(ivec2 tap, vec4 normalDepth, float expectedDepth) {
+    if (any(lessThan(tap, ivec2(0))) || any(greaterThanEqual(tap, ivec2(previousResolution)))) {
+        return false;
+    }
+    vec4 previous = texelFetch(prevNormalDepth, tap, 0);
+    if (normalDepth.w >= 1e19) {
+        return previous.w >= 1e19;
+    }
+    return abs(previous.w - expectedDepth) < reprojectionDepthTolerance * expectedDepth
+        && dot(previous.xyz, normalDepth.xyz) > reprojectionNormalTolerance;
+}
+
+// History of the current first hit (its G-buffer normalDepth) as seen by the previous camera, blended bilinearly
+// from the texels that saw the same surface. Empty where the surface was hidden or off screen
+void ReprojectHistory(vec2 fragCoord, vec4 normalDepth, out vec4 history, out float historyMoment) {
+    history = vec4(0);
+    historyMoment = 0.0;
+
+    // Misses store the direction back to the camera, the sky only depends on the direction
+    vec3 direction = -normalDepth.xyz;
+    float expectedDepth = 0.0;
+    if (normalDepth.w < 1e19) {
+        direction = position + CameraDirection(fragCoord) * normalDepth.w - previousPosition;
+        expectedDepth = length(direction);
+    }
+    vec3 previousPixel = PreviousPixel(direction);
+    if (previousPixel.z <= 0.0) {
+        return;
+    }
+
+    vec2 source = previousPixel.xy - 0.5;
+    ivec2 base = ivec2(floor(source));
+    vec2 fraction = source - floor(source);
+    float weightSum = 0.0;
+    for (int i = 0; i < 4; i++) {
+        ivec2 offset = ivec2(i & 1, i >> 1);
+        vec2 bilinear = mix(1.0 - fraction, fraction, vec2(offset));
+        float weight = bilinear.x * bilinear.y;
+        if (weight <= 0.0 || !HistoryMatches(base + offset, normalDepth, expectedDepth)) {
+            continue;
+        }
+        history += texelFetch(prev, base + offset, 0) * weight;
+        historyMoment += texelFetch(prevMoments, base + offset, 0).r * weight;
+        weightSum += weight;
+    }
+    if (weightSum < 0.01) {
+        history = vec4(0);
+        historyMoment = 0.0;
+        return;
+    }
+    history /= weightSum;
+    historyMoment /= weightSum;
+
+    if (history.a > historyLimit) {
+        float scale = historyLimit / history.a;
+        history *= scale;
+        historyMoment *= scale;
+    }
+}
@@ -1,4 +1,4 @@
-#version 460
+#version 450
 
 const vec3 quadVertecies[6] = vec3[6](
     vec3(1, -1, 0), 
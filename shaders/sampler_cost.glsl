@@ -0,0 +1,43 @@
+#version 450
+layout(local_size_x = 256) in;
+
+// Per sample cost of the samplers for bench.py, every thread draws bounce directions and nothing else
+#include "common.glsl"
+
+uniform int draws;
+// Draws with the Box-Muller directions the samplers replaced instead of samplerType
+uniform bool legacy;
+
+layout(std430, binding = 0) writeonly buffer Result {
+    vec4 results[];
+};
+
+float LegacyRandGaussian(inout uint state) {
+    float u1 = max(Rand(state), 1e-6);
+    float u2 = Rand(state);
+    return sqrt(-2.0 * log(u1)) * cos(6.28318530718 * u2);
+}
+
+vec3 LegacyRandDirection(inout uint state) {
+    float x = LegacyRandGaussian(state);
+    float y = LegacyRandGaussian(state);
+    float z = LegacyRandGaussian(state);
+    return normalize(vec3(x, y, z));
+}
+
+void main() {
+    uint thread = gl_GlobalInvocationID.x;
+    vec2 fragCoord = vec2(thread % 1024u, thread / 1024u) + 0.5;
+    vec3 normal = normalize(vec3(fragCoord, 1.0));
+    vec3 sum = vec3(0);
+    for (int i = 0; i < draws; i++) {
+        uint rngState = SampleSeed(fragCoord, i);
+        if (legacy) {
+            sum += normalize(normal + LegacyRandDirection(rngState));
+        } else {
+            sum += CosineDirection(normal, Rand2(rngState));
+        }
+    }
+    // Written so the draws aren't optimized away
+    results[thread] = vec4(sum, 0);
+}
@@ -0,0 +1,36 @@
+#version 450
+out vec4 fragment;
+
+// Radiance sum in rgb and sample count in alpha, written by raytrace.glsl
+uniform sampler2D accumulation;
+// Traced part of the accumulation texture and its size relative to the output, below 1 while scaled down
+uniform ivec2 sourceSize;
+uniform vec2 sourceScale;
+
+vec3 ACESFilm(vec3 x) {
+    const float a = 2.51;
+    const float b = 0.03;
+    const float c = 2.43;
+    const float d = 0.59;
+    const float e = 0.14;
+    return clamp((x * (a * x + b)) / (x * (c * x + d) + e), 0.0, 1.0);
+}
+
+vec3 Radiance(ivec2 texel) {
+    vec4 sum = texelFetch(accumulation, clamp(texel, ivec2(0), sourceSize - 1), 0);
+    return sum.rgb / max(sum.a, 1.0);
+}
+
+void main() {
+    // Bilinear upscale, at full scale the weights are 0 and this is a single texel fetch
+    vec2 source = gl_FragCoord.xy * sourceScale - 0.5;
+    ivec2 texel = ivec2(floor(source));
+    vec2 weight = source - floor(source);
+
+    vec3 radiance = mix(
+        mix(Radiance(texel), Radiance(texel + ivec2(1, 0)), weight.x),
+        mix(Radiance(texel + ivec2(0, 1)), Radiance(texel + ivec2(1, 1)), weight.x),
+        weight.y
+    );
+    fragment = vec4(ACESFilm(radiance), 1);
+}
@@ -0,0 +1,40 @@
+#version 450
+layout(local_size_x = 8, local_size_y = 8) in;
+
+#include "../common.glsl"
+#include "../history.glsl"
+#include "state.glsl"
+
+layout(rgba32f, binding = 0) uniform writeonly image2D accumulation;
+layout(r32f, binding = 1) uniform writeonly image2D accumulationMoments;
+// Read for reprojection, extend wrote this frame's first hits
+layout(rgba32f, binding = 2) uniform image2D gNormalDepth;
+layout(rgba16f, binding = 3) uniform writeonly image2D gAlbedo;
+
+// Adds the frame's samples to the history, the compute version of the outputs of raytrace.glsl
+void main() {
+    if (any(greaterThanEqual(gl_GlobalInvocationID.xy, uvec2(region.zw)))) {
+        return;
+    }
+    uint pixel = gl_GlobalInvocationID.y * uint(region.z) + gl_GlobalInvocationID.x;
+    ivec2 texel = region.xy + ivec2(gl_GlobalInvocationID.xy);
+    vec4 history;
+    float historyMoment;
+    if (reproject) {
+        ReprojectHistory(vec2(texel) + 0.5, imageLoad(gNormalDepth, texel), history, historyMoment);
+    } else {
+        ReadHistory(texel, history, historyMoment);
+    }
+
+    PixelState state = pixelStates[pixel];
+    if (state.sampling == 0u) {
+        // Converged, keep the history, extend wrote no G-buffer either
+        imageStore(accumulation, texel, history);
+        imageStore(accumulationMoments, texel, vec4(historyMoment, 0, 0, 0));
+        imageStore(gNormalDepth, texel, texelFetch(prevNormalDepth, texel, 0));
+        imageStore(gAlbedo, texel, texelFetch(prevAlbedo, texel, 0));
+        return;
+    }
+    imageStore(accumulation, texel, history + vec4(state.light, raysPerPixel));
+    imageStore(accumulationMoments, texel, vec4(historyMoment + state.squaredLuminance, 0, 0, 0));
+}
@@ -0,0 +1,26 @@
+#version 450
+layout(local_size_x = 256) in;
+
+#include "../common.glsl"
+#include "state.glsl"
+
+// Set for the camera rays of the first sample, whose hits are the denoiser's G-buffer
+uniform bool primaryRays;
+layout(rgba32f, binding = 2) uniform writeonly image2D gNormalDepth;
+layout(rgba16f, binding = 3) uniform writeonly image2D gAlbedo;
+
+// Finds the closest hit of every queued path
+void main() {
+    uint index = gl_GlobalInvocationID.x;
+    if (index >= inCount) {
+        return;
+    }
+    Ray ray = Ray(inPaths[index].direction, inPaths[index].origin);
+    Hit hit = useBVH ? CalculateRayCollisionBVH(ray) : CalculateRayCollision(ray);
+    if (primaryRays) {
+        ivec2 texel = PixelTexel(inPaths[index].pixel);
+        imageStore(gNormalDepth, texel, GeometryGuide(ray, hit));
+        imageStore(gAlbedo, texel, AlbedoGuide(hit));
+    }
+    hits[index] = PathHit(hit.position, hit.distance_, hit.normal, hit.happened ? hit.sphere : -1);
+}
@@ -0,0 +1,49 @@
+#version 450
+layout(local_size_x = 8, local_size_y = 8) in;
+
+#include "../common.glsl"
+#include "../history.glsl"
+#include "state.glsl"
+
+// Starts sample sampleIndex of every pixel that is still sampling by queueing its camera ray
+void main() {
+    if (any(greaterThanEqual(gl_GlobalInvocationID.xy, uvec2(region.zw)))) {
+        return;
+    }
+    uint pixel = gl_GlobalInvocationID.y * uint(region.z) + gl_GlobalInvocationID.x;
+    ivec2 texel = region.xy + ivec2(gl_GlobalInvocationID.xy);
+    vec2 fragCoord = vec2(texel) + 0.5;
+
+    PixelState state;
+    if (sampleIndex == 0) {
+        state.light = vec3(0);
+        state.squaredLuminance = 0.0;
+        state.sampling = 1u;
+        // A reprojected history is only known in accumulate, after the first hit, every pixel traces
+        if (!reproject) {
+            vec4 history;
+            float historyMoment;
+            ReadHistory(texel, history, historyMoment);
+            state.sampling = PixelConverged(history, historyMoment) ? 0u : 1u;
+        }
+        pixelStates[pixel] = state;
+    } else {
+        state = pixelStates[pixel];
+    }
+    if (state.sampling == 0u) {
+        return;
+    }
+
+    uint rngState = SampleSeed(fragCoord, sampleIndex);
+    Ray ray = CameraRay(fragCoord, rngState);
+    PathState path;
+    path.origin = ray.origin;
+    path.pixel = pixel;
+    path.direction = ray.direction;
+    path.rngState = rngState;
+    path.throughput = vec3(1);
+    path.volumeBounces = 0;
+    path.light = vec3(0);
+    path.bouncePdf = 0.0;
+    outPaths[atomicAdd(outCount, 1u)] = path;
+}
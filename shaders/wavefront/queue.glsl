@@ -0,0 +1,14 @@
+#version 450
+layout(local_size_x = 1) in;
+
+#include "../common.glsl"
+#include "state.glsl"
+
+// Runs after the queues were swapped, the paths appended to OutQueue become the input of the next passes
+void main() {
+    inCount = outCount;
+    outCount = 0u;
+    dispatchSize[0] = (inCount + 255u) / 256u;
+    dispatchSize[1] = 1u;
+    dispatchSize[2] = 1u;
+}
@@ -0,0 +1,44 @@
+#version 450
+layout(local_size_x = 256) in;
+
+#include "../common.glsl"
+#include "state.glsl"
+
+// Samples a light from the surfaces the paths hit, bounces off them and compacts the survivors into OutQueue
+void main() {
+    bool lastBounce = bounce == maxBounceLimit;
+    uint index = gl_GlobalInvocationID.x;
+    if (index >= inCount || hits[index].sphere < 0) {
+        return;
+    }
+    PathState path = inPaths[index];
+    PathHit pathHit = hits[index];
+    sampleNumber = SampleNumber(sampleIndex);
+
+    Hit hit;
+    hit.happened = true;
+    hit.position = pathHit.position;
+    hit.normal = pathHit.normal;
+    hit.distance_ = pathHit.distance_;
+    hit.material = spheres[pathHit.sphere].material;
+    hit.sphere = pathHit.sphere;
+
+    bool sampleLights = SamplesLights(hit) && !lastBounce;
+    if (sampleLights) {
+        path.light += SampleDirectLight(hit, path.volumeBounces, path.rngState) * path.throughput;
+    }
+
+    // Bounce on the last hit too, raytrace.glsl does
+    Ray ray = BounceRaySurface(Ray(path.direction, path.origin), hit, path.rngState);
+    path.origin = ray.origin;
+    path.direction = ray.direction;
+    path.bouncePdf = sampleLights ? dot(hit.normal, ray.direction) / PI : 0.0;
+
+    int endReason = PATH_END_BOUNCE_LIMIT;
+    if (lastBounce || !ContinuePath(bounce, path.throughput, path.rngState, endReason)) {
+        CountPathEnd(bounce, endReason);
+        FinishPath(path);
+    } else {
+        outPaths[atomicAdd(outCount, 1u)] = path;
+    }
+}
@@ -0,0 +1,44 @@
+#version 450
+layout(local_size_x = 256) in;
+
+#include "../common.glsl"
+#include "state.glsl"
+
+// Scatters paths in the volume, then finishes the ones that missed with the sky light and adds MIS weighted emission to the others
+void main() {
+    uint index = gl_GlobalInvocationID.x;
+    if (index >= inCount) {
+        return;
+    }
+    PathState path = inPaths[index];
+    PathHit hit = hits[index];
+    sampleNumber = SampleNumber(sampleIndex);
+    Ray ray = Ray(path.direction, path.origin);
+
+    float emissionWeight = 1.0;
+    if (hit.sphere >= 0 && path.bouncePdf > 0.0) {
+        emissionWeight = PowerHeuristic(path.bouncePdf, LightPdf(path.origin, spheres[hit.sphere]));
+    }
+    float volumeTravelDistance = TraverseVolume(ray, hit.distance_, path.rngState);
+    if (volumeTravelDistance != -1.0 && path.volumeBounces < maxVolumeBounces) {
+        vec3 volumeScatterPosition = ray.origin + ray.direction * volumeTravelDistance;
+        ray = BounceRayVolume(ray, volumeScatterPosition, path.rngState);
+        path.volumeBounces++;
+        emissionWeight = 1.0;
+    }
+    path.origin = ray.origin;
+    path.direction = ray.direction;
+
+    if (hit.sphere < 0) {
+        path.light += GetEnvironmentLight(ray) * path.throughput;
+        CountPathEnd(bounce, PATH_END_ESCAPED);
+        FinishPath(path);
+        return;
+    }
+
+    Material material = spheres[hit.sphere].material;
+    vec3 emittedLight = material.emissionColor * material.emissionStrength;
+    path.light += emittedLight * path.throughput * emissionWeight;
+    path.throughput *= material.color;
+    inPaths[index] = path;
+}
@@ -0,0 +1,61 @@
+// Ray queues and per pixel state of the wavefront tracer, the sizes must match WavefrontTracer in wavefront.py
+
+// One path (sample) in flight, 64 bytes
+struct PathState {
+    vec3 origin;
+    uint pixel; // Index into pixelStates
+    vec3 direction;
+    uint rngState;
+    vec3 throughput;
+    int volumeBounces;
+    vec3 light; // Radiance gathered by this sample so far
+    float bouncePdf; // Density of the last bounce direction if it also sampled a light, see Trace in raytrace.glsl
+};
+
+// Closest hit of the path at the same queue index, 32 bytes. The material is read from spheres
+struct PathHit {
+    vec3 position;
+    float distance_;
+    vec3 normal;
+    int sphere; // -1 if the ray missed
+};
+
+// Sums of a pixel over the samples of this frame, 32 bytes
+struct PixelState {
+    vec3 light;
+    float squaredLuminance;
+    uint sampling; // 0 once adaptive sampling considers the pixel converged
+};
+
+layout(std430, binding = 4) buffer PixelBuffer {
+    PixelState pixelStates[];
+};
+layout(std430, binding = 5) buffer InQueue {
+    PathState inPaths[];
+};
+layout(std430, binding = 6) buffer OutQueue {
+    PathState outPaths[];
+};
+layout(std430, binding = 7) buffer HitBuffer {
+    PathHit hits[];
+};
+layout(std430, binding = 8) buffer QueueCounters {
+    uint inCount;
+    uint outCount;
+    uint dispatchSize[3]; // Indirect dispatch arguments covering the paths in InQueue
+};
+
+uniform ivec4 region; // x, y, width and height of the pixels traced by this batch
+uniform int sampleIndex; // Sample of the frame the paths in flight belong to
+uniform int bounce; // Bounce of the paths in flight, the loop index of Trace in raytrace.glsl
+
+ivec2 PixelTexel(uint pixel) {
+    return region.xy + ivec2(pixel % uint(region.z), pixel / uint(region.z));
+}
+
+// Adds a finished sample to its pixel, a pixel never has more than one path in flight
+void FinishPath(PathState path) {
+    float luminance = Luminance(path.light);
+    pixelStates[path.pixel].light += path.light;
+    pixelStates[path.pixel].squaredLuminance += luminance * luminance;
+}
@@ -0,0 +1,315 @@
+import numpy as np
+from glm import vec3
+
+from dclasses import Sphere, Material
+
+
+# Mirrors the std430 layout of the Sphere struct in raytrace.glsl.
+# vec3 members are 16-byte aligned, so each vec3 is followed by the scalar that fills its padding.
+SPHERE_DTYPE = np.dtype([
+    ("center", np.float32, 3),
+    ("radius", np.float32),
+    ("color", np.float32, 3),
+    ("smoothness", np.float32),
+    ("emissionColor", np.float32, 3),
+    ("emissionStrength", np.float32),
+])
+assert SPHERE_DTYPE.itemsize == 48
+
+
+def spheres_to_array(spheres: list[Sphere]) -> np.ndarray:
+    """Packs a list of Sphere dataclasses into a SPHERE_DTYPE array."""
+    rows = np.zeros(len(spheres), dtype=SPHERE_DTYPE)
+    for i, sphere in enumerate(spheres):
+        material = sphere.material
+        rows[i] = (
+            tuple(sphere.center), sphere.radius,
+            tuple(material.color), material.smoothness,
+            tuple(material.emissionColor), material.emissionStrength,
+        )
+    return rows
+
+
+class SphereTable:
+    """
+    CPU-side copy of the sphere storage buffer.
+    Edits mark dirty row ranges so only the changed bytes are uploaded.
+    """
+    # Dirty ranges closer than this many rows are uploaded as one write
+    upload_gap = 16
+
+    def __init__(self, capacity: int = 64):
+        self.data = np.zeros(max(capacity, 1), dtype=SPHERE_DTYPE)
+        self.count = 0
+        self.buffer = None
+
+        # Bumped whenever spheres are added or removed, so the BVH knows to rebuild instead of refit
+        self.structure_version = 0
+        # Bumped on every change, lets CPU-side consumers cache results per scene state
+        self.version = 0
+
+        # Half-open range of rows that differ from the GPU copy, and the (start, end) ranges it bounds
+        self.dirty_start = 0
+        self.dirty_end = 0
+        self.dirty_ranges = []
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> np.void:
+        if not -self.count <= index < self.count:
+            raise IndexError(f"Sphere index {index} out of range for {self.count} spheres")
+        return self.data[index % self.count]
+
+    @property
+    def rows(self) -> np.ndarray:
+        """View of the live spheres."""
+        return self.data[:self.count]
+
+    # --- Editing ---
+    def mark_structure_changed(self):
+        """
+        Records that spheres were added or removed. Bumps version too, removing the last rows leaves no row
+        to mark dirty but still changes what every cache of the table holds.
+        """
+        self.structure_version += 1
+        self.version += 1
+
+    def mark_dirty(self, start: int, end: int):
+        if start >= end:
+            return
+        self.version += 1
+        self.dirty_ranges.append((start, end))
+        if self.dirty_start >= self.dirty_end:
+            self.dirty_start, self.dirty_end = start, end
+        else:
+            self.dirty_start = min(self.dirty_start, start)
+            self.dirty_end = max(self.dirty_end, end)
+
+    def merged_dirty_ranges(self, gap: int = 0) -> list[tuple[int, int]]:
+        """The dirty ranges sorted, with overlapping ones and ones less than gap rows apart merged."""
+        merged = []
+        for start, end in sorted(self.dirty_ranges):
+            if merged and start <= merged[-1][1] + gap:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def dirty_rows(self) -> np.ndarray:
+        """Indices of the rows that differ from the GPU copy."""
+        ranges = self.merged_dirty_ranges()
+        if not ranges:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        return rows[rows < self.count]
+
+    def set(self, index: int, field: str, value):
+        """Sets one field of one sphere, e.g. set(3, "radius", 2.0)."""
+        self[index][field] = value
+        index %= self.count
+        self.mark_dirty(index, index + 1)
+
+    def set_rows(self, indices, field: str, values):
+        """
+        Sets one field of several spheres, values is one value for all of them or one per index.
+        Only the runs of consecutive indices are marked dirty, not everything between them.
+        """
+        indices = np.asarray(indices, dtype=np.int64) % max(self.count, 1)
+        if len(indices) == 0:
+            return
+        self.data[field][indices] = values
+        indices = np.unique(indices)
+        breaks = np.flatnonzero(np.diff(indices) > 1) + 1
+        for run in np.split(indices, breaks):
+            self.mark_dirty(int(run[0]), int(run[-1]) + 1)
+
+    def replace(self, rows: np.ndarray):
+        """Replaces all spheres with the given SPHERE_DTYPE rows."""
+        self._reserve(len(rows))
+        self.data[:len(rows)] = rows
+        self.count = len(rows)
+        self.mark_structure_changed()
+        self.mark_dirty(0, self.count)
+
+    def adopt(self, rows: np.ndarray):
+        """
+        Replaces all spheres, using rows (e.g. a copy on write memory map of a world file) as the storage itself.
+        Nothing is copied until the table grows, and the next upload writes straight from rows.
+        """
+        if len(rows) == 0:
+            self.replace(rows)
+            return
+        self.data = rows
+        self.count = len(rows)
+        self.mark_structure_changed()
+        self.mark_dirty(0, self.count)
+
+    def detach(self):
+        """
+        Copies adopted rows into memory of the table's own, so the file they were mapped from can be replaced.
+        The spheres stay the same, so nothing is marked dirty.
+        """
+        if isinstance(self.data, np.memmap):
+            self.data = np.array(self.data)
+
+    def append(self, sphere: Sphere) -> int:
+        """Appends a sphere and returns its index."""
+        return self.extend(spheres_to_array([sphere]))
+
+    def extend(self, rows: np.ndarray) -> int:
+        """Appends SPHERE_DTYPE rows and returns the index of the first one."""
+        start = self.count
+        self._reserve(start + len(rows))
+        self.data[start:start + len(rows)] = rows
+        self.count += len(rows)
+        self.mark_structure_changed()
+        self.mark_dirty(start, self.count)
+        return start
+
+    def remove(self, indices):
+        """Removes the spheres at the given indices, keeping the order of the rest."""
+        indices = np.unique(np.asarray(indices, dtype=np.int64) % max(self.count, 1))
+        if len(indices) == 0:
+            return
+        keep = np.ones(self.count, dtype=bool)
+        keep[indices] = False
+        first = int(indices[0])
+        tail = self.data[first:self.count][keep[first:]]
+        self.data[first:first + len(tail)] = tail
+        self.count = first + len(tail)
+        self.mark_structure_changed()
+        # Rows past the new count are ignored by the shader, only the shifted tail needs uploading
+        self.mark_dirty(first, self.count)
+
+    def closest_hit(self, ray_origin, ray_direction) -> tuple[int, float]:
+        """Returns (index, distance) of the first sphere hit by the ray, or (-1, inf)."""
+        if self.count == 0:
+            return -1, float("inf")
+        rows = self.rows
+        origin = np.asarray(tuple(ray_origin), dtype=np.float64)
+        direction = np.asarray(tuple(ray_direction), dtype=np.float64)
+
+        offset_ray_origin = origin - rows["center"]
+        a = direction @ direction
+        b = 2.0 * (offset_ray_origin @ direction)
+        c = np.einsum("ij,ij->i", offset_ray_origin, offset_ray_origin) - rows["radius"].astype(np.float64) ** 2
+        discriminant = b * b - 4.0 * a * c
+
+        with np.errstate(invalid="ignore"):
+            distance = (-b - np.sqrt(discriminant)) / (2.0 * a)
+        distance[~((discriminant >= 0.0) & (distance >= 0.0))] = np.inf
+
+        index = int(np.argmin(distance))
+        if np.isinf(distance[index]):
+            return -1, float("inf")
+        return index, float(distance[index])
+
+    def to_spheres(self) -> list[Sphere]:
+        """Unpacks the table into Sphere dataclasses."""
+        return [
+            Sphere(
+                center=vec3(*row["center"]),
+                radius=float(row["radius"]),
+                material=Material(
+                    color=vec3(*row["color"]),
+                    smoothness=float(row["smoothness"]),
+                    emissionColor=vec3(*row["emissionColor"]),
+                    emissionStrength=float(row["emissionStrength"]),
+                ),
+            )
+            for row in self.rows
+        ]
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self.data):
+            return
+        new_capacity = len(self.data)
+        while new_capacity < capacity:
+            new_capacity *= 2
+        data = np.zeros(new_capacity, dtype=SPHERE_DTYPE)
+        data[:self.count] = self.data[:self.count]
+        self.data = data
+
+    # --- GPU ---
+    def upload(self, ctx, binding: int = 0):
+        """Writes the dirty rows to the storage buffer and binds it."""
+        if self.buffer is None or self.buffer.size != self.data.nbytes:
+            # Capacity changed, reallocate the buffer and upload everything that is live
+            if self.buffer is not None:
+                self.buffer.release()
+            self.buffer = ctx.buffer(reserve=self.data.nbytes)
+            self.dirty_start, self.dirty_end = 0, self.count
+            self.dirty_ranges = [(0, self.count)]
+
+        itemsize = SPHERE_DTYPE.itemsize
+        for start, end in self.merged_dirty_ranges(self.upload_gap):
+            # Ranges can reach past count after a removal, those rows are ignored by the shader
+            end = min(end, self.count)
+            if start < end:
+                self.buffer.write(self.data[start:end], offset=start * itemsize)
+        self.dirty_start = self.dirty_end = 0
+        self.dirty_ranges = []
+
+        self.buffer.bind_to_storage_buffer(binding)
+
+
+class SphereIndex:
+    """
+    Lookups over a SphereTable for the world editor's filters, rebuilt only when the table changes so
+    filtering thousands of spheres doesn't scan the rows every frame.
+    """
+    def __init__(self):
+        # (version, structure_version, count) of the table the lookups were built for
+        self.table_key = None
+        self.emissive = np.zeros(0, dtype=bool)
+        self.smooth = np.zeros(0, dtype=bool)
+        # Sphere indices sorted by radius, and the sorted radii to binary search
+        self.radius_order = np.zeros(0, dtype=np.int64)
+        self.sorted_radii = np.zeros(0, dtype=np.float32)
+        # Result of the latest query and the (table_key, filters) it was computed for
+        self.query_key = None
+        self.matches = np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def key(table: SphereTable) -> tuple[int, int, int]:
+        return table.version, table.structure_version, len(table)
+
+    def update(self, table: SphereTable):
+        if self.table_key == self.key(table):
+            return
+        rows = table.rows
+        self.emissive = rows["emissionStrength"] > 0
+        # Light sampling treats only smoothness 0 as diffuse
+        self.smooth = rows["smoothness"] > 0
+        self.radius_order = np.argsort(rows["radius"], kind="stable")
+        self.sorted_radii = rows["radius"][self.radius_order]
+        self.table_key = self.key(table)
+
+    def query(self, table: SphereTable, emissive: bool | None = None, smooth: bool | None = None,
+              radius_range: tuple[float, float] | None = None) -> np.ndarray:
+        """
+        Indices of the spheres matching every filter, in table order. None skips a filter,
+        radius_range is inclusive.
+        """
+        key = (self.key(table), emissive, smooth, radius_range)
+        if key == self.query_key:
+            return self.matches
+        if emissive is None and smooth is None and radius_range is None:
+            self.matches = np.arange(len(table))
+        else:
+            self.update(table)
+            mask = np.ones(len(table), dtype=bool)
+            if emissive is not None:
+                mask &= self.emissive == emissive
+            if smooth is not None:
+                mask &= self.smooth == smooth
+            if radius_range is not None:
+                low = np.searchsorted(self.sorted_radii, radius_range[0], side="left")
+                high = np.searchsorted(self.sorted_radii, radius_range[1], side="right")
+                in_range = np.zeros(len(table), dtype=bool)
+                in_range[self.radius_order[low:high]] = True
+                mask &= in_range
+            self.matches = np.flatnonzero(mask)
+        self.query_key = key
+        return self.matches
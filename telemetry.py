@@ -0,0 +1,164 @@
+import csv
+import json
+import time
+
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+
+TELEMETRY_DIR = Path(__file__).parent / "telemetry"
+# Columns of the per frame records, in export order
+FIELDS = (
+    "frame", "time", "frame_ms",
+    "trace_gpu_ms", "display_gpu_ms", "ui_gpu_ms",
+    "update_uniforms_ms", "picking_ms", "ui_ms",
+    "pixels", "samples", "rays",
+)
+
+
+class GpuTimer:
+    """
+    GL timer query, double buffered: a result is read a frame after it was measured,
+    when the GPU is done with it, so reading never stalls the frame in flight.
+    """
+    def __init__(self, ctx):
+        self.queries = [ctx.query(time=True) for _ in range(2)]
+        self.payloads = [None, None]
+
+    @contextmanager
+    def measure(self, payload):
+        """Times the GL commands issued inside, read() later returns the result with payload."""
+        with self.queries[0]:
+            yield
+        self.payloads[0] = payload
+        self.queries.reverse()
+        self.payloads.reverse()
+
+    def read(self) -> tuple[float, object] | None:
+        """Returns (milliseconds, payload) of the older measurement once, None if there is none."""
+        payload = self.payloads[0]
+        if payload is None:
+            return None
+        self.payloads[0] = None
+        return self.queries[0].elapsed / 1e6, payload
+
+    def read_all(self) -> list[tuple[float, object]]:
+        """Returns every unread measurement, the newest too, waiting for the GPU if needed."""
+        results = []
+        for _ in range(2):
+            result = self.read()
+            if result is not None:
+                results.append(result)
+            self.queries.reverse()
+            self.payloads.reverse()
+        return results
+
+
+class Telemetry:
+    """
+    Per frame GPU pass times, CPU section times and work counters, kept for the whole session
+    and a rolling window for display. GPU times arrive a frame late and are filled into their own frame.
+    """
+    def __init__(self, ctx, history: int = 240):
+        self.ctx = ctx
+        self.gpu_timers = {}
+        self.records = []
+        self.history = deque(maxlen=history)
+        # Newest record that has a GPU time, by pass name
+        self.latest_gpu = {}
+        self.session = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.start_time = time.perf_counter()
+        self.frame = self.new_record()
+
+    def new_record(self) -> dict:
+        return {"frame": len(self.records), "pixels": 0, "samples": 0, "rays": 0}
+
+    @contextmanager
+    def cpu(self, name: str):
+        """Adds the wall time spent inside to name_ms of the current frame."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            key = f"{name}_ms"
+            self.frame[key] = self.frame.get(key, 0.0) + (time.perf_counter() - start) * 1000
+
+    @contextmanager
+    def gpu(self, name: str):
+        """Times a GPU pass into name_gpu_ms of the current frame, sections of the same name must not nest."""
+        if name not in self.gpu_timers:
+            self.gpu_timers[name] = GpuTimer(self.ctx)
+        with self.gpu_timers[name].measure(self.frame):
+            yield
+
+    def add(self, **counters):
+        """Adds to work counters of the current frame, like pixels, samples and rays traced."""
+        for name, value in counters.items():
+            self.frame[name] = self.frame.get(name, 0) + value
+
+    def end_frame(self, frame_ms: float):
+        """Closes the current frame and collects the GPU times that finished since the last call."""
+        self.frame["time"] = time.perf_counter() - self.start_time
+        self.frame["frame_ms"] = frame_ms
+        self.records.append(self.frame)
+        self.history.append(self.frame)
+        self.frame = self.new_record()
+
+        for name, timer in self.gpu_timers.items():
+            result = timer.read()
+            if result is not None:
+                self.store_gpu(name, *result)
+
+    def flush_gpu(self):
+        """Fills in the GPU times still in flight, waiting for the GPU. For the end of a headless run."""
+        for name, timer in self.gpu_timers.items():
+            for result in timer.read_all():
+                self.store_gpu(name, *result)
+
+    def store_gpu(self, name: str, ms: float, record: dict):
+        record[f"{name}_gpu_ms"] = ms
+        self.latest_gpu[name] = record
+
+    def series(self, key: str) -> list[float]:
+        """Values of key over the rolling window, frames without it count as 0."""
+        return [record.get(key, 0.0) for record in self.history]
+
+    def mean(self, key: str) -> float:
+        values = [record[key] for record in self.history if key in record]
+        return sum(values) / len(values) if values else 0.0
+
+    def rate(self, key: str) -> float:
+        """Per second rate of a counter over the rolling window, by wall time."""
+        seconds = sum(record["frame_ms"] for record in self.history) / 1000
+        return sum(record[key] for record in self.history) / seconds if seconds > 0 else 0.0
+
+    def summary(self) -> dict:
+        keys = [key for key in FIELDS if key.endswith("_ms") and any(key in record for record in self.history)]
+        return {
+            "frames": len(self.records),
+            **{f"mean_{key}": self.mean(key) for key in keys},
+            "samples_per_second": self.rate("samples"),
+            "rays_per_second": self.rate("rays"),
+        }
+
+    def export(self, path: Path | None = None, suffix: str = ".csv") -> Path:
+        """Writes every frame of the session as CSV, or as JSON with a summary of the rolling window."""
+        path = Path(path) if path is not None else TELEMETRY_DIR / f"session-{self.session}{suffix}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if path.suffix.lower() == ".json":
+            data = {
+                "session": self.session,
+                "renderer": self.ctx.info["GL_RENDERER"],
+                "summary": self.summary(),
+                "frames": self.records,
+            }
+            path.write_text(json.dumps(data, indent=2))
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(self.records)
+        return path
@@ -0,0 +1,587 @@
+import numpy as np
+
+from glm import vec2, vec3
+
+from pathlib import Path
+
+from spheres import SphereTable
+from bvh import BVH
+from lights import LightList
+from world import world_path, read_world, write_world
+from images import resolve_accumulation
+from telemetry import Telemetry
+from wavefront import WavefrontTracer
+from denoise import Denoiser
+from sampling import SAMPLER_SOBOL, SAMPLER_BLUE_NOISE, blue_noise
+from variants import ShaderVariants
+from frame_state import FrameState
+from path_statistics import PathStatistics
+
+
+class Tracer:
+    """
+    GPU side of the path tracer: shaders, scene buffers, accumulation framebuffers and uniforms.
+    Shared by the interactive App and the headless renderer, which both provide a camera.
+    """
+    resource_dir = Path(__file__).parent
+
+    def __init__(self, ctx, size: tuple[int, int], world: str = "Default World"):
+        self.ctx = ctx
+        self.camera = None
+
+        # Compile shaders
+        # Trace pass variants, each a Vertex Array Object for the fullscreen quad around one compiled program.
+        # update_uniforms picks the variant matching the settings (shader_defines), compiling it on first use
+        self.trace_variants = ShaderVariants(
+            lambda **sources: self.ctx.vertex_array(self.ctx.program(**sources), []),
+            vertex_shader=self.load_shader_source("shaders/quad.glsl"),
+            fragment_shader=self.load_shader_source("shaders/raytrace.glsl"),
+        )
+        # Fix the settings as #defines instead of reading them from uniforms, off compiles one generic program
+        self.specialize_shaders = True
+        self.vao = None
+        self.program = None
+        # Display pass turning the accumulated radiance into tonemapped colors
+        self.tonemap_program = self.load_shader_program(
+            vertex_shader="shaders/quad.glsl",
+            fragment_shader="shaders/tonemap.glsl"
+        )
+        self.tonemap_vao = self.ctx.vertex_array(self.tonemap_program, [])
+        # Filters the noise of the first frames after a reset, before tonemapping
+        self.denoiser = Denoiser(self)
+
+        # CPU-side variables
+        self.render_resolution = vec2(size)
+        # Fraction of render_resolution traced, below 1 the image fills the lower left corner of the buffers
+        self.resolution_scale = 1.0
+        # Scale fbo_prev was traced at, lags resolution_scale until a frame at the new scale completes
+        self.display_scale = 1.0
+        self.rays_per_pixel = 4
+        self.max_bounce_limit = 8
+        # Path termination before max_bounce_limit. Russian roulette after roulette_min_depth bounces keeps the
+        # image unbiased, ending paths whose throughput is at most throughput_threshold only does for 0
+        self.russian_roulette = True
+        self.roulette_min_depth = 3
+        self.throughput_threshold = 0.0
+        # Count the path lengths and why the paths ended in path_stats, costs an atomic per path
+        self.path_statistics = False
+        self.path_stats = PathStatistics(ctx)
+
+        self.delta_time = 0.0
+        self.allow_accumulation = True
+        self.accumulation_frame = 1
+        self.accumulation_time = 0.0
+        # Samples per pixel of the accumulation before the current frame, and the most the current frame traced.
+        # Counted instead of derived from accumulation_frame, rays_per_pixel may change between frames and sample
+        # numbers that were already accumulated would repeat the same paths
+        self.sample_base = 0
+        self.frame_samples = 0
+        # Counts resets and reprojections, lets work that spans several frames notice the history was discarded
+        # or moved
+        self.accumulation_resets = 0
+
+        # Camera motion reprojects the history to where the previous camera saw each first hit instead of
+        # discarding it, capped to history_limit samples so the moving image doesn't lag
+        self.temporal_reprojection = True
+        self.history_limit = 32.0
+        # view() of the frame being traced and of the one in fbo_prev
+        self.frame_view = None
+        self.history_view = None
+        # accumulation_frame before the latest reprojection, frames after it have only partially kept history
+        self.reprojected_frame = 0
+        # Camera and scene settings of the trace passes. sync_frame_state resets or reprojects the accumulation when
+        # they change, state_versions are the (image_version, view_version) it last did so for
+        self.frame_state = FrameState()
+        self.state_versions = (0, 0)
+
+        # Adaptive sampling, converged pixels stop tracing
+        self.adaptive_sampling = False
+        self.adaptive_threshold = 0.05
+        self.adaptive_min_samples = 16
+        # Convergence counters written by the shader, double buffered so reading never waits on the frame in flight
+        self.convergence_buffers = [self.ctx.buffer(reserve=8) for _ in range(2)]
+        self.converged_fraction = 0.0
+        self.convergence_eta = 0.0
+
+        # Frame timings and counters, and the GPU milliseconds per traced pixel estimated from them
+        self.telemetry = Telemetry(ctx)
+        self.trace_cost = None
+        self.trace_cost_frame = -1
+
+        # Load world
+        self.density = 0.0
+        self.skyBoxLightStrength = 1.0
+        self.spheres = SphereTable()
+        # Acceleration structure, rebuilt when spheres are added or removed and refitted on edits
+        self.bvh = BVH()
+        self.use_bvh = True
+        # Emissive spheres sampled directly by next event estimation
+        self.lights = LightList()
+        self.next_event_estimation = True
+        # Trace with the compute shader passes of wavefront.py instead of the fragment shader, compiled on first use
+        self.use_wavefront = False
+        self.wavefront = None
+        # Sequence the random numbers of the paths come from, one of sampling.SAMPLERS
+        self.sampler = SAMPLER_SOBOL
+        # Created when the blue noise sampler is first used, generating it takes a while
+        self.blue_noise = None
+        self.load_world(world)
+
+        # Milliseconds per trace pass for each intersection mode, filled by compare_intersection_modes
+        self.intersection_timings = {}
+
+        # Framebuffers for temporal accumulation and the tonemapped display image
+        self.fbo = None
+        self.fbo_prev = None
+        self.display_fbo = None
+        self.create_framebuffers(size)
+
+    def load_shader_program(self, vertex_shader: str, fragment_shader: str):
+        """Compiles a program from shader files relative to resource_dir."""
+        return self.ctx.program(
+            vertex_shader=self.load_shader_source(vertex_shader),
+            fragment_shader=self.load_shader_source(fragment_shader),
+        )
+
+    def load_shader_source(self, path: str) -> str:
+        """Reads a shader file, replacing #include "file" lines with that file, relative to the includer."""
+        path = self.resource_dir / path
+        lines = []
+        for line in path.read_text().splitlines():
+            if line.startswith("#include"):
+                included = path.parent / line.split('"')[1]
+                line = self.load_shader_source(included.relative_to(self.resource_dir))
+            lines.append(line)
+        return "\n".join(lines) + "\n"
+
+    def create_framebuffers(self, size: tuple[int, int]):
+        """
+        (Re)creates the ping-pong accumulation framebuffers and the display framebuffer.
+        Accumulation is RGBA32F so long runs keep converging instead of quantizing new samples away.
+        """
+        for fbo in (self.fbo, self.fbo_prev, self.display_fbo):
+            if fbo is not None:
+                for attachment in fbo.color_attachments:
+                    attachment.release()
+                fbo.release()
+
+        self.render_resolution = vec2(size)
+        self.fbo = self.create_trace_framebuffer(size)
+        self.fbo_prev = self.create_trace_framebuffer(size)
+        self.display_fbo = self.ctx.framebuffer(
+            color_attachments=self.ctx.texture(size, 4)
+        )
+        self.denoiser.create_framebuffers(size)
+        self.reset_accumulation()
+
+    def create_trace_framebuffer(self, size: tuple[int, int]):
+        """
+        Attachment 0 holds the radiance sum and sample count, 1 the squared luminance sum.
+        2 and 3 are the denoiser's G-buffer, the first hit normal and distance and the first hit color.
+        """
+        return self.ctx.framebuffer(color_attachments=[
+            self.create_accumulation_texture(size, 4),
+            self.create_accumulation_texture(size, 1),
+            self.create_accumulation_texture(size, 4),
+            self.create_accumulation_texture(size, 4, dtype="f2"),
+        ])
+
+    def create_accumulation_texture(self, size: tuple[int, int], components: int, dtype: str = "f4"):
+        texture = self.ctx.texture(size, components, dtype=dtype)
+        texture.filter = (self.ctx.NEAREST, self.ctx.NEAREST)
+        return texture
+
+    def scaled_resolution(self, scale: float) -> vec2:
+        """render_resolution times scale, rounded down to whole pixels."""
+        return vec2(
+            max(1, int(self.render_resolution.x * scale)),
+            max(1, int(self.render_resolution.y * scale)),
+        )
+
+    @property
+    def trace_resolution(self) -> vec2:
+        """Resolution the trace pass runs at."""
+        return self.scaled_resolution(self.resolution_scale)
+
+    @property
+    def display_texture(self):
+        """Tonemapped image written by display()."""
+        return self.display_fbo.color_attachments[0]
+
+    @property
+    def fresh_frames(self) -> int:
+        """Accumulation frames since the history was last discarded or reprojected."""
+        return self.accumulation_frame - self.reprojected_frame
+
+    def view(self) -> tuple:
+        """Everything that decides which point a pixel sees, compared between frames to find camera motion."""
+        camera = self.camera
+        return (
+            tuple(camera.position), tuple(camera.forward), tuple(camera.right), tuple(camera.up),
+            camera.fov, tuple(self.trace_resolution)
+        )
+
+    def sync_frame_state(self):
+        """
+        Writes the camera and scene settings into frame_state, then discards the accumulation if a change since the
+        last sync alters the image, or reprojects it if only the view moved. Runs before every trace, call it
+        earlier to have the reset take effect before the frame starts.
+        """
+        camera = self.camera
+        state = self.frame_state
+        state.update(
+            position=camera.position, forward=camera.forward, right=camera.right, up=camera.up, fov=camera.fov,
+            resolution=self.trace_resolution,
+            density=self.density, skyboxLightStrength=self.skyBoxLightStrength, sphereAmount=len(self.spheres),
+            sphereVersion=self.spheres.version, maxBounceLimit=self.max_bounce_limit,
+            throughputThreshold=self.throughput_threshold,
+        )
+        image_version, view_version = self.state_versions
+        if state.image_version != image_version:
+            self.reset_accumulation()
+        elif state.view_version != view_version:
+            self.reproject_accumulation()
+
+    def update_uniforms(self) -> dict:
+        """
+        Uploads the changed part of the scene buffers and of the FrameState block, binds the history textures and
+        writes the remaining trace uniforms to the fragment program. Returns those for the wavefront passes.
+        """
+        self.sync_frame_state()
+
+        # World
+        self.update_bvh()
+        self.update_lights()
+        self.spheres.upload(self.ctx, binding=0)
+        for location, texture in enumerate(self.fbo_prev.color_attachments):
+            texture.use(location=location)
+        self.convergence_buffers[0].bind_to_storage_buffer(3)
+        self.path_stats.bind(10)
+        if self.sampler == SAMPLER_BLUE_NOISE:
+            self.blue_noise_texture().use(location=4)
+
+        # Reprojection, the history was traced from another view
+        self.frame_view = self.view()
+        history_view = self.history_view or self.frame_view
+        position, forward, right, up, fov, resolution = history_view
+        # The camera and scene fields were written by sync_frame_state
+        self.frame_state.update(
+            nextEventEstimation=self.next_event_estimation and len(self.lights) > 0,
+            lightAmount=len(self.lights),
+            lightPower=self.lights.total_power,
+            raysPerPixel=self.rays_per_pixel,
+            accumulationFrame=self.accumulation_frame,
+            sampleBase=self.sample_base,
+
+            adaptiveSampling=self.adaptive_sampling,
+            adaptiveThreshold=self.adaptive_threshold,
+            adaptiveMinSamples=self.adaptive_min_samples,
+
+            russianRoulette=self.russian_roulette,
+            rouletteMinDepth=self.roulette_min_depth,
+            pathStatistics=self.path_statistics,
+
+            reproject=self.temporal_reprojection and self.accumulation_frame > 1 and history_view != self.frame_view,
+            previousPosition=position,
+            previousForward=forward,
+            previousRight=right,
+            previousUp=up,
+            previousFov=fov,
+            previousResolution=resolution,
+            historyLimit=self.history_limit,
+        )
+        self.frame_state.upload(self.ctx, binding=0)
+
+        # Settings the specialized variants have as constants, and the texture units
+        uniforms = {
+            "useBVH": self.use_bvh,
+            "useVolume": self.density > 0,
+            "maxBounceLimit": self.max_bounce_limit,
+            "samplerType": self.sampler,
+            "blueNoise": 4,
+
+            "prev": 0,
+            "prevMoments": 1,
+            "prevNormalDepth": 2,
+            "prevAlbedo": 3,
+        }
+        self.vao = self.trace_variants.get(self.shader_defines())
+        self.program = self.vao.program
+        self.write_uniforms(self.program, uniforms)
+        return uniforms
+
+    def shader_defines(self) -> dict:
+        """
+        Settings the trace shaders are compiled with (see variants.py), the ones common.glsl otherwise reads from
+        uniforms. Each combination compiles once, so the sphere count only goes in as a power of two bucket.
+        """
+        if not self.specialize_shaders:
+            return {}
+        defines = {
+            "USE_VOLUME": self.density > 0,
+            "USE_BVH": self.use_bvh,
+            "MAX_BOUNCES": self.max_bounce_limit,
+            "SAMPLER_TYPE": self.sampler,
+        }
+        if not self.use_bvh:
+            # Only the linear sphere loop is bounded by the count
+            defines["SPHERE_BUCKET"] = max(16, 1 << (len(self.spheres) - 1).bit_length())
+        return defines
+
+    def blue_noise_texture(self):
+        """Texture of sampling.blue_noise the blue noise sampler reads, created on first use."""
+        if self.blue_noise is None:
+            self.blue_noise = self.ctx.texture(blue_noise().shape, 1, blue_noise(), dtype="f4")
+            self.blue_noise.filter = (self.ctx.NEAREST, self.ctx.NEAREST)
+        return self.blue_noise
+
+    @staticmethod
+    def write_uniforms(program, uniforms: dict):
+        """Writes uniforms by name, skipping the ones the program doesn't use."""
+        for name, value in uniforms.items():
+            if name not in program:
+                continue
+            if isinstance(value, (vec2, vec3)):
+                program[name].write(value)
+            else:
+                program[name].value = value
+
+    def update_bvh(self):
+        """Rebuilds or refits the BVH to match the spheres. Must run before the spheres are uploaded."""
+        if not self.use_bvh:
+            # Edits aren't tracked while disabled, rebuild once it is turned back on
+            self.bvh.structure_version = -1
+            return
+
+        if self.bvh.structure_version != self.spheres.structure_version:
+            self.bvh.build(self.spheres.rows)
+            self.bvh.structure_version = self.spheres.structure_version
+        elif self.bvh.sphere_version != self.spheres.version and self.spheres.dirty_start < self.spheres.dirty_end:
+            self.bvh.refit(self.spheres.rows, self.spheres.dirty_rows())
+        self.bvh.sphere_version = self.spheres.version
+
+        self.bvh.upload(self.ctx, node_binding=1, index_binding=2)
+
+    def update_lights(self):
+        """Updates the light list after edits that change the power of a sphere. Must run before the spheres are uploaded."""
+        if self.lights.sphere_version != self.spheres.version:
+            # The dirty range covers every row changed since the last upload
+            self.lights.update(self.spheres.rows, range(self.spheres.dirty_start, self.spheres.dirty_end))
+            self.lights.sphere_version = self.spheres.version
+        self.lights.upload(self.ctx, binding=9)
+
+    def compare_intersection_modes(self, passes: int = 5):
+        """Times the trace pass with the linear sphere loop and with the BVH on the current scene."""
+        use_bvh = self.use_bvh
+        framebuffer = self.ctx.fbo
+        query = self.ctx.query(time=True)
+        self.fbo.use()
+        self.ctx.disable(self.ctx.BLEND)
+
+        for mode, enabled in (("linear", False), ("bvh", True)):
+            self.use_bvh = enabled
+            self.update_uniforms()
+            # Warm up so a rebuild or shader state change isn't measured
+            self.vao.render(vertices=6)
+            self.ctx.finish()
+
+            elapsed = 0
+            for _ in range(passes):
+                with query:
+                    self.vao.render(vertices=6)
+                elapsed += query.elapsed
+            self.intersection_timings[mode] = elapsed / passes / 1e6
+
+        self.use_bvh = use_bvh
+        self.update_uniforms()
+        query.release()
+        framebuffer.use()
+
+    def load_world(self, filename: str):
+        """Loads a world from a file."""
+        path = world_path(filename)
+        if not path.exists():
+            print(f"World file {path} does not exist.")
+            return
+        try:
+            world = read_world(path)
+        except ValueError as error:
+            print(error)
+            return
+        self.load_scene(world.spheres, world.skybox_light_strength, world.bvh)
+
+    def load_scene(self, spheres: np.ndarray, skybox_light_strength: float,
+                   bvh: tuple[np.ndarray, np.ndarray] | None = None):
+        """
+        Replaces the scene with SPHERE_DTYPE rows, which the sphere table keeps using as its storage.
+        A prebuilt (nodes, indices) BVH over them is used as is. Otherwise, or if it doesn't fit the spheres,
+        one is built on the next frame.
+        """
+        self.spheres.adopt(spheres)
+        self.skyBoxLightStrength = skybox_light_strength
+        if bvh is not None and self.bvh.load(*bvh, sphere_count=len(spheres)):
+            self.bvh.structure_version = self.spheres.structure_version
+            self.bvh.sphere_version = self.spheres.version
+
+    def save_world(self, filename: str):
+        """Saves the current world to a file."""
+        path = world_path(filename)
+        # Store the BVH with the spheres when it is up to date, so loading doesn't rebuild it
+        self.update_bvh()
+        bvh = self.bvh if self.bvh.structure_version == self.spheres.structure_version else None
+        # The spheres may still be mapped from the file being overwritten
+        self.spheres.detach()
+        write_world(path, self.spheres.rows, self.skyBoxLightStrength, bvh)
+        print(f"World saved to {path}")
+
+    def render_frame(self):
+        """Traces one accumulation frame into fbo, then swaps so the result is in fbo_prev."""
+        self.begin_frame()
+        self.trace()
+        self.end_frame()
+
+    def begin_frame(self):
+        """Starts an accumulation frame, trace() may then be called once or once per region."""
+        if self.adaptive_sampling:
+            self.convergence_buffers[0].clear()
+        if self.path_statistics:
+            self.path_stats.begin_frame()
+
+    def trace(self, region: tuple[int, int, int, int] = None):
+        """Runs the trace pass over the whole framebuffer or only an (x, y, width, height) region of it."""
+        self.fbo.use()
+        # The UI renderer leaves blending on, which would mix new samples into the accumulation
+        self.ctx.disable(self.ctx.BLEND)
+        with self.telemetry.cpu("update_uniforms"):
+            uniforms = self.update_uniforms()
+        # Counted after update_uniforms, which may have reset the accumulation
+        self.frame_samples = max(self.frame_samples, self.rays_per_pixel)
+
+        if region is None and self.resolution_scale < 1:
+            region = (0, 0, *map(int, self.trace_resolution))
+
+        # Each path is at most max_bounce_limit + 1 rays, so rays is an upper bound. path_stats counts the actual rays
+        width, height = region[2:] if region else map(int, self.trace_resolution)
+        samples = width * height * self.rays_per_pixel
+        self.telemetry.add(pixels=width * height, samples=samples, rays=samples * (self.max_bounce_limit + 1))
+
+        if self.use_wavefront:
+            if self.wavefront is None:
+                self.wavefront = WavefrontTracer(self)
+            self.wavefront.trace(uniforms, region or (0, 0, *map(int, self.trace_resolution)))
+            return
+
+        # Render the scene
+        # 6 vertices for a fullscreen quad, the scissor test limits it to the region
+        self.fbo.scissor = region
+        self.vao.render(vertices=6)
+        self.fbo.scissor = None
+
+    def end_frame(self):
+        """Finishes an accumulation frame once every pixel has been traced."""
+        # Swap FBOs for next frame
+        self.fbo, self.fbo_prev = self.fbo_prev, self.fbo
+        self.display_scale = self.resolution_scale
+        self.history_view = self.frame_view
+
+        if self.adaptive_sampling:
+            # The other buffer holds the previous frame's counters
+            self.convergence_buffers.reverse()
+            self.update_convergence_stats()
+        if self.path_statistics:
+            self.path_stats.end_frame()
+
+    def update_trace_cost(self):
+        """Folds the newest timed trace pass into trace_cost, the smoothed GPU milliseconds per pixel."""
+        record = self.telemetry.latest_gpu.get("trace")
+        if record is None or record["frame"] == self.trace_cost_frame or record["pixels"] == 0:
+            return
+        self.trace_cost_frame = record["frame"]
+        cost = record["trace_gpu_ms"] / record["pixels"]
+        if self.trace_cost is None:
+            self.trace_cost = cost
+        else:
+            self.trace_cost += (cost - self.trace_cost) * 0.25
+
+    def update_convergence_stats(self):
+        """Reads the previous frame's convergence counters into converged_fraction and convergence_eta."""
+        converged, remaining = np.frombuffer(self.convergence_buffers[0].read(), dtype=np.uint32)
+        resolution = self.trace_resolution
+        pixels = int(resolution.x * resolution.y)
+        self.converged_fraction = int(converged) / pixels
+
+        # Samples traced per frame shrink as pixels converge, estimate with the current rate
+        samples_per_frame = (pixels - int(converged)) * self.rays_per_pixel
+        if samples_per_frame == 0:
+            self.convergence_eta = 0.0
+        else:
+            self.convergence_eta = int(remaining) / samples_per_frame * self.delta_time
+
+    def display(self):
+        """
+        Tonemaps the latest accumulation into display_fbo, denoised while few frames have accumulated
+        and upscaled when traced at a lower resolution.
+        """
+        self.ctx.disable(self.ctx.BLEND)
+        resolution = self.scaled_resolution(self.display_scale)
+        source = self.fbo_prev.color_attachments[0]
+        if self.denoiser.active:
+            source = self.denoiser.apply(tuple(map(int, resolution)))
+
+        self.display_fbo.use()
+        source.use(location=0)
+        self.tonemap_program["accumulation"].value = 0
+        self.tonemap_program["sourceSize"].value = tuple(map(int, resolution))
+        self.tonemap_program["sourceScale"].write(resolution / self.render_resolution)
+        self.tonemap_vao.render(vertices=6)
+
+    def read_accumulation(self) -> np.ndarray:
+        """
+        Reads the latest accumulation as a float32 (height, width, 4) array, top row first.
+        rgb is the unnormalized radiance sum and alpha the number of samples.
+        """
+        texture = self.fbo_prev.color_attachments[0]
+        data = np.frombuffer(texture.read(), dtype=np.float32)
+        return data.reshape(texture.height, texture.width, 4)
+
+    def read_image(self) -> np.ndarray:
+        """Reads the latest accumulation as linear radiance, a float32 (height, width, 3) array."""
+        return resolve_accumulation(self.read_accumulation())
+
+    def update_accumulation(self):
+        """Starts the count of the next accumulation frame, after resetting or reprojecting for changed settings."""
+        self.sync_frame_state()
+        if not self.allow_accumulation:
+            # Starting over every frame, not a discarded history, so accumulation_resets stays
+            self.accumulation_frame = 0
+            self.accumulation_time = 0.0
+            self.sample_base = self.frame_samples = 0
+            return
+        self.accumulation_frame += 1
+        self.sample_base += self.frame_samples
+        self.frame_samples = 0
+        self.accumulation_time += self.delta_time
+
+    def reset_accumulation(self):
+        self.accumulation_frame = 0
+        self.accumulation_time = 0.0
+        self.accumulation_resets += 1
+        self.reprojected_frame = 0
+        self.sample_base = self.frame_samples = 0
+        self.state_versions = (self.frame_state.image_version, self.frame_state.view_version)
+        self.path_stats.reset()
+
+    def reproject_accumulation(self):
+        """
+        Keeps the history across a camera or resolution change, the next trace reprojects it.
+        Like a reset the frame in progress restarts, falls back to a reset with temporal reprojection off.
+        """
+        if not self.temporal_reprojection or not self.allow_accumulation:
+            self.reset_accumulation()
+            return
+        self.accumulation_time = 0.0
+        self.accumulation_resets += 1
+        self.reprojected_frame = self.accumulation_frame
+        self.state_versions = (self.state_versions[0], self.frame_state.view_version)
+        # Restarts with accumulation_time, which the traced rays/s divide the counts by
+        self.path_stats.reset()
@@ -1,6 +1,16 @@
 import imgui
-from glm import vec3
+import numpy as np
+from array import array
 from dclasses import Sphere, Material
+from sampling import SAMPLERS
+from spheres import SphereIndex
+
+
+# Choices of the sphere list's property filters and the value SphereIndex.query takes for each
+FILTER_CHOICES = ("Any", "Yes", "No")
+FILTER_VALUES = (None, True, False)
+# Rows of the sphere list visible without scrolling
+SPHERE_LIST_ROWS = 12
 
 
 class UI:
@@ -10,6 +20,18 @@ class UI:
     def __init__(self, app):
         self.app = app
 
+        # World editor sphere list, filtered through an index that only rebuilds when the spheres change
+        self.sphere_index = SphereIndex()
+        self.filter_emissive = 0
+        self.filter_smooth = 0
+        self.filter_radius = False
+        self.radius_range = [0.0, 10.0]
+        # Selected sphere indices, cleared when spheres are added or removed since that shifts them
+        self.selection = set()
+        self.selection_version = None
+        # Anchor of shift click range selection
+        self.last_clicked = None
+
     def generate_frame(self):
         imgui.new_frame()
 
@@ -19,6 +41,7 @@ class UI:
 
         self._sidebar("left", [
             self._raytracer_settings,
+            self._performance,
             self._world_settings
         ])
 
@@ -61,7 +84,7 @@ class UI:
             | imgui.WINDOW_NO_BRING_TO_FRONT_ON_FOCUS
             | imgui.WINDOW_NO_BACKGROUND
         )
-        imgui.image(self.app.fbo.color_attachments[0].glo, *self.app.window_size)
+        imgui.image(self.app.display_texture.glo, *self.app.window_size)
         imgui.end()
         imgui.pop_style_var()
 
@@ -76,13 +99,137 @@ class UI:
         _, self.app.max_bounce_limit = imgui.slider_int(
             "Max Bounces", self.app.max_bounce_limit, 1, 12
         )
+        # Unbiased, so toggling it keeps the history. A threshold above 0 resets it
+        _, self.app.russian_roulette = imgui.checkbox("Russian Roulette", self.app.russian_roulette)
+        if self.app.russian_roulette:
+            imgui.set_next_item_width(160)
+            _, self.app.roulette_min_depth = imgui.slider_int(
+                "Roulette Depth", self.app.roulette_min_depth, 1, 12
+            )
+        imgui.set_next_item_width(160)
+        _, self.app.throughput_threshold = imgui.slider_float(
+            "Throughput Cutoff", self.app.throughput_threshold, 0.0, 0.1, format="%.3f"
+        )
         imgui.text(f"MSPF: {(self.app.delta_time * 1000):.0f} ms")
         imgui.text(f"Accumulation time: {self.app.accumulation_time:.2f}s")
-        accumulation_changed, self.app.allow_accumulation = imgui.checkbox(
+        _, self.app.allow_accumulation = imgui.checkbox(
             "Allow Accumulation", self.app.allow_accumulation
         )
-        if accumulation_changed:
-            self.app.reset_accumulation()
+
+        _, self.app.next_event_estimation = imgui.checkbox(
+            "Sample Lights (NEE)", self.app.next_event_estimation
+        )
+        imgui.same_line()
+        imgui.text(f"{len(self.app.lights)} lights")
+
+        imgui.set_next_item_width(160)
+        _, self.app.sampler = imgui.combo("Sampler", self.app.sampler, list(SAMPLERS))
+
+        _, self.app.adaptive_sampling = imgui.checkbox(
+            "Adaptive Sampling", self.app.adaptive_sampling
+        )
+        if self.app.adaptive_sampling:
+            imgui.set_next_item_width(160)
+            _, self.app.adaptive_threshold = imgui.slider_float(
+                "Error Threshold", self.app.adaptive_threshold, 0.005, 0.2, format="%.3f"
+            )
+            imgui.text(f"Converged: {self.app.converged_fraction * 100:.1f}%")
+            imgui.text(f"Est. time to converge: {self.app.convergence_eta:.1f}s")
+
+        scheduler = self.app.scheduler
+        tiled_changed, scheduler.enabled = imgui.checkbox("Tiled Rendering", scheduler.enabled)
+        if tiled_changed:
+            scheduler.reset()
+        if scheduler.enabled:
+            imgui.set_next_item_width(160)
+            _, scheduler.target_ms = imgui.slider_float(
+                "Target MSPF", scheduler.target_ms, 2.0, 50.0, format="%.1f"
+            )
+            imgui.set_next_item_width(160)
+            tile_changed, scheduler.tile_size = imgui.slider_int(
+                "Tile Size", scheduler.tile_size, 32, 512
+            )
+            if tile_changed:
+                scheduler.reset()
+            imgui.text(f"Tiles/frame: {min(int(scheduler.tiles_per_frame), len(scheduler.tiles))}/{len(scheduler.tiles)}")
+            imgui.text(f"Frame progress: {scheduler.progress * 100:.0f}%")
+
+        scaler = self.app.resolution_scaler
+        _, scaler.enabled = imgui.checkbox("Dynamic Resolution", scaler.enabled)
+        if scaler.enabled:
+            imgui.set_next_item_width(160)
+            _, scaler.target_ms = imgui.slider_float(
+                "Moving MSPF", scaler.target_ms, 4.0, 50.0, format="%.1f"
+            )
+            imgui.text(f"Resolution scale: {self.app.resolution_scale * 100:.0f}%")
+
+        _, self.app.use_bvh = imgui.checkbox("Use BVH", self.app.use_bvh)
+        imgui.same_line()
+        if imgui.button("Compare"):
+            self.app.compare_intersection_modes()
+        for mode, ms in self.app.intersection_timings.items():
+            imgui.text(f"{mode}: {ms:.2f} ms/pass")
+        imgui.text(f"BVH nodes: {len(self.app.bvh)}")
+
+        # Both backends accumulate the same samples, so switching keeps the history
+        _, self.app.use_wavefront = imgui.checkbox("Wavefront (compute)", self.app.use_wavefront)
+        # Variants render the same samples as the generic shader, a new one compiles on first use
+        _, self.app.specialize_shaders = imgui.checkbox("Specialized Shaders", self.app.specialize_shaders)
+
+        # Only decides what happens to the history on the next camera move
+        _, self.app.temporal_reprojection = imgui.checkbox("Temporal Reprojection", self.app.temporal_reprojection)
+        if self.app.temporal_reprojection:
+            imgui.set_next_item_width(160)
+            _, self.app.history_limit = imgui.slider_float(
+                "History Limit", self.app.history_limit, 1.0, 256.0, format="%.0f"
+            )
+
+        # Only changes what is displayed, the accumulation stays
+        denoiser = self.app.denoiser
+        _, denoiser.enabled = imgui.checkbox("Denoise", denoiser.enabled)
+        if denoiser.enabled:
+            imgui.set_next_item_width(160)
+            _, denoiser.iterations = imgui.slider_int("Filter Passes", denoiser.iterations, 1, 6)
+            imgui.set_next_item_width(160)
+            _, denoiser.falloff = imgui.slider_float("Falloff Frames", denoiser.falloff, 1.0, 64.0, format="%.0f")
+            imgui.text(f"Strength: {denoiser.strength(self.app.fresh_frames) * 100:.0f}%")
+
+    def _performance(self):
+        if not imgui.collapsing_header("Performance")[0]: return
+
+        telemetry = self.app.telemetry
+        for label, key in (("Trace GPU", "trace_gpu_ms"), ("UI GPU", "ui_gpu_ms")):
+            imgui.plot_histogram(
+                f"##{key}", array("f", telemetry.series(key)),
+                overlay_text=f"{label}: {telemetry.mean(key):.2f} ms", scale_min=0.0, graph_size=(240, 40)
+            )
+        imgui.text(f"Display GPU: {telemetry.mean('display_gpu_ms'):.2f} ms")
+        imgui.text(f"Uniforms CPU: {telemetry.mean('update_uniforms_ms'):.2f} ms")
+        imgui.text(f"Picking CPU: {telemetry.mean('picking_ms'):.3f} ms")
+        imgui.text(f"UI CPU: {telemetry.mean('ui_ms'):.2f} ms")
+        imgui.text(f"Samples/s: {telemetry.rate('samples') / 1e6:.2f} M")
+        imgui.text(f"Rays/s (max): {telemetry.rate('rays') / 1e6:.2f} M")
+
+        path_stats = self.app.path_stats
+        statistics_changed, self.app.path_statistics = imgui.checkbox("Path Statistics", self.app.path_statistics)
+        if statistics_changed:
+            path_stats.reset()
+        if self.app.path_statistics and path_stats.paths:
+            # Summed since the last reset, like accumulation_time
+            imgui.text(f"Rays/s (traced): {path_stats.rays / max(self.app.accumulation_time, 1e-9) / 1e6:.2f} M")
+            imgui.text(f"Mean path length: {path_stats.mean_path_length:.2f} rays")
+            for reason, fraction in path_stats.reason_fractions().items():
+                imgui.text(f"Ended by {reason}: {fraction * 100:.1f}%")
+            imgui.plot_histogram(
+                "##path_ends", array("f", path_stats.depth_histogram()),
+                overlay_text="Path ends per bounce", scale_min=0.0, graph_size=(240, 40)
+            )
+
+        if imgui.button("Export CSV"):
+            print(f"Telemetry saved to {telemetry.export(suffix='.csv')}")
+        imgui.same_line()
+        if imgui.button("Export JSON"):
+            print(f"Telemetry saved to {telemetry.export(suffix='.json')}")
 
     def _world_settings(self):
         if not imgui.collapsing_header("World Settings", flags=imgui.TREE_NODE_DEFAULT_OPEN)[0]: return
@@ -96,41 +243,19 @@ class UI:
         if imgui.button("Save World"):
             self.app.save_world(filename)
 
-        changed_skybox, self.app.skyBoxLightStrength = imgui.slider_float(
+        _, self.app.skyBoxLightStrength = imgui.slider_float(
             "Skybox Light Strength",
             self.app.skyBoxLightStrength,
             0.0, 1.0, format="%.2f"
         )
-        if changed_skybox:
-            self.app.reset_accumulation()
 
-        changed_density, self.app.density = imgui.slider_float(
+        _, self.app.density = imgui.slider_float(
             "Density",
             self.app.density,
             0.0, 1.0, format="%.2f"
         )
-        if changed_density:
-            self.app.reset_accumulation()
-
-        remove_indices = []
-        for i, sphere in enumerate(self.app.spheres):
-            if not imgui.tree_node(f"Sphere {i}"):
-                continue
-            imgui.push_id(str(i))
-            if self._sphere_editor(sphere, i):
-                remove_indices.append(i)
-                self.app.reset_accumulation()
-            imgui.pop_id()
-            imgui.tree_pop()
 
-        for idx in reversed(remove_indices):
-            del self.app.spheres[idx]
-            self.app.reset_accumulation()
-
-        if remove_indices:
-            self.app.program["sphereAmount"].value = len(self.app.spheres)
-            for i, sphere in enumerate(self.app.spheres):
-                self.app.load_dataclass_to_uniform(sphere, f"spheres[{i}]")
+        self._sphere_list()
 
         if imgui.button("Add Sphere"):
             r = 1.0
@@ -139,12 +264,90 @@ class UI:
                 radius=r, material=Material()
             )
             self.app.spheres.append(new_sphere)
-            new_sphere_index = len(self.app.spheres) - 1
-            self.app.reset_accumulation()
-            self.app.load_dataclass_to_uniform(self.app.spheres[new_sphere_index], f"spheres[{new_sphere_index}]")
 
         if imgui.button("Print all"):
-            print(self.app.spheres)
+            print(self.app.spheres.to_spheres())
+
+    def _sphere_list(self):
+        spheres = self.app.spheres
+        if self.selection_version != spheres.structure_version:
+            # Removals shift the indices after them, the selected ones may not exist anymore
+            self.selection.clear()
+            self.last_clicked = None
+            self.selection_version = spheres.structure_version
+
+        # --- Filters ---
+        imgui.set_next_item_width(60)
+        _, self.filter_emissive = imgui.combo("Emissive", self.filter_emissive, list(FILTER_CHOICES))
+        imgui.same_line()
+        imgui.set_next_item_width(60)
+        _, self.filter_smooth = imgui.combo("Smooth", self.filter_smooth, list(FILTER_CHOICES))
+        _, self.filter_radius = imgui.checkbox("Radius", self.filter_radius)
+        if self.filter_radius:
+            imgui.same_line()
+            imgui.set_next_item_width(160)
+            _, *self.radius_range = imgui.drag_float_range2(
+                "##Radius Range", *self.radius_range, 0.01, 0.0, 100.0, format="%.2f"
+            )
+        matches = self.sphere_index.query(
+            spheres, FILTER_VALUES[self.filter_emissive], FILTER_VALUES[self.filter_smooth],
+            tuple(self.radius_range) if self.filter_radius else None,
+        )
+        imgui.text(f"{len(matches)} of {len(spheres)} spheres, {len(self.selection)} selected")
+
+        # --- List ---
+        # Only the visible rows are built, the cursor skips over the space of the others
+        row_height = imgui.get_text_line_height_with_spacing()
+        imgui.begin_child("Sphere List", 0, row_height * min(max(len(matches), 1), SPHERE_LIST_ROWS) + 8, border=True)
+        top = imgui.get_cursor_pos_y()
+        first = min(int(imgui.get_scroll_y() / row_height), len(matches))
+        last = min(first + int(imgui.get_window_height() / row_height) + 2, len(matches))
+        imgui.set_cursor_pos_y(top + first * row_height)
+        rows = spheres.rows
+        for row in range(first, last):
+            index = int(matches[row])
+            label = f"Sphere {index}   r {rows['radius'][index]:.2f}"
+            if rows["emissionStrength"][index] > 0:
+                label += "   emissive"
+            clicked, _ = imgui.selectable(f"{label}##{index}", index in self.selection)
+            if clicked:
+                self._click_sphere(matches, row)
+        imgui.set_cursor_pos_y(top + len(matches) * row_height)
+        imgui.end_child()
+
+        # --- Selection ---
+        if imgui.button("Select All"):
+            self.selection = set(matches.tolist())
+        imgui.same_line()
+        if imgui.button("Clear Selection"):
+            self.selection.clear()
+        if not self.selection:
+            return
+        if imgui.tree_node(f"Edit {len(self.selection)} Selected", imgui.TREE_NODE_DEFAULT_OPEN):
+            remove = self._sphere_editor(sorted(self.selection))
+            imgui.tree_pop()
+            if remove:
+                spheres.remove(sorted(self.selection))
+                self.selection.clear()
+                self.last_clicked = None
+
+    def _click_sphere(self, matches, row: int):
+        """Selects the sphere of a list row, ctrl toggles it and shift adds the rows from the last click."""
+        io = imgui.get_io()
+        index = int(matches[row])
+        anchor = None
+        if io.key_shift and self.last_clicked is not None:
+            # matches is sorted, the anchor row is found by binary search if it is still listed
+            anchor = int(matches.searchsorted(self.last_clicked))
+            if anchor >= len(matches) or matches[anchor] != self.last_clicked:
+                anchor = None
+        if anchor is not None:
+            self.selection.update(matches[min(anchor, row):max(anchor, row) + 1].tolist())
+        elif io.key_ctrl:
+            self.selection ^= {index}
+        else:
+            self.selection = {index}
+        self.last_clicked = index
 
     def _camera_controls(self):
         if not imgui.collapsing_header("Camera Controls", flags=imgui.TREE_NODE_DEFAULT_OPEN)[0]: return
@@ -156,11 +359,9 @@ class UI:
             f"Forward:  ({self.app.camera.forward.x:6.2f}, {self.app.camera.forward.y:6.2f}, {self.app.camera.forward.z:6.2f})"
         )
         imgui.set_next_item_width(160)
-        changed, self.app.camera.fov = imgui.slider_float(
+        _, self.app.camera.fov = imgui.slider_float(
             "FOV", self.app.camera.fov, 30.0, 90.0, format="%.0f"
         )
-        if changed:
-            self.app.reset_accumulation()
         imgui.set_next_item_width(160)
         _, self.app.camera.sensitivity = imgui.slider_float(
             "Sensitivity", self.app.camera.sensitivity, 0.05, 0.4
@@ -177,66 +378,64 @@ class UI:
             "Sprint Speed Multiplier", self.app.camera.sprint_speed_multiplier, 0.05, 2.0, 20.0, format="%.2f"
         )
 
-    def _sphere_editor(self, sphere: Sphere, index: int) -> bool:
+    def _sphere_editor(self, indices: list[int]) -> bool:
+        """
+        Edits the spheres at indices, showing the values of the first. A change sets that field of all of them,
+        except the center which moves them all by the same offset. Returns whether Remove was pressed.
+        """
+        spheres = self.app.spheres
+        sphere = spheres[indices[0]]
 
         # --- Position ---
         imgui.set_next_item_width(160)
         center_changed, *new_center = imgui.drag_float3(
-            "Center", *tuple(sphere.center), 0.01, format="%.2f"
+            "Center", *map(float, sphere["center"]), 0.01, format="%.2f"
         )
         if center_changed:
-            sphere.center = vec3(*new_center)
-            self.app.program[f"spheres[{index}].center"].write(sphere.center)
-            self.app.reset_accumulation()
+            offset = np.array(new_center, dtype=np.float32) - sphere["center"]
+            spheres.set_rows(indices, "center", spheres.rows["center"][indices] + offset)
 
         # --- Radius ---
         imgui.set_next_item_width(160)
-        radius_changed, sphere.radius = imgui.drag_float(
-            f"Radius", sphere.radius, 0.01, 0, 100.0, format="%.2f"
+        radius_changed, new_radius = imgui.drag_float(
+            f"Radius", float(sphere["radius"]), 0.01, 0, 100.0, format="%.2f"
         )
         if radius_changed:
-            self.app.program[f"spheres[{index}].radius"].value = sphere.radius
-            self.app.reset_accumulation()
+            spheres.set_rows(indices, "radius", new_radius)
 
         # --- Material ---
         # Color (RGB sliders)
         imgui.set_next_item_width(160)
         color_changed, *new_color = imgui.color_edit3(
-            "Albedo", *tuple(sphere.material.color)
+            "Albedo", *map(float, sphere["color"])
         )
         if color_changed:
-            sphere.material.color = vec3(*new_color)
-            self.app.program[f"spheres[{index}].material.color"].write(sphere.material.color)
-            self.app.reset_accumulation()
+            spheres.set_rows(indices, "color", new_color)
         # Smoothness
         imgui.set_next_item_width(160)
-        changed_smooth, sphere.material.smoothness = imgui.slider_float(
-            "Smoothness", sphere.material.smoothness, 0.0, 1.0, format="%.2f"
+        changed_smooth, new_smoothness = imgui.slider_float(
+            "Smoothness", float(sphere["smoothness"]), 0.0, 1.0, format="%.2f"
         )
         if changed_smooth:
-            self.app.program[f"spheres[{index}].material.smoothness"].value = (sphere.material.smoothness)
-            self.app.reset_accumulation()
+            spheres.set_rows(indices, "smoothness", new_smoothness)
         # Emission Color (RGB sliders)
         imgui.set_next_item_width(160)
         emission_changed, *new_emission = imgui.color_edit3(
-            "Emission", *tuple(sphere.material.emissionColor)
+            "Emission", *map(float, sphere["emissionColor"])
         )
         if emission_changed:
-            sphere.material.emissionColor = vec3(*new_emission)
-            self.app.program[f"spheres[{index}].material.emissionColor"].write(sphere.material.emissionColor)
-            self.app.reset_accumulation()
+            spheres.set_rows(indices, "emissionColor", new_emission)
         # Emission Strength
         imgui.set_next_item_width(160)
-        changed_em_strength, sphere.material.emissionStrength = imgui.drag_float(
-            "Brightness", sphere.material.emissionStrength, 0.01, 0, 5, format="%.2f"
+        changed_em_strength, new_em_strength = imgui.drag_float(
+            "Brightness", float(sphere["emissionStrength"]), 0.01, 0, 5, format="%.2f"
         )
         if changed_em_strength:
-            self.app.program[f"spheres[{index}].material.emissionStrength"].value = (sphere.material.emissionStrength)
-            self.app.reset_accumulation()
+            spheres.set_rows(indices, "emissionStrength", new_em_strength)
 
 
         # Remove button
-        remove = imgui.button(f"Remove##{index}")
+        remove = imgui.button("Remove" if len(indices) == 1 else f"Remove {len(indices)}")
         return remove
     
     def _target_sphere_editor(self):
@@ -246,12 +445,9 @@ class UI:
         imgui.begin("Targetted Sphere", True, 
             flags=imgui.WINDOW_NO_RESIZE
         )
-        delete = self._sphere_editor(self.app.spheres[targeted_sphere_index], targeted_sphere_index)
+        delete = self._sphere_editor([targeted_sphere_index])
         imgui.end()
 
         if not delete: return
         
-        self.app.reset_accumulation()
-        del self.app.spheres[targeted_sphere_index]
-        for i, sphere in enumerate(self.app.spheres):
-            self.app.load_dataclass_to_uniform(sphere, f"spheres[{i}]")
\ No newline at end of file
+        self.app.spheres.remove([targeted_sphere_index])
\ No newline at end of file
@@ -0,0 +1,38 @@
+def specialize(source: str, defines: dict) -> str:
+    """Inserts a #define line per setting after the #version line of a shader source."""
+    version, rest = source.split("\n", 1)
+    lines = [f"#define {name} {format_define(value)}" for name, value in sorted(defines.items())]
+    return "\n".join([version, *lines, rest])
+
+
+def format_define(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+class ShaderVariants:
+    """
+    Programs compiled from the same shader sources with different #defines, each on first use and then kept.
+    The defines fix settings the shaders otherwise read from uniforms, see the #ifdef blocks of common.glsl.
+    The source of a variant only depends on its defines, so across launches the driver's shader cache
+    (keyed by the source hash and the driver build) serves the compiled binary instead of compiling again.
+    """
+    def __init__(self, create, **sources: str):
+        # create(**sources) builds the object handed out per variant, a program or a vertex array around one
+        self.create = create
+        self.sources = sources
+        self.variants = {}
+
+    def get(self, defines: dict):
+        key = tuple(sorted(defines.items()))
+        variant = self.variants.get(key)
+        if variant is None:
+            variant = self.create(**{stage: specialize(source, defines) for stage, source in self.sources.items()})
+            self.variants[key] = variant
+        return variant
+
+    def release(self):
+        for variant in self.variants.values():
+            variant.release()
+        self.variants.clear()
@@ -0,0 +1,121 @@
+import numpy as np
+
+from variants import ShaderVariants
+
+
+# Bytes per element of the structs in shaders/wavefront/state.glsl
+PATH_SIZE = 64
+HIT_SIZE = 32
+PIXEL_SIZE = 32
+# Offset of dispatchSize in the QueueCounters buffer
+DISPATCH_OFFSET = 8
+
+
+class WavefrontTracer:
+    """
+    Compute shader backend of the trace pass. Instead of one fragment shader looping over a whole path,
+    every bounce runs as separate extend (intersect), shade (volume, sky and emission) and scatter (bounce)
+    dispatches over a queue of live paths. Scatter compacts the surviving paths into the other queue,
+    so finished paths stop costing threads and the dispatches stay coherent.
+    Writes the same accumulation as the fragment shader, sample for sample.
+    """
+    # Upper bound of pixels per batch, larger regions are traced in horizontal bands to cap the buffer sizes
+    max_pixels = 1 << 19
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self.ctx = tracer.ctx
+        # Compiled with the fragment shader's defines, trace picks the variant of each pass
+        self.pass_variants = {
+            name: ShaderVariants(
+                self.ctx.compute_shader, source=tracer.load_shader_source(f"shaders/wavefront/{name}.glsl")
+            )
+            for name in ("generate", "queue", "extend", "shade", "scatter", "accumulate")
+        }
+        self.passes = {}
+
+        self.capacity = 0
+        self.pixel_buffer = None
+        self.queues = []
+        self.hit_buffer = None
+        self.counters = self.ctx.buffer(reserve=4 * 5)
+
+    def reserve(self, pixels: int):
+        """Grows the pixel, queue and hit buffers to hold pixels paths."""
+        if pixels <= self.capacity:
+            return
+        for buffer in (self.pixel_buffer, self.hit_buffer, *self.queues):
+            if buffer is not None:
+                buffer.release()
+        self.capacity = pixels
+        self.pixel_buffer = self.ctx.buffer(reserve=pixels * PIXEL_SIZE)
+        self.queues = [self.ctx.buffer(reserve=pixels * PATH_SIZE) for _ in range(2)]
+        self.hit_buffer = self.ctx.buffer(reserve=pixels * HIT_SIZE)
+
+    def trace(self, uniforms: dict, region: tuple[int, int, int, int]):
+        """Traces an (x, y, width, height) region into the tracer's fbo, uniforms as from Tracer.update_uniforms."""
+        x, y, width, height = region
+        # The bounce loop runs here, a fixed count would only recompile the passes
+        defines = {name: value for name, value in self.tracer.shader_defines().items() if name != "MAX_BOUNCES"}
+        self.passes = {name: variants.get(defines) for name, variants in self.pass_variants.items()}
+        band = max(1, self.max_pixels // width)
+        for band_y in range(y, y + height, band):
+            self.trace_batch(uniforms, (x, band_y, width, min(band, y + height - band_y)))
+
+    def trace_batch(self, uniforms: dict, region: tuple[int, int, int, int]):
+        tracer = self.tracer
+        width, height = region[2:]
+        self.reserve(width * height)
+        uniforms = {**uniforms, "region": region}
+        for program in self.passes.values():
+            tracer.write_uniforms(program, uniforms)
+
+        # Written by extend for the first camera rays and by accumulate for converged pixels
+        accumulation, moments, normal_depth, albedo = tracer.fbo.color_attachments
+        normal_depth.bind_to_image(2, read=True, write=True)
+        albedo.bind_to_image(3, read=False, write=True)
+
+        self.pixel_buffer.bind_to_storage_buffer(4)
+        self.hit_buffer.bind_to_storage_buffer(7)
+        self.counters.bind_to_storage_buffer(8)
+        groups = ((width + 7) // 8, (height + 7) // 8)
+
+        for sample in range(tracer.rays_per_pixel):
+            self.counters.write(np.zeros(5, dtype=np.uint32))
+            # generate appends to OutQueue, the swap turns it into the InQueue of the first bounce
+            self.queues[1].bind_to_storage_buffer(6)
+            for program in self.passes.values():
+                if "sampleIndex" in program:
+                    program["sampleIndex"].value = sample
+            self.passes["generate"].run(*groups)
+            self.ctx.memory_barrier()
+
+            for bounce in range(tracer.max_bounce_limit + 1):
+                for name in ("shade", "scatter"):
+                    if "bounce" in self.passes[name]:
+                        self.passes[name]["bounce"].value = bounce
+                self.queues.reverse()
+                self.queues[0].bind_to_storage_buffer(5)
+                self.queues[1].bind_to_storage_buffer(6)
+                self.passes["queue"].run()
+                self.ctx.memory_barrier()
+
+                self.passes["extend"]["primaryRays"].value = sample == 0 and bounce == 0
+                self.passes["extend"].run_indirect(self.counters, offset=DISPATCH_OFFSET)
+                self.ctx.memory_barrier()
+                self.passes["shade"].run_indirect(self.counters, offset=DISPATCH_OFFSET)
+                self.ctx.memory_barrier()
+                self.passes["scatter"].run_indirect(self.counters, offset=DISPATCH_OFFSET)
+                self.ctx.memory_barrier()
+
+        accumulation.bind_to_image(0, read=False, write=True)
+        moments.bind_to_image(1, read=False, write=True)
+        self.passes["accumulate"].run(*groups)
+        self.ctx.memory_barrier()
+
+    def release(self):
+        for buffer in (self.pixel_buffer, self.hit_buffer, self.counters, *self.queues):
+            if buffer is not None:
+                buffer.release()
+        for variants in self.pass_variants.values():
+            variants.release()
@@ -0,0 +1,146 @@
+"""
+.world files, version 2: a 64 byte header followed by packed little endian arrays,
+
+    spheres   sphereCount x SPHERE_DTYPE (48 bytes, the layout of the sphere storage buffer)
+    nodes     nodeCount x NODE_DTYPE (32 bytes), the BVH, may be absent
+    indices   indexCount x int32, the BVH sphere indices
+
+so a world is memory mapped instead of parsed and its BVH doesn't need rebuilding on load.
+Version 1 files are pickled Sphere dataclasses, convert them with
+
+    python world.py convert "worlds/Old World.world" [output.world]
+"""
+import argparse
+import os
+import numpy as np
+
+from pathlib import Path
+from pickle import load
+from typing import NamedTuple
+
+from spheres import SPHERE_DTYPE, spheres_to_array
+from bvh import BVH, NODE_DTYPE
+
+
+WORLDS_DIR = Path(__file__).parent / "worlds"
+WORLD_MAGIC = b"SPHW"
+WORLD_VERSION = 2
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u4"),
+    ("sphereCount", "<u8"),
+    ("sphereSize", "<u4"),
+    ("skyboxLightStrength", "<f4"),
+    ("nodeCount", "<u8"),
+    ("indexCount", "<u8"),
+    ("reserved", "V24"),
+])
+assert HEADER_DTYPE.itemsize == 64
+
+
+class World(NamedTuple):
+    spheres: np.ndarray
+    skybox_light_strength: float
+    # (nodes, indices) of a stored BVH, None if the file has none
+    bvh: tuple[np.ndarray, np.ndarray] | None = None
+
+
+def world_path(filename: str) -> Path:
+    """Resolves a world name from the worlds folder, or a path to a .world file."""
+    path = Path(filename)
+    if path.suffix == ".world" and path.exists():
+        return path
+    return WORLDS_DIR / f"{filename}.world"
+
+
+def read_world(path: Path, allow_pickle: bool = False) -> World:
+    """
+    Reads a world file. The spheres are a copy on write memory map of the file, edits stay in memory.
+    Version 1 (pickle) files are only read with allow_pickle, unpickling can run arbitrary code.
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER_DTYPE.itemsize)
+
+    if len(header) < HEADER_DTYPE.itemsize or not header.startswith(WORLD_MAGIC):
+        if not allow_pickle:
+            raise ValueError(f"{path} is a version 1 (pickle) world, convert it with: python world.py convert \"{path}\"")
+        with open(path, "rb") as f:
+            spheres, skybox_light_strength = load(f)
+        return World(spheres_to_array(spheres), skybox_light_strength)
+
+    header = np.frombuffer(header, dtype=HEADER_DTYPE)[0]
+    if header["version"] != WORLD_VERSION or header["sphereSize"] != SPHERE_DTYPE.itemsize:
+        raise ValueError(f"{path} has unsupported world version {header['version']}")
+
+    sphere_count, node_count, index_count = (int(header[key]) for key in ("sphereCount", "nodeCount", "indexCount"))
+    offset = HEADER_DTYPE.itemsize
+    expected = offset + sphere_count * SPHERE_DTYPE.itemsize + node_count * NODE_DTYPE.itemsize + index_count * 4
+    if path.stat().st_size < expected:
+        raise ValueError(f"{path} is truncated")
+    # The BVH indexes every sphere once
+    if node_count and index_count != sphere_count:
+        raise ValueError(f"{path} has a BVH over {index_count} spheres but {sphere_count} spheres")
+
+    def mapped(dtype: np.dtype, count: int) -> np.ndarray:
+        nonlocal offset
+        array = np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=(count,)) if count else np.zeros(0, dtype)
+        offset += count * dtype.itemsize
+        return array
+
+    spheres = mapped(SPHERE_DTYPE, sphere_count)
+    nodes = mapped(NODE_DTYPE, node_count)
+    indices = mapped(np.dtype("<i4"), index_count)
+    bvh = (nodes, indices) if node_count else None
+    return World(spheres, float(header["skyboxLightStrength"]), bvh)
+
+
+def write_world(path: Path, spheres: np.ndarray, skybox_light_strength: float, bvh: BVH | None = None):
+    """
+    Writes SPHERE_DTYPE rows, the skybox light strength and optionally their BVH to a version 2 world file.
+    Nothing may still map the file at path, on Windows a mapped file can't be replaced. Copy the spheres
+    read_world mapped from it off the map first, e.g. with SphereTable.detach.
+    """
+    nodes = bvh.nodes if bvh is not None else np.zeros(0, dtype=NODE_DTYPE)
+    indices = bvh.indices if bvh is not None else np.zeros(0, dtype=np.int32)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = WORLD_MAGIC
+    header["version"] = WORLD_VERSION
+    header["sphereCount"] = len(spheres)
+    header["sphereSize"] = SPHERE_DTYPE.itemsize
+    header["skyboxLightStrength"] = skybox_light_strength
+    header["nodeCount"] = len(nodes)
+    header["indexCount"] = len(indices)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write next to the file and swap it in, so a failed write leaves the old file intact
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "wb") as f:
+        for array in (header, spheres, nodes, indices):
+            f.write(np.ascontiguousarray(array).data)
+    os.replace(temporary, path)
+
+
+def convert_world(source: Path, destination: Path | None = None):
+    """Converts a world file of any version to version 2, with a prebuilt BVH. Overwrites source by default."""
+    spheres, skybox_light_strength, _ = read_world(source, allow_pickle=True)
+    spheres = np.array(spheres)
+    bvh = BVH()
+    bvh.build(spheres)
+    write_world(Path(destination or source), spheres, skybox_light_strength, bvh)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="World file tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="Convert a world file to version 2")
+    convert_parser.add_argument("source")
+    convert_parser.add_argument("destination", nargs="?", default=None)
+    args = parser.parse_args(args)
+
+    convert_world(Path(args.source), args.destination and Path(args.destination))
+    print(f"Converted {args.source} to version {WORLD_VERSION}")
+
+
+if __name__ == "__main__":
+    main()